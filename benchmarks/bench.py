@@ -0,0 +1,223 @@
+"""
+bench.py - Synthetic load benchmark for GreenWave logic/storage hot paths
+Run: python benchmarks/bench.py [--sizes 1000 10000] [--backend pickle|sqlite]
+                                [--out results.json] [--compare baseline.json]
+
+For each dataset size a seeded generator fills an isolated temporary data
+directory (attendees, tickets, payments and a mix of confirmed and cancelled
+reservations), then each operation is timed call by call. Throughput and
+p50/p99 latency are printed and written as JSON; with --compare, operations
+whose p50 got slower than --tolerance are reported and the exit code is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import src.storage
+from src import logic, gateway
+from src.models import Attendee, Workshop, ExhibitionPass, AllAccessPass, Reservation, Payment
+
+EX_IDS = ("EX1", "EX2", "EX3")
+
+def open_backend(backend, data_dir):
+    if backend == "sqlite":
+        from src.sqlite_storage import SqliteStorage
+        return SqliteStorage(data_dir)
+    return src.storage.Storage(data_dir, compact_interval=None)
+
+def generate(storage, attendees, seed=42, workshops=None, allaccess_share=0.3,
+             reservations_per_ticket=2, cancel_share=0.1):
+    """Fill `storage` with a reproducible synthetic conference.
+
+    Every attendee owns one ticket (AllAccess for `allaccess_share` of them,
+    otherwise an ExhibitionPass) and its payment; each ticket books up to
+    `reservations_per_ticket` workshops, `cancel_share` of which are cancelled.
+    Returns the generated attendee ids.
+    """
+    rng = random.Random(seed)
+    workshops = workshops or max(10, attendees // 20)
+    start = datetime(2026, 6, 1, 9, 0)
+    ws_ids = []
+    with storage.transaction():
+        for i in range(workshops):
+            ex_id = EX_IDS[i % len(EX_IDS)]
+            ws = Workshop(f"BW{i:06d}", f"Bench workshop {i}", ex_id,
+                          capacity=rng.randint(20, 200), start_time=start + timedelta(hours=i))
+            storage.update_workshop(ws)
+            ws_ids.append(ws.ws_id)
+    by_ex = {ex: [w for w in ws_ids if storage.workshops[w].ex_id == ex] for ex in EX_IDS}
+    user_ids = []
+    chunk = 1000
+    for base in range(0, attendees, chunk):
+        with storage.transaction():
+            for i in range(base, min(base + chunk, attendees)):
+                att = Attendee(f"BU{i:08d}", f"Bench user {i}", f"bench{i}@example.com", "pw")
+                if rng.random() < allaccess_share:
+                    ticket = AllAccessPass(f"BT{i:08d}", att.user_id, price=150.0)
+                    choices = ws_ids
+                else:
+                    ex_id = rng.choice(EX_IDS)
+                    ticket = ExhibitionPass(f"BT{i:08d}", att.user_id, price=50.0, selected_ex_id=ex_id)
+                    choices = by_ex[ex_id]
+                payment = Payment(f"BP{i:08d}", ticket.ticket_id, ticket.price, rng.choice(("Card", "Cash")),
+                                  timestamp=start - timedelta(days=rng.randint(0, 30)))
+                att.tickets.append(ticket.ticket_id)
+                att.purchase_history.append(payment.pay_id)
+                for n in range(reservations_per_ticket):
+                    ws = storage.workshops[rng.choice(choices)]
+                    if ws.available_spots() <= 0:
+                        continue
+                    res = Reservation(f"BR{i:08d}{n}", ticket.ticket_id, ws.ws_id, att.user_id)
+                    if rng.random() < cancel_share:
+                        res.status = "CANCELLED"
+                    else:
+                        storage.touch("workshops", ws)
+                        ws.attendee_ids.add(res.res_id)
+                        storage.update_workshop(ws)
+                        att.reservations.append(res.res_id)
+                    storage.add_reservation(res)
+                storage.add_ticket(ticket)
+                storage.add_payment(payment)
+                storage.add_attendee(att)
+                user_ids.append(att.user_id)
+    return user_ids
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+def timed(fn, calls):
+    latencies = []
+    started = time.perf_counter()
+    for i in range(calls):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "calls": calls,
+        "ops_per_sec": calls / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+def run_size(backend, size, calls, seed):
+    data_dir = tempfile.mkdtemp(prefix="greenwave-bench-")
+    storage = open_backend(backend, data_dir)
+    previous = src.storage.__dict__.get("storage")
+    src.storage.storage = storage
+    try:
+        user_ids = generate(storage, size, seed=seed)
+        rng = random.Random(seed + 1)
+        results = {}
+        new_users = []
+        results["create_account"] = timed(
+            lambda i: new_users.append(logic.create_account(f"New {i}", f"new{i}@example.com", "pw").user_id), calls)
+        results["find_attendee_by_email"] = timed(
+            lambda i: storage.find_attendee_by_email(f"BENCH{rng.randrange(size)}@example.com"), calls)
+        tickets = []
+        results["purchase_ticket"] = timed(
+            lambda i: tickets.append(logic.purchase_ticket(new_users[i], "AllAccess")[0]), calls)
+        # a gateway taking 50 ms per call must not show up in purchase latency
+        pipeline = gateway.start_pipeline(gateway.FakeGateway(latency=0.05, seed=seed), concurrency=32)
+        try:
+            results["purchase_ticket_async"] = timed(
+                lambda i: logic.purchase_ticket(new_users[i], "AllAccess"), calls)
+            pipeline.wait_idle(60)
+        finally:
+            gateway.stop_pipeline(timeout=60)
+        # one delegation of 50 per call; should cost about 50 single purchases, not more
+        delegation = [(uid, "AllAccess") for uid in new_users[:50]]
+        results["purchase_tickets_bulk_50"] = timed(
+            lambda i: logic.purchase_tickets_bulk(delegation, group_payment=True), max(1, calls // 10))
+        # plenty of room so every reservation succeeds and cancels are real
+        roomy = Workshop("BWROOMY", "Bench roomy workshop", "EX1", capacity=calls * 2,
+                         start_time=datetime(2026, 6, 1, 9, 0))
+        storage.update_workshop(roomy)
+        reservations = []
+        results["reserve_workshop"] = timed(
+            lambda i: reservations.append(logic.reserve_workshop(new_users[i], tickets[i].ticket_id, roomy.ws_id)), calls)
+        results["cancel_reservation"] = timed(lambda i: logic.cancel_reservation(reservations[i].res_id), calls)
+        # one attendee booking back-to-back workshops; the conflict check should not grow with the itinerary
+        with storage.transaction():
+            for i in range(calls):
+                storage.update_workshop(Workshop(f"BWDAY{i:05d}", f"Bench back-to-back {i}", "EX1", capacity=5,
+                                                 start_time=datetime(2026, 7, 1, 9, 0) + timedelta(hours=i)))
+        busy = tickets[0]
+        results["reserve_busy_itinerary"] = timed(
+            lambda i: logic.reserve_workshop(busy.owner_id, busy.ticket_id, f"BWDAY{i:05d}"), calls)
+        results["daily_sales"] = timed(lambda i: storage.daily_sales(), calls)
+        # "EX2 workshops in a one-day window with >= 5 seats whose title has a word starting with 1"
+        day = datetime(2026, 6, 1, 9, 0)
+        results["catalog_search"] = timed(
+            lambda i: storage.catalog.search(text="1", ex_id="EX2", min_free=5,
+                                             starts_after=day + timedelta(days=i % 30),
+                                             starts_before=day + timedelta(days=i % 30 + 1)), calls)
+        storage.flush()
+        return results
+    finally:
+        storage.close()
+        if previous is None:
+            del src.storage.storage
+        else:
+            src.storage.storage = previous
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+def compare(current, baseline, tolerance):
+    """Return (size, op, old p50, new p50) for operations slower than baseline by > tolerance."""
+    old = {(r["size"], r["op"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        before = old.get((r["size"], r["op"]))
+        if before and r["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            regressions.append((r["size"], r["op"], before["p50_ms"], r["p50_ms"]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--calls", type=int, default=200, help="timed calls per operation")
+    parser.add_argument("--backend", choices=("pickle", "sqlite"), default="pickle")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {"backend": args.backend, "calls": args.calls, "seed": args.seed,
+                 "python": platform.python_version(), "when": datetime.now().isoformat(timespec="seconds")},
+        "results": [],
+    }
+    print(f"{'size':>8} {'operation':<24} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for size in args.sizes:
+        for op, r in run_size(args.backend, size, args.calls, args.seed).items():
+            report["results"].append(dict(r, size=size, op=op))
+            print(f"{size:>8} {op:<24} {r['ops_per_sec']:>10.0f} {r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f}")
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for size, op, before, after in regressions:
+            print(f"REGRESSION {op} @ {size}: p50 {before:.3f} ms -> {after:.3f} ms")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
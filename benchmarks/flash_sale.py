@@ -0,0 +1,151 @@
+"""
+flash_sale.py - Replay harness for a registration rush
+Run: python benchmarks/flash_sale.py [--buyers 2000] [--rate 0] [--mode both]
+                                     [--workers 4] [--batch 20] [--capacity 1000]
+
+Thousands of attendees try to buy an AllAccess ticket at once (--rate 0, a
+burst) or arriving at a Poisson rate of --rate buyers per second. In "direct"
+mode each buyer calls logic.purchase_ticket from its own client thread, as the
+GUI does without a sale open; in "queue" mode they go through an
+admission.SaleQueue. Reported: sustained purchases per second, latency from
+arrival to answer (p50/p99/max) and how many buyers were turned away.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import src.storage
+from src import logic
+from src.admission import SaleQueue, QueueFull
+from src.models import Attendee
+from bench import open_backend, percentile
+
+def buyers(storage, count):
+    with storage.transaction():
+        for i in range(count):
+            storage.add_attendee(Attendee(f"FS{i:08d}", f"Flash buyer {i}", f"flash{i}@example.com", "pw"))
+    return [f"FS{i:08d}" for i in range(count)]
+
+def arrivals(count, rate, seed):
+    # offsets in seconds from the start of the sale
+    if not rate:
+        return [0.0] * count
+    rng = random.Random(seed)
+    at, times = 0.0, []
+    for _ in range(count):
+        at += rng.expovariate(rate)
+        times.append(at)
+    return times
+
+def wait_until(moment):
+    delay = moment - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+def run_direct(user_ids, offsets, clients):
+    latencies, errors = [], []
+    pending = list(zip(user_ids, offsets))
+    pending.reverse()
+    lock = threading.Lock()
+    start = time.perf_counter() + 0.05
+
+    def client():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                uid, offset = pending.pop()
+            arrived = start + offset
+            wait_until(arrived)
+            try:
+                logic.purchase_ticket(uid, "AllAccess")
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                continue
+            finished = time.perf_counter()
+            with lock:
+                latencies.append(finished - arrived)
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, len(errors), 0, time.perf_counter() - start
+
+def run_queue(user_ids, offsets, workers, batch, capacity):
+    sale = SaleQueue(capacity=capacity, workers=workers, batch_size=batch)
+    admitted, shed = [], 0
+    start = time.perf_counter() + 0.05
+    try:
+        for uid, offset in zip(user_ids, offsets):
+            arrived = start + offset
+            wait_until(arrived)
+            try:
+                admitted.append((arrived, sale.purchase(uid, "AllAccess")))
+            except QueueFull:
+                shed += 1
+        latencies, errors = [], 0
+        for arrived, handle in admitted:
+            try:
+                handle.result()
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(handle.finished_at - arrived)
+        return latencies, errors, shed, time.perf_counter() - start
+    finally:
+        sale.close()
+
+def run_mode(mode, args):
+    data_dir = tempfile.mkdtemp(prefix="greenwave-flash-")
+    storage = open_backend(args.backend, data_dir)
+    previous = src.storage.__dict__.get("storage")
+    src.storage.storage = storage
+    try:
+        user_ids = buyers(storage, args.buyers)
+        offsets = arrivals(args.buyers, args.rate, args.seed)
+        if mode == "direct":
+            return run_direct(user_ids, offsets, args.clients)
+        return run_queue(user_ids, offsets, args.workers, args.batch, args.capacity)
+    finally:
+        storage.close()
+        if previous is None:
+            del src.storage.storage
+        else:
+            src.storage.storage = previous
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--buyers", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=0, help="arrivals per second (0 = everyone at once)")
+    parser.add_argument("--mode", choices=("direct", "queue", "both"), default="both")
+    parser.add_argument("--clients", type=int, default=64, help="client threads in direct mode")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--capacity", type=int, default=1000)
+    parser.add_argument("--backend", choices=("pickle", "sqlite"), default="pickle")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    modes = ("direct", "queue") if args.mode == "both" else (args.mode,)
+    print(f"{'mode':<8} {'served':>7} {'shed':>6} {'errors':>6} {'buys/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for mode in modes:
+        latencies, errors, shed, elapsed = run_mode(mode, args)
+        latencies.sort()
+        rate = len(latencies) / elapsed if elapsed > 0 else 0.0
+        print(f"{mode:<8} {len(latencies):>7} {shed:>6} {errors:>6} {rate:>9.0f} "
+              f"{percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} "
+              f"{(latencies[-1] if latencies else 0.0) * 1000:>9.1f}")
+
+if __name__ == "__main__":
+    main()
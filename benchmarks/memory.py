@@ -0,0 +1,85 @@
+"""
+memory.py - Memory and file-size benchmark for GreenWave models
+Run: python benchmarks/memory.py [--count 100000]
+
+Builds `count` tickets and payments twice: with plain __dict__ classes shaped
+like the original models and with the slotted models from src/models.py. It
+reports resident bytes (tracemalloc) and snapshot size, both as the old
+{key: object} pickle and as the compact codec encoding, scaled to one million.
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import tracemalloc
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.models import ExhibitionPass, Payment
+from src.codec import encode_table
+
+class LegacyTicket:
+    def __init__(self, ticket_id, owner_id, price, ex_id):
+        self.ticket_id = ticket_id
+        self.owner_id = owner_id
+        self.price = price
+        self.access_exhibitions = [ex_id]
+        self.type = "ExhibitionPass"
+        self.selected_ex_id = ex_id
+
+class LegacyPayment:
+    def __init__(self, pay_id, ticket_id, amount, method, timestamp):
+        self.pay_id = pay_id
+        self.ticket_id = ticket_id
+        self.amount = amount
+        self.method = method
+        self.timestamp = timestamp
+
+def build(count, ticket_cls, payment_cls):
+    tickets, payments = {}, {}
+    now = datetime.now()
+    for i in range(count):
+        tid = "T" + uuid.uuid4().hex[:8]
+        pid = "P" + uuid.uuid4().hex[:8]
+        # ex ids and methods arrive as fresh strings (e.g. from a form), not literals
+        ex_id = "".join(["EX", str(i % 3 + 1)])
+        method = "".join(["Ca", "rd"])
+        tickets[tid] = ticket_cls(tid, "U" + uuid.uuid4().hex[:8], 50.0, ex_id)
+        payments[pid] = payment_cls(pid, tid, 50.0, method, now)
+    return tickets, payments
+
+def measure(count, ticket_cls, payment_cls):
+    tracemalloc.start()
+    tickets, payments = build(count, ticket_cls, payment_cls)
+    resident = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return tickets, payments, resident
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000, help="tickets (and payments) to build")
+    args = parser.parse_args(argv)
+    scale = 1_000_000 / args.count
+
+    legacy_t, legacy_p, legacy_mem = measure(args.count, LegacyTicket, LegacyPayment)
+    legacy_file = len(pickle.dumps(legacy_t)) + len(pickle.dumps(legacy_p))
+    del legacy_t, legacy_p
+
+    slot_t, slot_p, slot_mem = measure(args.count, ExhibitionPass, Payment)
+    pickled_file = len(pickle.dumps(slot_t)) + len(pickle.dumps(slot_p))
+    compact_file = len(pickle.dumps(encode_table(slot_t))) + len(pickle.dumps(encode_table(slot_p)))
+
+    def mb(n):
+        return f"{n * scale / 1e6:8.1f} MB"
+    print(f"per 1M tickets + 1M payments (measured with {args.count})")
+    print(f"  resident, __dict__ models : {mb(legacy_mem)}")
+    print(f"  resident, slotted models  : {mb(slot_mem)}  ({slot_mem / legacy_mem:.0%})")
+    print(f"  file, legacy pickle       : {mb(legacy_file)}")
+    print(f"  file, slotted pickle      : {mb(pickled_file)}")
+    print(f"  file, compact encoding    : {mb(compact_file)}  ({compact_file / legacy_file:.0%})")
+
+if __name__ == "__main__":
+    main()
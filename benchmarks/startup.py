@@ -0,0 +1,82 @@
+"""
+startup.py - Cold-start benchmark for GreenWave
+Run: python benchmarks/startup.py [--sizes 0 10000 100000]
+
+For each dataset size a data directory is generated and a fresh interpreter
+times `import src.logic`, opening the storage singleton, a first login lookup
+(loads attendees) and a first daily_sales call (loads payments). The import
+column should stay flat as the data grows.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from src.models import Attendee, AllAccessPass, Payment
+from src.storage import Storage, save_table
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import src.logic
+t1 = time.perf_counter()
+from src import storage
+s = storage.storage
+t2 = time.perf_counter()
+s.find_attendee_by_email("user0@example.com")
+t3 = time.perf_counter()
+s.daily_sales()
+t4 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "open": t2 - t1, "first_login": t3 - t2, "daily_sales": t4 - t3}))
+"""
+
+def build_data_dir(path, size):
+    Storage(path, compact_interval=None).close()  # seeds workshops and exhibitions
+    attendees, tickets, payments = {}, {}, {}
+    now = datetime.now()
+    for i in range(size):
+        att = Attendee(f"U{i:08d}", f"User {i}", f"user{i}@example.com", "pw")
+        ticket = AllAccessPass(f"T{i:08d}", att.user_id, price=150.0)
+        payment = Payment(f"P{i:08d}", ticket.ticket_id, ticket.price, "Card", timestamp=now)
+        att.tickets.append(ticket.ticket_id)
+        att.purchase_history.append(payment.pay_id)
+        attendees[att.user_id] = att
+        tickets[ticket.ticket_id] = ticket
+        payments[payment.pay_id] = payment
+    save_table(os.path.join(path, "attendees.pkl"), attendees)
+    save_table(os.path.join(path, "tickets.pkl"), tickets)
+    save_table(os.path.join(path, "payments.pkl"), payments)
+
+def probe(data_dir):
+    env = dict(os.environ, GREENWAVE_DATA_DIR=data_dir)
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env,
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3, help="probes per size (best is reported)")
+    args = parser.parse_args(argv)
+    print(f"{'attendees':>10} {'import ms':>10} {'open ms':>10} {'login ms':>10} {'sales ms':>10}")
+    for size in args.sizes:
+        data_dir = tempfile.mkdtemp(prefix="greenwave-bench-")
+        try:
+            build_data_dir(data_dir, size)
+            runs = [probe(data_dir) for _ in range(args.repeat)]
+            best = {k: min(r[k] for r in runs) * 1000 for k in runs[0]}
+            print(f"{size:>10} {best['import']:>10.1f} {best['open']:>10.1f} "
+                  f"{best['first_login']:>10.1f} {best['daily_sales']:>10.1f}")
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+admission.py - Flash-sale admission queue for ticket purchases and workshop bookings
+
+While a sale is open, purchases and reservations are queued instead of all
+hitting storage at once. Requests are served first come first served by a
+fixed pool of workers, several at a time in one commit; an attendee can have
+one request waiting, and when the queue is full new requests are turned
+away (QueueFull) instead of slowing everyone down.
+"""
+
+import threading
+import time
+from collections import deque
+from itertools import count
+from . import storage
+from . import logic
+
+class QueueFull(OverflowError):
+    """The sale queue is at capacity; try again later."""
+
+class Admission:
+    """Handle for one queued request: its place in line and, later, its result."""
+
+    def __init__(self, seq, attendee_id, request, queue):
+        self.seq = seq
+        self.attendee_id = attendee_id
+        self.request = request  # (operation name, args)
+        self.queue = queue
+        self.submitted_at = time.perf_counter()
+        self.finished_at = None
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    def position(self):
+        """1-based place in line, 0 once a worker has picked it up."""
+        return self.queue.position(self)
+
+    def eta(self):
+        """Estimated seconds until the request is served, or None before the rate is known."""
+        return self.queue.eta(self)
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """The operation's return value; re-raises its exception."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("request still queued")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def _finish(self, result=None, error=None):
+        self._result, self._error = result, error
+        self.finished_at = time.perf_counter()
+        self._done.set()
+
+OPERATIONS = {
+    "purchase": lambda attendee_id, ticket_type, selected_ex_ids=None:
+        logic.purchase_ticket(attendee_id, ticket_type, selected_ex_ids),
+    "reserve": lambda attendee_id, ticket_id, ws_id: logic.reserve_workshop(attendee_id, ticket_id, ws_id),
+}
+
+class SaleQueue:
+    """Bounded FIFO of purchase/reservation requests drained by `workers` threads.
+
+    Each worker takes up to `batch_size` requests and runs them in one
+    transaction, holding the seat locks of every workshop involved. Each
+    request runs in its own savepoint, so one that fails (a full workshop,
+    say) is undone on its own and the rest of the batch still commits.
+    """
+
+    def __init__(self, capacity=1000, workers=4, batch_size=20):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.stats = {"admitted": 0, "shed": 0, "deduplicated": 0, "served": 0, "failed": 0, "batches": 0}
+        self._queue = deque()
+        self._by_attendee = {}  # attendee_id -> Admission waiting or being served
+        self._seq = count(1)
+        self._taken = 0         # seq of the last request handed to a worker
+        self._rate = None       # requests served per second, smoothed
+        self._done_at = None    # when the last batch (by any worker) finished
+        self._cond = threading.Condition()
+        self._closed = False
+        self._workers = [threading.Thread(target=self._work, name=f"greenwave-sale-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._workers:
+            t.start()
+
+    # front door
+    def submit(self, operation, attendee_id, *args):
+        """Queue `operation` ("purchase" or "reserve") for an attendee; returns its Admission.
+
+        Repeating a request that is still waiting returns the same Admission;
+        a different request from the same attendee raises ValueError.
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+        request = (operation, args)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The sale is closed.")
+            current = self._by_attendee.get(attendee_id)
+            if current is not None:
+                if current.request == request:
+                    self.stats["deduplicated"] += 1
+                    return current
+                raise ValueError("You already have a request in the queue.")
+            if len(self._queue) >= self.capacity:
+                self.stats["shed"] += 1
+                raise QueueFull(f"The sale queue is full ({self.capacity} waiting). Please try again shortly.")
+            admission = Admission(next(self._seq), attendee_id, request, self)
+            self._queue.append(admission)
+            self._by_attendee[attendee_id] = admission
+            self.stats["admitted"] += 1
+            self._cond.notify()
+            return admission
+
+    def purchase(self, attendee_id, ticket_type, selected_ex_ids=None):
+        return self.submit("purchase", attendee_id, ticket_type, selected_ex_ids)
+
+    def reserve(self, attendee_id, ticket_id, ws_id):
+        return self.submit("reserve", attendee_id, ticket_id, ws_id)
+
+    def position(self, admission):
+        # sequence numbers are handed out and served in order, so no scan is needed
+        with self._cond:
+            if admission.seq <= self._taken:
+                return 0
+            return admission.seq - self._taken
+
+    def eta(self, admission):
+        position = self.position(admission)
+        rate = self._rate
+        if position == 0:
+            return 0.0
+        return position / rate if rate else None
+
+    def __len__(self):
+        return len(self._queue)
+
+    def close(self, timeout=None):
+        """Stop taking requests, serve the ones already queued and stop the workers."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._workers:
+            t.join(timeout)
+
+    # workers
+    def _take(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            if batch:
+                self._taken = batch[-1].seq
+            return batch
+
+    def _work(self):
+        while True:
+            batch = self._take()
+            if not batch:
+                return  # closed and drained
+            started = time.perf_counter()
+            outcomes = self._serve(batch)
+            with self._cond:
+                # free the attendees' slots before anyone hears back, so they can queue again
+                for admission in batch:
+                    del self._by_attendee[admission.attendee_id]
+                failed = sum(1 for _, error in outcomes if error is not None)
+                self.stats["served"] += len(batch) - failed
+                self.stats["failed"] += failed
+                self.stats["batches"] += 1
+                # observed throughput: this batch over the wall-clock time since the previous
+                # completion, so concurrent workers count only as far as they actually overlap
+                now = time.perf_counter()
+                elapsed = now - (started if self._done_at is None else max(self._done_at, started))
+                self._done_at = now
+                if elapsed > 0:
+                    rate = len(batch) / elapsed
+                    self._rate = rate if self._rate is None else 0.8 * self._rate + 0.2 * rate
+            for admission, (result, error) in zip(batch, outcomes):
+                admission._finish(result, error)
+
+    def _serve(self, batch):
+        # returns (result, error) per request
+        store = storage.storage
+        ws_ids = [args[1] for operation, args in (a.request for a in batch) if operation == "reserve"]
+        try:
+            with store.seats.holding_all(ws_ids), store.transaction():
+                outcomes = []
+                for admission in batch:
+                    operation, args = admission.request
+                    try:
+                        with store.savepoint():
+                            outcomes.append((OPERATIONS[operation](admission.attendee_id, *args), None))
+                    except Exception as e:
+                        outcomes.append((None, e))
+        except Exception as e:
+            return [(None, e)] * len(batch)  # the commit itself failed
+        return outcomes
+
+sale = None  # the open SaleQueue; without one, purchases go straight to logic
+
+def open_sale(**options):
+    """Start routing GUI purchases and reservations through a SaleQueue."""
+    global sale
+    if sale is None:
+        sale = SaleQueue(**options)
+    return sale
+
+def close_sale(timeout=None):
+    global sale
+    if sale is not None:
+        running, sale = sale, None
+        running.close(timeout)
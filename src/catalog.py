@@ -0,0 +1,158 @@
+"""
+catalog.py - Indexed workshop search by exhibition, start time, free seats and title words
+"""
+
+import re
+import threading
+from bisect import bisect_left, insort
+
+TOKEN = re.compile(r"\w+")
+
+def tokens(text):
+    return set(TOKEN.findall((text or "").casefold()))
+
+def _remove_sorted(items, item):
+    i = bisect_left(items, item)
+    if i < len(items) and items[i] == item:
+        del items[i]
+
+class Catalog:
+    """Secondary indexes over `storage.workshops` for catalog queries.
+
+    Kept per workshop: start time (sorted list), exhibition (id -> set),
+    title words (inverted index plus a sorted vocabulary for prefix matches)
+    and free seats (sorted list). A query starts from whichever condition
+    matches the fewest workshops and checks the others per candidate, so it
+    never walks the whole collection. The indexes are built on the first
+    query and then follow every stored workshop write, which includes the
+    seat changes made by reservations and cancellations.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._built = False
+
+    def _build(self):
+        self._entries = {}   # ws_id -> (start_time, ex_id, title tokens, free seats)
+        self._by_start = []  # sorted (start_time, ws_id); workshops without a start are left out
+        self._by_ex = {}     # ex_id -> set of ws_ids
+        self._by_token = {}  # word -> set of ws_ids
+        self._vocab = []     # sorted words, for prefix search
+        self._by_free = []   # sorted (free seats, ws_id)
+        for ws in self.store.workshops.values():
+            self._add(ws)
+        self._built = True
+
+    def _add(self, ws):
+        entry = (ws.start_time, ws.ex_id, frozenset(tokens(ws.title)), ws.available_spots())
+        self._entries[ws.ws_id] = entry
+        start, ex_id, words, free = entry
+        if start is not None:
+            insort(self._by_start, (start, ws.ws_id))
+        self._by_ex.setdefault(ex_id, set()).add(ws.ws_id)
+        for word in words:
+            holders = self._by_token.get(word)
+            if holders is None:
+                holders = self._by_token[word] = set()
+                insort(self._vocab, word)
+            holders.add(ws.ws_id)
+        insort(self._by_free, (free, ws.ws_id))
+
+    def _remove(self, ws_id):
+        start, ex_id, words, free = self._entries.pop(ws_id)
+        if start is not None:
+            _remove_sorted(self._by_start, (start, ws_id))
+        self._by_ex[ex_id].discard(ws_id)
+        for word in words:
+            holders = self._by_token[word]
+            holders.discard(ws_id)
+            if not holders:
+                del self._by_token[word]
+                _remove_sorted(self._vocab, word)
+        _remove_sorted(self._by_free, (free, ws_id))
+
+    def update(self, ws_id, ws):
+        """Re-index one workshop after it was stored (`ws`) or removed (None)."""
+        with self._lock:
+            if not self._built:
+                return
+            old = self._entries.get(ws_id)
+            if ws is not None and old is not None and old[:3] == (ws.start_time, ws.ex_id, frozenset(tokens(ws.title))):
+                # the common case, a seat claimed or released: only the free-seat index moves
+                free = ws.available_spots()
+                if free != old[3]:
+                    _remove_sorted(self._by_free, (old[3], ws_id))
+                    insort(self._by_free, (free, ws_id))
+                    self._entries[ws_id] = old[:3] + (free,)
+                return
+            if old is not None:
+                self._remove(ws_id)
+            if ws is not None:
+                self._add(ws)
+
+    def forget(self):
+        """Drop the indexes; they are rebuilt from storage on the next query."""
+        with self._lock:
+            self._built = False
+
+    def _prefix_matches(self, word):
+        # ws_ids with a title word starting with `word`
+        found = set()
+        i = bisect_left(self._vocab, word)
+        while i < len(self._vocab) and self._vocab[i].startswith(word):
+            found |= self._by_token[self._vocab[i]]
+            i += 1
+        return found
+
+    def match(self, text=None, ex_id=None, starts_after=None, starts_before=None, min_free=0):
+        """Ids of matching workshops ordered by start time.
+
+        `text` words must each start a word of the title (case-insensitive);
+        the time window is `starts_after` <= start_time < `starts_before`.
+        """
+        with self._lock:
+            if not self._built:
+                self._build()
+            words = sorted(tokens(text))
+            # every condition as (candidate count, candidates, check per index entry);
+            # range conditions are kept as slice bounds until chosen to drive the query
+            plans = []
+            if ex_id is not None:
+                ids = self._by_ex.get(ex_id, ())
+                plans.append((len(ids), ids, lambda e: e[1] == ex_id))
+            if starts_after is not None or starts_before is not None:
+                lo = bisect_left(self._by_start, (starts_after,)) if starts_after is not None else 0
+                hi = bisect_left(self._by_start, (starts_before,)) if starts_before is not None else len(self._by_start)
+                plans.append((max(0, hi - lo), (self._by_start, lo, hi), lambda e: e[0] is not None
+                              and (starts_after is None or e[0] >= starts_after)
+                              and (starts_before is None or e[0] < starts_before)))
+            for word in words:
+                ids = self._prefix_matches(word)
+                plans.append((len(ids), ids, lambda e, w=word: any(t.startswith(w) for t in e[2])))
+            if min_free > 0:
+                lo = bisect_left(self._by_free, (min_free,))
+                plans.append((len(self._by_free) - lo, (self._by_free, lo, len(self._by_free)),
+                              lambda e: e[3] >= min_free))
+            if plans:
+                plans.sort(key=lambda p: p[0])
+                candidates = plans[0][1]
+                if isinstance(candidates, tuple):
+                    items, lo, hi = candidates
+                    candidates = (ws_id for _, ws_id in items[lo:hi])
+                checks = [check for _, _, check in plans[1:]]
+                found = [ws_id for ws_id in candidates if all(check(self._entries[ws_id]) for check in checks)]
+                found.sort(key=self._sort_key)
+                return found
+            return [ws_id for _, ws_id in self._by_start] + sorted(
+                ws_id for ws_id, e in self._entries.items() if e[0] is None)
+
+    def _sort_key(self, ws_id):
+        start = self._entries[ws_id][0]
+        return (start is None, start or 0, ws_id)
+
+    def search(self, page=0, size=50, **query):
+        """(total matches, workshops on page `page`) for the `match` conditions in `query`."""
+        ids = self.match(**query)
+        workshops = self.store.workshops
+        return len(ids), [workshops[ws_id] for ws_id in ids[page * size:(page + 1) * size]]
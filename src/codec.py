@@ -0,0 +1,88 @@
+"""
+codec.py - Compact, versioned on-disk encoding of GreenWave models
+
+A model is written as a flat tuple: a one-letter type code followed by its
+field values in slot order. Timestamps become integer microseconds, sets
+become sorted lists and repeated strings (ex_ids, ticket types, payment
+methods, statuses) are interned, so pickle stores each of them once per file.
+"""
+
+import sys
+from datetime import datetime, timedelta
+from .models import (Attendee, Admin, Exhibition, Workshop, Ticket, ExhibitionPass,
+                     AllAccessPass, Reservation, Payment)
+
+SCHEMA_VERSION = 7  # 2: Payment.ex_id, 3: Payment.ticket_ids, 4: Reservation.priority/queued_at, 5: Workshop.duration,
+                    # 6: Payment.status/auth_ref, 7: Payment.covers
+MAGIC = "greenwave"
+
+CODES = {
+    Attendee: "A",
+    Admin: "M",
+    Exhibition: "X",
+    Workshop: "W",
+    Ticket: "T",
+    ExhibitionPass: "E",
+    AllAccessPass: "F",
+    Reservation: "R",
+    Payment: "P",
+}
+TYPES = {code: cls for cls, code in CODES.items()}
+
+TIME_FIELDS = frozenset(("timestamp", "start_time", "queued_at"))
+SET_FIELDS = frozenset(("attendee_ids",))
+INTERNED_FIELDS = frozenset(("ex_id", "selected_ex_id", "type", "method", "status"))
+INTERNED_LISTS = frozenset(("access_exhibitions",))
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+def encode(obj):
+    cls = type(obj)
+    row = [CODES[cls]]
+    for name in cls.fields():
+        value = getattr(obj, name)
+        if name in TIME_FIELDS and value is not None:
+            value = (value - EPOCH) // MICROSECOND
+        elif name in SET_FIELDS:
+            value = sorted(value)
+        row.append(value)
+    return tuple(row)
+
+def decode(row):
+    """Rebuild a model from `encode` output; model instances from older files pass through."""
+    if not isinstance(row, tuple):
+        return row
+    cls = TYPES[row[0]]
+    obj = cls.__new__(cls)
+    # rows written before a field existed are shorter; those fields take their default
+    for name, value in cls.DEFAULTS.items():
+        setattr(obj, name, value)
+    for name, value in zip(cls.fields(), row[1:]):
+        if name in TIME_FIELDS and value is not None:
+            value = EPOCH + value * MICROSECOND
+        elif name in SET_FIELDS:
+            value = set(value)
+        elif name in INTERNED_FIELDS and isinstance(value, str):
+            value = sys.intern(value)
+        elif name in INTERNED_LISTS:
+            value = [sys.intern(v) for v in value]
+        setattr(obj, name, value)
+    return obj
+
+def encode_table(table):
+    """Snapshot payload for one collection: (MAGIC, version, rows)."""
+    return (MAGIC, SCHEMA_VERSION, [encode(obj) for obj in table.values()])
+
+def decode_table(payload, key_attr):
+    """Inverse of encode_table; also accepts the older {key: object} pickles."""
+    if isinstance(payload, dict):
+        return payload
+    magic, version, rows = payload
+    if magic != MAGIC or version > SCHEMA_VERSION:
+        raise ValueError(f"Unsupported snapshot format {magic!r} v{version}")
+    table = {}
+    for row in rows:
+        obj = decode(row)
+        table[getattr(obj, key_attr)] = obj
+    return table
@@ -0,0 +1,117 @@
+"""
+events.py - Change notifications published by GreenWave storage
+"""
+
+import threading
+
+class Event:
+    """Something changed in `collection`; `obj` is the stored object after the change."""
+    __slots__ = ("key", "obj")
+    collection = None
+
+    def __init__(self, key, obj):
+        self.key = key
+        self.obj = obj
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.key!r})"
+
+class AttendeeChanged(Event):
+    __slots__ = ()
+    collection = "attendees"
+
+class TicketAdded(Event):
+    __slots__ = ()
+    collection = "tickets"
+
+class TicketChanged(Event):
+    __slots__ = ()
+    collection = "tickets"
+
+class ReservationCreated(Event):
+    __slots__ = ()
+    collection = "reservations"
+
+class ReservationCancelled(Event):
+    __slots__ = ()
+    collection = "reservations"
+
+class ReservationPromoted(Event):
+    """A waitlisted reservation got a seat."""
+    __slots__ = ()
+    collection = "reservations"
+
+class WorkshopSeatsChanged(Event):
+    __slots__ = ()
+    collection = "workshops"
+
+class PaymentRecorded(Event):
+    __slots__ = ()
+    collection = "payments"
+
+class PaymentStatusChanged(Event):
+    """A payment moved through the gateway pipeline (see gateway.py)."""
+    __slots__ = ()
+    collection = "payments"
+
+def change_event(collection, key, obj, before=None, new=False):
+    """Event for a committed write of `obj`, or None if nothing subscribers care about changed.
+
+    `before` is the object's state before the transaction when it is known;
+    `new` says the key did not exist yet.
+    """
+    if collection == "attendees":
+        return AttendeeChanged(key, obj)
+    if collection == "tickets":
+        return TicketAdded(key, obj) if new else TicketChanged(key, obj)
+    if collection == "reservations":
+        if obj.status == "CANCELLED" and (before is None or before.status != "CANCELLED"):
+            return ReservationCancelled(key, obj)
+        if new:
+            return ReservationCreated(key, obj)
+        if obj.status == "CONFIRMED" and obj.queued_at is not None and (before is None or before.status != "CONFIRMED"):
+            return ReservationPromoted(key, obj)
+        return None
+    if collection == "workshops":
+        if new or before is None or before.capacity != obj.capacity or before.attendee_ids != obj.attendee_ids:
+            return WorkshopSeatsChanged(key, obj)
+        return None
+    if collection == "payments":
+        if new:
+            return PaymentRecorded(key, obj)
+        if before is None or before.status != obj.status:
+            return PaymentStatusChanged(key, obj)
+        return None
+    return None
+
+class EventBus:
+    """Synchronous publish/subscribe for storage events.
+
+    Handlers run on the thread that committed the change, after the commit;
+    GUI code should hand events over to its own thread (see gui.py).
+    """
+
+    def __init__(self):
+        self._handlers = []  # (event type or tuple of types, handler)
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return bool(self._handlers)
+
+    def subscribe(self, types, handler):
+        """Call `handler(event)` for events that are instances of `types`; returns an unsubscribe function."""
+        entry = (types, handler)
+        with self._lock:
+            self._handlers = self._handlers + [entry]
+        def unsubscribe():
+            with self._lock:
+                self._handlers = [h for h in self._handlers if h is not entry]
+        return unsubscribe
+
+    def publish(self, events):
+        handlers = self._handlers  # replaced, never mutated, so no lock needed to read
+        for event in events:
+            for types, handler in handlers:
+                if isinstance(event, types):
+                    handler(event)
@@ -0,0 +1,176 @@
+"""
+export.py - Streaming CSV/JSONL exports of payments, tickets and reservations
+Run: python -m src.export {payments,tickets,reservations} OUT [--format csv|jsonl]
+                          [--since DATE] [--until DATE] [--exhibition EX] [--status STATUS]
+                          [--resume] [--data-dir DIR] [--backend pickle|sqlite]
+
+Rows are produced one at a time from the collections and written straight to
+the output file; attendee, ticket and workshop names are joined by primary
+key lookups, so memory does not grow with the size of the export. Every
+CHECKPOINT_EVERY rows the key of the last written row is saved next to the
+output (OUT.cursor); `--resume` continues an interrupted export from there.
+No Tkinter import is needed.
+"""
+
+import argparse
+import csv
+import json
+import os
+from datetime import date, datetime, time as day_time
+from . import storage
+
+CHECKPOINT_EVERY = 1000  # rows between cursor saves
+
+COLUMNS = {
+    "payments": ("pay_id", "timestamp", "amount", "method", "ticket_id", "ticket_type",
+                 "attendee_id", "attendee_name", "attendee_email", "ex_id", "status"),
+    "tickets": ("ticket_id", "type", "price", "access_exhibitions", "owner_id", "owner_name", "owner_email"),
+    "reservations": ("res_id", "status", "ws_id", "workshop_title", "ex_id", "start_time",
+                     "ticket_id", "attendee_id", "attendee_name", "attendee_email"),
+}
+
+def _bound(value, end=False):
+    # dates mean the whole day; strings are ISO dates or datetimes
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value) if "T" in value or " " in value else date.fromisoformat(value)
+        if isinstance(value, datetime):
+            return value
+    return datetime.combine(value, day_time.max if end else day_time.min)
+
+def _covers(ticket, ex_id):
+    return ticket is not None and ("ALL" in ticket.access_exhibitions or ex_id in ticket.access_exhibitions)
+
+def _person(att):
+    return (att.name, att.email) if att is not None else (None, None)
+
+def _payments(store, since, until, ex_id, status):
+    for key, p in store.payments.items():
+        if since is not None and p.timestamp < since or until is not None and p.timestamp > until:
+            continue
+        ticket = store.tickets.get(p.ticket_id)
+        if ex_id is not None and p.ex_id != ex_id and (p.ex_id is not None or not _covers(ticket, ex_id)):
+            continue
+        owner_id = ticket.owner_id if ticket is not None else None
+        name, email = _person(store.attendees.get(owner_id) if owner_id else None)
+        yield key, (p.pay_id, p.timestamp.isoformat(), p.amount, p.method, p.ticket_id,
+                    ticket.type if ticket is not None else None, owner_id, name, email, p.ex_id, p.status)
+
+def _tickets(store, since, until, ex_id, status):
+    for key, t in store.tickets.items():
+        if ex_id is not None and not _covers(t, ex_id):
+            continue
+        name, email = _person(store.attendees.get(t.owner_id))
+        yield key, (t.ticket_id, t.type, t.price, ";".join(t.access_exhibitions), t.owner_id, name, email)
+
+def _reservations(store, since, until, ex_id, status):
+    for key, r in store.reservations.items():
+        if status is not None and r.status != status:
+            continue
+        ws = store.workshops.get(r.ws_id)
+        start = ws.start_time if ws is not None else None
+        if (since is not None or until is not None) and start is None:
+            continue
+        if since is not None and start < since or until is not None and start > until:
+            continue
+        if ex_id is not None and (ws is None or ws.ex_id != ex_id):
+            continue
+        name, email = _person(store.attendees.get(r.attendee_id))
+        yield key, (r.res_id, r.status, r.ws_id, ws.title if ws else None, ws.ex_id if ws else None,
+                    start.isoformat() if start else None, r.ticket_id, r.attendee_id, name, email)
+
+REPORTS = {"payments": _payments, "tickets": _tickets, "reservations": _reservations}
+
+def export_rows(report, since=None, until=None, ex_id=None, status=None, after=None):
+    """Yield (key, row tuple) for `report` in storage order, starting after key `after`.
+
+    `since`/`until` filter payments by timestamp and reservations by workshop
+    start; `status` applies to reservations.
+    """
+    if report not in REPORTS:
+        raise ValueError(f"Unknown report: {report}")
+    if report == "tickets" and (since or until):
+        raise ValueError("Tickets have no date to filter on")
+    if report != "reservations" and status:
+        raise ValueError("Only reservations have a status")
+    store = storage.storage
+    collection = getattr(store, report)
+    if after is not None and after not in collection:
+        raise ValueError(f"Cursor key {after!r} not found in {report}")
+    rows = REPORTS[report](store, _bound(since), _bound(until, end=True), ex_id, status)
+    if after is not None:
+        for key, _ in rows:
+            if key == after:
+                break
+    yield from rows
+
+def _save_cursor(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def export(report, path, fmt=None, resume=False, checkpoint_every=CHECKPOINT_EVERY, **filters):
+    """Write `report` to `path` as CSV or JSONL; returns the number of rows written this run.
+
+    The cursor file is removed once the export completes.
+    """
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+    # stored in the cursor file, so keep them JSON-friendly
+    filters = {k: v.isoformat() if isinstance(v, date) else v for k, v in filters.items()}
+    cursor_path = path + ".cursor"
+    after = None
+    if resume and os.path.exists(cursor_path):
+        with open(cursor_path) as f:
+            state = json.load(f)
+        if state["report"] != report or state["filters"] != filters:
+            raise ValueError("Cursor belongs to a different export")
+        after = state["after"]
+        # drop anything written after the last checkpoint
+        with open(path, "r+b") as f:
+            f.truncate(state["offset"])
+    columns = COLUMNS[report]
+    written = 0
+    with open(path, "a" if after is not None else "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer is not None and after is None:
+            writer.writerow(columns)
+        for key, row in export_rows(report, after=after, **filters):
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(dict(zip(columns, row))) + "\n")
+            written += 1
+            if written % checkpoint_every == 0:
+                f.flush()
+                _save_cursor(cursor_path, {"report": report, "filters": filters, "after": key, "offset": f.tell()})
+    if os.path.exists(cursor_path):
+        os.remove(cursor_path)
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export GreenWave data to CSV or JSONL.")
+    parser.add_argument("report", choices=sorted(REPORTS))
+    parser.add_argument("out")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    parser.add_argument("--since", help="first day (YYYY-MM-DD) of payments / workshops to include")
+    parser.add_argument("--until", help="last day (YYYY-MM-DD) to include")
+    parser.add_argument("--exhibition", help="only rows for this exhibition id")
+    parser.add_argument("--status", help="reservation status, e.g. CANCELLED")
+    parser.add_argument("--resume", action="store_true", help="continue from OUT.cursor")
+    parser.add_argument("--data-dir", help="data directory (default: data/)")
+    parser.add_argument("--backend", choices=("pickle", "sqlite"), help="default: GREENWAVE_BACKEND")
+    args = parser.parse_args(argv)
+
+    # read-only: an empty or mistyped --data-dir fails instead of being seeded, and close() does not compact
+    storage.storage = storage.open_storage(args.backend, args.data_dir, read_only=True)
+    try:
+        count = export(args.report, args.out, args.format, args.resume, since=args.since, until=args.until,
+                       ex_id=args.exhibition, status=args.status)
+    finally:
+        storage.storage.close()
+    print(f"Exported {count} {args.report} rows to {args.out}")
+
+if __name__ == "__main__":
+    main()
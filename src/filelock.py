@@ -0,0 +1,84 @@
+"""
+filelock.py - Inter-process advisory lock for a shared GreenWave data directory
+"""
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+COUNTER_WIDTH = 20  # bytes reserved at the start of the lock file for the counter
+
+class FileLock:
+    """Exclusive lock held by one process (and one thread in it) at a time.
+
+    Re-entrant within the owning thread; `acquire` returns True only for the
+    outermost acquisition, which is when the caller should look for changes
+    other processes made while it did not hold the lock. The lock file also
+    stores a small counter (the compaction generation) that may only be read
+    or written while the lock is held.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+
+    def _lock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            return
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue  # LK_LOCK gives up after ~10 seconds; keep waiting
+
+    def _unlock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._lock_file()
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self._depth == 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self._unlock_file()
+        self._thread_lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def read_counter(self):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        data = os.read(self._fd, COUNTER_WIDTH)
+        return int(data) if data.strip() else 0
+
+    def write_counter(self, value):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, str(value).encode().ljust(COUNTER_WIDTH))
+
+    def close(self):
+        os.close(self._fd)
@@ -0,0 +1,259 @@
+"""
+gateway.py - Asynchronous card payments: gateway interface, fake gateway and settlement pipeline
+
+Purchases made while a pipeline is running store their Payment as PENDING
+and return at once; the pipeline authorizes it with the gateway on an
+asyncio loop in a background thread, then settles authorized payments in
+batches:
+
+    PENDING -> AUTHORIZED -> SETTLED
+        \\-> FAILED (declined, or the gateway kept failing)
+
+A payment is recorded FAILED in the same commit that voids the tickets it
+was for (logic.void_tickets), so an unpaid ticket cannot keep a seat.
+
+Gateways receive the Payment, whose pay_id they should treat as an
+idempotency key: after a crash, `start(resume=True)` submits every PENDING
+or AUTHORIZED payment again.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from . import storage
+
+log = logging.getLogger(__name__)
+
+PENDING = "PENDING"
+AUTHORIZED = "AUTHORIZED"
+SETTLED = "SETTLED"
+FAILED = "FAILED"
+
+class GatewayError(Exception):
+    """Temporary gateway problem (timeout, 5xx); the call is retried."""
+
+class PaymentDeclined(Exception):
+    """The gateway refused the payment; it fails without retrying."""
+
+class Gateway(ABC):
+    """Interface of a card payment provider."""
+
+    @abstractmethod
+    async def authorize(self, payment):
+        """Reserve `payment.amount`; returns the gateway's authorization reference."""
+
+    @abstractmethod
+    async def settle(self, payments):
+        """Capture a batch of authorized payments."""
+
+class FakeGateway(Gateway):
+    """Local stand-in with configurable latency, temporary failures and declines."""
+
+    def __init__(self, latency=0.05, failure_rate=0.0, decline_rate=0.0, seed=None):
+        self.latency = latency            # seconds per call
+        self.failure_rate = failure_rate  # share of calls raising GatewayError
+        self.decline_rate = decline_rate  # share of authorizations declined
+        self.rng = random.Random(seed)
+        self.authorized = {}  # pay_id -> reference
+        self.settled = set()
+        self.calls = 0
+
+    async def authorize(self, payment):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.rng.random() < self.failure_rate:
+            raise GatewayError("gateway timeout")
+        if self.rng.random() < self.decline_rate:
+            raise PaymentDeclined("card declined")
+        return self.authorized.setdefault(payment.pay_id, "A"+uuid.uuid4().hex[:10])
+
+    async def settle(self, payments):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.rng.random() < self.failure_rate:
+            raise GatewayError("gateway timeout")
+        self.settled.update(p.pay_id for p in payments)
+
+class PaymentPipeline:
+    """Authorizes submitted payments concurrently and settles them in batches.
+
+    At most `concurrency` authorizations are in flight; temporary gateway
+    errors are retried `retries` times, waiting `backoff` seconds and doubling
+    each time. Authorized and failed payments are collected for up to
+    `batch_interval` seconds (or `batch_size` payments) and written in one
+    transaction, then settled with one gateway call and one more transaction.
+    """
+
+    def __init__(self, gateway, concurrency=8, retries=3, backoff=0.05, batch_size=50, batch_interval=0.1):
+        self.gateway = gateway
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.stats = {"settled": 0, "failed": 0, "retries": 0, "batches": 0, "unsettled": 0, "errors": 0}
+        self._loop = None
+        self._thread = None
+        self._outstanding = 0
+        self._idle = threading.Condition()
+
+    # called from any thread
+    def start(self, resume=True):
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="greenwave-payments", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if resume:
+            for p in list(storage.storage.payments.values()):
+                if p.status in (PENDING, AUTHORIZED):
+                    self.submit(p.pay_id)
+        return self
+
+    def submit(self, pay_id):
+        """Queue a stored payment; call after the transaction that created it committed."""
+        with self._idle:
+            self._outstanding += 1
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, pay_id)
+
+    def wait_idle(self, timeout=None):
+        """Block until every submitted payment is settled, failed or given up on; False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def stop(self, timeout=None):
+        """Finish the queued payments, then stop the loop."""
+        if self._thread is None:
+            return
+        self.wait_idle(timeout)
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # on the pipeline's event loop
+    def _run(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._main(ready))
+        finally:
+            self._loop.close()
+
+    async def _main(self, ready):
+        self._queue = asyncio.Queue()
+        self._results = asyncio.Queue()  # (payment, new status, auth_ref)
+        self._stopping = asyncio.Event()
+        tasks = [asyncio.ensure_future(self._authorizer()) for _ in range(self.concurrency)]
+        tasks.append(asyncio.ensure_future(self._settler()))
+        ready.set()
+        await self._stopping.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _finished(self, count=1):
+        with self._idle:
+            self._outstanding -= count
+            self._idle.notify_all()
+
+    async def _retrying(self, call):
+        for attempt in range(self.retries + 1):
+            try:
+                return await call()
+            except GatewayError:
+                if attempt == self.retries:
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def _authorizer(self):
+        while True:
+            pay_id = await self._queue.get()
+            payment = storage.storage.payments.get(pay_id)
+            if payment is None or payment.status not in (PENDING, AUTHORIZED):
+                self._finished()
+                continue
+            if payment.status == AUTHORIZED:  # resumed after a crash between authorizing and settling
+                await self._results.put((payment, AUTHORIZED, payment.auth_ref))
+                continue
+            try:
+                ref = await self._retrying(lambda: self.gateway.authorize(payment))
+            except (GatewayError, PaymentDeclined):
+                await self._results.put((payment, FAILED, None))
+            except Exception:
+                self.stats["errors"] += 1
+                log.exception("Authorizing payment %s failed", pay_id)
+                self._finished()  # leave it PENDING for the next resume
+            else:
+                await self._results.put((payment, AUTHORIZED, ref))
+
+    async def _settler(self):
+        while True:
+            batch = [await self._results.get()]
+            deadline = self._loop.time() + self.batch_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._results.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._settle(batch)
+            except Exception:
+                self.stats["errors"] += 1  # e.g. a storage error; the payments keep their stored status
+                log.exception("Settling a batch of %d payments failed", len(batch))
+            finally:
+                self._finished(len(batch))
+
+    async def _settle(self, batch):
+        self.stats["batches"] += 1
+        # one commit records every authorization and failure of the batch; it takes
+        # storage and seat locks, so it runs off the loop to keep authorizations going
+        await asyncio.to_thread(self._write, batch)
+        authorized = [p for p, status, _ in batch if status == AUTHORIZED]
+        self.stats["failed"] += len(batch) - len(authorized)
+        if not authorized:
+            return
+        try:
+            await self._retrying(lambda: self.gateway.settle(authorized))
+        except GatewayError:
+            self.stats["unsettled"] += len(authorized)  # stay AUTHORIZED until the next resume
+            return
+        await asyncio.to_thread(self._write, [(p, SETTLED, p.auth_ref) for p in authorized])
+        self.stats["settled"] += len(authorized)
+
+    def _write(self, updates):
+        from . import logic  # logic imports this module
+        store = storage.storage
+        unpaid = [tid for payment, status, _ in updates if status == FAILED
+                  for tid in (payment.ticket_ids or [payment.ticket_id])]
+        held = logic.booked_workshops(unpaid)
+        late = []
+        with store.seats.holding_all(held), store.transaction():
+            for payment, status, ref in updates:
+                store.touch("payments", payment)
+                payment.status = status
+                payment.auth_ref = ref
+                store.update_payment(payment)
+            if unpaid:
+                late = logic.void_tickets(unpaid, held)
+        for res_id in late:
+            logic.cancel_reservation(res_id)
+
+pipeline = None  # the running PaymentPipeline; without one, payments are settled inline
+
+def start_pipeline(gateway=None, **options):
+    """Start routing new payments through `gateway` (a FakeGateway by default)."""
+    global pipeline
+    pipeline = PaymentPipeline(gateway or FakeGateway(), **options).start()
+    return pipeline
+
+def stop_pipeline(timeout=None):
+    global pipeline
+    if pipeline is not None:
+        running, pipeline = pipeline, None
+        running.stop(timeout)
@@ -3,10 +3,23 @@
 gui.py - Tkinter GUI for GreenWave Ticketing System
 Run with: python main.py
 """
+import os
+import queue
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from datetime import datetime, date, timedelta
+from tkinter import ttk, messagebox, simpledialog, filedialog
 from . import storage
 from . import logic
+from . import gateway
+from . import admission
+from .metrics import registry as metrics
+from .paging import table_source, dict_source
+from .events import (Event, TicketAdded, TicketChanged, ReservationCreated, ReservationCancelled,
+                     ReservationPromoted, WorkshopSeatsChanged, PaymentRecorded, PaymentStatusChanged)
+
+PAGE_SIZE = 50  # rows per page in the table views
+EVENT_POLL_MS = 150  # storage events arriving within this window are redrawn together
+SALE_POLL_MS = 250   # how often a window checks on its request in the flash-sale queue
 
 class GreenWaveApp(tk.Tk):
     def __init__(self):
@@ -14,8 +27,77 @@ class GreenWaveApp(tk.Tk):
         self.title("GreenWave Ticketing System")
         self.geometry("900x600")
         self.active_user = None
+        if os.environ.get("GREENWAVE_METRICS"):
+            metrics.enable()
+        # clicks apply changes in memory; a background thread writes them to disk
+        storage.storage.start_write_behind()
+        # card payments are authorized and settled in the background; GREENWAVE_PAYMENTS=inline turns this off
+        if os.environ.get("GREENWAVE_PAYMENTS", "async") != "inline":
+            gateway.start_pipeline()
+        # storage events may come from any thread; they are queued and handled on the Tk thread
+        self._events = queue.SimpleQueue()
+        self._watchers = []  # (window, handler)
+        storage.storage.events.subscribe(Event, self._events.put)
+        self.after(EVENT_POLL_MS, self._pump_events)
+        self.protocol("WM_DELETE_WINDOW", self.exit_app)
         self.create_widgets()
 
+    def watch(self, window, handler):
+        """Call handler(events) with batches of storage events for as long as `window` is open."""
+        self._watchers.append((window, handler))
+
+    def _pump_events(self):
+        batch = {}
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            batch[(type(event), event.key)] = event  # a burst on one object collapses to one event
+        if batch:
+            self._watchers = [(w, h) for w, h in self._watchers if w.winfo_exists()]
+            for _, handler in list(self._watchers):
+                handler(list(batch.values()))
+        self.after(EVENT_POLL_MS, self._pump_events)
+
+    def run_request(self, title, operation, args, on_done, on_error=None):
+        """Run a purchase/reservation (see admission.OPERATIONS) now, or via the flash-sale queue when open.
+
+        Either way `on_done(result)` or `on_error(exception)` is called on the Tk thread.
+        """
+        on_error = on_error or (lambda e: messagebox.showerror(title, str(e)))
+        sale = admission.sale
+        if sale is None:
+            try:
+                result = admission.OPERATIONS[operation](*args)
+            except Exception as e:
+                on_error(e)
+            else:
+                on_done(result)
+            return
+        try:
+            handle = sale.submit(operation, *args)
+        except (admission.QueueFull, ValueError, RuntimeError) as e:
+            messagebox.showerror(title, str(e))
+            return
+        position, eta = handle.position(), handle.eta()
+        if position:
+            wait = f" (about {eta:.0f} s)" if eta is not None else ""
+            messagebox.showinfo(title, f"The sale is busy: you are number {position} in line{wait}. "
+                                       "You will be told here when it is done.")
+
+        def poll():
+            if not handle.done():
+                self.after(SALE_POLL_MS, poll)
+                return
+            try:
+                result = handle.result()
+            except Exception as e:
+                on_error(e)
+            else:
+                on_done(result)
+        poll()
+
     def create_widgets(self):
         top = ttk.Frame(self)
         top.pack(side="top", fill="x", padx=8, pady=8)
@@ -23,12 +105,21 @@ class GreenWaveApp(tk.Tk):
         ttk.Button(top, text="Admin Login", command=self.admin_login).pack(side="left")
         ttk.Button(top, text="Show Exhibitions", command=self.show_exhibitions).pack(side="left")
         ttk.Button(top, text="My Account", command=self.my_account).pack(side="left")
-        ttk.Button(top, text="Exit", command=self.destroy).pack(side="right")
+        ttk.Button(top, text="Exit", command=self.exit_app).pack(side="right")
         self.main = ttk.Frame(self)
         self.main.pack(fill="both", expand=True, padx=8, pady=8)
         ttk.Label(self.main, text="Welcome to GreenWave Conference Ticketing", font=("Helvetica", 16)).pack(pady=20)
         ttk.Label(self.main, text="Use the buttons above to login, view exhibitions, purchase tickets, and reserve workshops.").pack()
 
+    def exit_app(self):
+        try:
+            admission.close_sale(timeout=5)
+            gateway.stop_pipeline(timeout=5)
+            storage.storage.flush()
+        except Exception as e:
+            messagebox.showerror("Exit", f"Could not save all changes: {e}")
+        self.destroy()
+
     def admin_login(self):
         email = simpledialog.askstring("Admin Login", "Enter admin email:")
         pw = simpledialog.askstring("Admin Login", "Enter password:", show="*")
@@ -50,6 +141,119 @@ class GreenWaveApp(tk.Tk):
             return
         AttendeeWindow(self, self.active_user)
 
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d %H:%M")
+    return str(value)
+
+class PagedTable(ttk.Frame):
+    """Treeview showing one page of a RowSource at a time.
+
+    Only the visible page exists as Treeview items. Clicking a heading sorts
+    by that column (again to reverse); typing in the filter box keeps rows
+    containing the text in any column.
+    """
+
+    def __init__(self, parent, source, columns, page_size=PAGE_SIZE, height=12):
+        super().__init__(parent)
+        self.source = source
+        self.page_size = page_size
+        self.page_no = 0
+        self._filter_job = None
+        bar = ttk.Frame(self)
+        bar.pack(fill="x")
+        ttk.Label(bar, text="Filter:").pack(side="left")
+        self.filter_var = tk.StringVar()
+        entry = ttk.Entry(bar, textvariable=self.filter_var)
+        entry.pack(side="left", padx=4)
+        entry.bind("<KeyRelease>", self._filter_later)
+        self.tree = ttk.Treeview(self, columns=[c for c, _, _ in columns], show="headings",
+                                 height=height, selectmode="browse")
+        for i, (col, heading, width) in enumerate(columns):
+            self.tree.heading(col, text=heading, command=lambda i=i: self.sort(i))
+            self.tree.column(col, width=width, anchor="w")
+        self.tree.pack(fill="both", expand=True)
+        nav = ttk.Frame(self)
+        nav.pack(fill="x")
+        ttk.Button(nav, text="< Prev", command=lambda: self.show(self.page_no - 1)).pack(side="left")
+        ttk.Button(nav, text="Next >", command=lambda: self.show(self.page_no + 1)).pack(side="left")
+        self.status = ttk.Label(nav)
+        self.status.pack(side="left", padx=8)
+        self.show(0)
+
+    def show(self, page_no):
+        total = self.source.count()
+        pages = max(1, -(-total // self.page_size))
+        self.page_no = min(max(0, page_no), pages - 1)
+        self.tree.delete(*self.tree.get_children())
+        for key, row in self.source.page(self.page_no, self.page_size):
+            self.tree.insert("", "end", iid=key, values=[_cell(v) for v in row])
+        self.status.configure(text=f"Page {self.page_no + 1} of {pages} ({total} rows)")
+
+    def reload(self):
+        self.source.invalidate()
+        self.show(self.page_no)
+
+    def set_source(self, source):
+        self.source = source
+        self.show(0)
+
+    def patch(self, keys):
+        """Redraw just the visible rows for `keys`; rows on other pages are fetched when shown."""
+        for key in keys:
+            if self.tree.exists(key):
+                obj = self.source.lookup(key)
+                if obj is not None:
+                    self.tree.item(key, values=[_cell(v) for v in self.source.row(obj)])
+
+    def sort(self, column):
+        self.source.sort_by(column)
+        self.show(0)
+
+    def _filter_later(self, event=None):
+        # wait for a pause in typing before rescanning
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(250, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_job = None
+        self.source.set_filter(self.filter_var.get())
+        self.show(0)
+
+    def selected(self):
+        sel = self.tree.selection()
+        return sel[0] if sel else None
+
+def _workshop_row(ws):
+    ex = storage.storage.exhibitions.get(ws.ex_id)
+    return (ws.ws_id, ex.title if ex else ws.ex_id, ws.title, ws.start_time, ws.duration, ws.available_spots(),
+            ws.capacity)
+
+def _ticket_row(t):
+    return (t.ticket_id, t.type, t.price, ", ".join(t.access_exhibitions))
+
+def _reservation_row(r):
+    ws = storage.storage.workshops.get(r.ws_id)
+    return (r.res_id, ws.title if ws else r.ws_id, ws.start_time if ws else None, r.status)
+
+WORKSHOP_COLUMNS = [("ws_id", "Id", 70), ("exhibition", "Exhibition", 130), ("title", "Workshop", 220),
+                    ("start", "Starts", 130), ("minutes", "Minutes", 60), ("free", "Free", 60),
+                    ("capacity", "Capacity", 70)]
+
+def _when(text, end=False):
+    text = text.strip()
+    if not text:
+        return None
+    if len(text) <= 10:
+        day = date.fromisoformat(text)
+        return datetime.combine(day + timedelta(days=1) if end else day, datetime.min.time())
+    return datetime.fromisoformat(text)
+
 class LoginWindow(tk.Toplevel):
     def __init__(self, parent):
         super().__init__(parent)
@@ -100,19 +304,79 @@ class ExhibitionsWindow(tk.Toplevel):
         self.build()
 
     def build(self):
-        frame = ttk.Frame(self)
-        frame.pack(fill="both", expand=True)
-        for ex in storage.storage.exhibitions.values():
-            lab = ttk.Label(frame, text=f"{ex.title} ({ex.ex_id})", font=("Helvetica", 12, "bold"))
-            lab.pack(anchor="w", pady=(8,0))
-            for ws_id in ex.workshops:
-                ws = storage.storage.workshops.get(ws_id)
-                line = f"  [{ws.ws_id}] {ws.title} - Starts: {ws.start_time.strftime('%Y-%m-%d %H:%M')} - Spots: {ws.available_spots()}/{ws.capacity}"
-                row = ttk.Frame(frame)
-                row.pack(fill="x", padx=8, pady=2)
-                ttk.Label(row, text=line).pack(side="left")
-                ttk.Button(row, text="Reserve", command=lambda w=ws: self.reserve(w)).pack(side="right")
-        ttk.Button(self, text="Close", command=self.destroy).pack(pady=10)
+        storage.storage.refresh()  # show changes made by other kiosk processes
+        search = ttk.Frame(self)
+        search.pack(fill="x", padx=8, pady=(8, 0))
+        self.words_var = tk.StringVar()
+        self.ex_var = tk.StringVar(value="All")
+        self.from_var = tk.StringVar()
+        self.to_var = tk.StringVar()
+        self.free_var = tk.StringVar(value="0")
+        exhibitions = ["All"] + [f"{ex.ex_id} {ex.title}" for ex in storage.storage.exhibitions.values()]
+        for label, widget in (
+                ("Title", ttk.Entry(search, textvariable=self.words_var, width=16)),
+                ("Exhibition", ttk.Combobox(search, textvariable=self.ex_var, values=exhibitions, width=16,
+                                            state="readonly")),
+                ("From", ttk.Entry(search, textvariable=self.from_var, width=16)),
+                ("To", ttk.Entry(search, textvariable=self.to_var, width=16)),
+                ("Min free", ttk.Spinbox(search, textvariable=self.free_var, from_=0, to=999, width=4))):
+            ttk.Label(search, text=label).pack(side="left", padx=(4, 2))
+            widget.pack(side="left")
+        ttk.Button(search, text="Search", command=self.search).pack(side="left", padx=4)
+        ttk.Button(search, text="Clear", command=self.clear_search).pack(side="left")
+        self.table = PagedTable(self, table_source(storage.storage.workshops, _workshop_row), WORKSHOP_COLUMNS)
+        self.table.pack(fill="both", expand=True, padx=8, pady=8)
+        self.table.tree.bind("<Double-1>", lambda e: self.reserve_selected())
+        buttons = ttk.Frame(self)
+        buttons.pack(fill="x", padx=8, pady=(0, 8))
+        ttk.Button(buttons, text="Reserve selected", command=self.reserve_selected).pack(side="left")
+        ttk.Button(buttons, text="Suggest for me", command=self.suggest).pack(side="left", padx=4)
+        ttk.Button(buttons, text="Close", command=self.destroy).pack(side="right")
+        self.parent.watch(self, self.on_events)
+
+    def suggest(self):
+        user = self.parent.active_user
+        if not user or not hasattr(user, "tickets"):
+            messagebox.showinfo("Suggestions", "You must login as an attendee first.")
+            return
+        found = logic.suggest_workshops(user.user_id)
+        if not found:
+            messagebox.showinfo("Suggestions", "No open workshops fit your schedule.")
+            return
+        lines = [f"{ws.ws_id}  {ws.start_time:%a %H:%M}  {ws.title}" for ws in found]
+        messagebox.showinfo("Suggestions", "Open workshops that fit your schedule:\n\n" + "\n".join(lines))
+
+    def search(self):
+        # From/To take "YYYY-MM-DD" or "YYYY-MM-DD HH:MM"; a plain To date includes that whole day
+        try:
+            starts_after = _when(self.from_var.get())
+            starts_before = _when(self.to_var.get(), end=True)
+            min_free = int(self.free_var.get() or 0)
+        except ValueError as e:
+            messagebox.showerror("Search", f"Invalid search: {e}")
+            return
+        ex = self.ex_var.get()
+        ids = storage.storage.catalog.match(text=self.words_var.get(), ex_id=None if ex == "All" else ex.split()[0],
+                                            starts_after=starts_after, starts_before=starts_before, min_free=min_free)
+        self.table.set_source(table_source(storage.storage.workshops, _workshop_row, keys=ids))
+
+    def clear_search(self):
+        for var in (self.words_var, self.from_var, self.to_var):
+            var.set("")
+        self.ex_var.set("All")
+        self.free_var.set("0")
+        self.table.set_source(table_source(storage.storage.workshops, _workshop_row))
+
+    def on_events(self, events):
+        # live seat counts, also for bookings made by other windows or kiosks
+        self.table.patch([e.key for e in events if isinstance(e, WorkshopSeatsChanged)])
+
+    def reserve_selected(self):
+        ws = storage.storage.workshops.get(self.table.selected() or "")
+        if not ws:
+            messagebox.showinfo("Reserve", "Select a workshop first.")
+            return
+        self.reserve(ws)
 
     def reserve(self, ws):
         if not self.parent.active_user or not hasattr(self.parent.active_user, "tickets"):
@@ -123,37 +387,80 @@ class ExhibitionsWindow(tk.Toplevel):
             messagebox.showinfo("Reserve", "No tickets found. Buy a ticket first.")
             return
         ticket_id = user.tickets[0]
+
+        def failed(e):
+            if isinstance(e, OverflowError) and not isinstance(e, admission.QueueFull):
+                if messagebox.askyesno("Reservation", f"{ws.title} is full. Join the waitlist?"):
+                    self.join_waitlist(user, ticket_id, ws)
+            else:
+                messagebox.showerror("Reservation", str(e))
+        self.parent.run_request("Reservation", "reserve", (user.user_id, ticket_id, ws.ws_id),
+                                lambda res: messagebox.showinfo("Reservation", f"Reserved {ws.title} ({res.res_id})"),
+                                failed)
+
+    def join_waitlist(self, user, ticket_id, ws):
         try:
-            res = logic.reserve_workshop(user.user_id, ticket_id, ws.ws_id)
-            messagebox.showinfo("Reservation", f"Reserved {ws.title} ({res.res_id})")
+            res = logic.join_waitlist(user.user_id, ticket_id, ws.ws_id)
         except Exception as e:
-            messagebox.showerror("Reservation", str(e))
+            messagebox.showerror("Waitlist", str(e))
+            return
+        if res.status == "CONFIRMED":
+            messagebox.showinfo("Reservation", f"A seat came free: reserved {ws.title} ({res.res_id})")
+        else:
+            place = storage.storage.waitlist.position(res)
+            messagebox.showinfo("Waitlist", f"You are number {place} on the waitlist for {ws.title}.")
 
 class AttendeeWindow(tk.Toplevel):
     def __init__(self, parent, attendee):
         super().__init__(parent)
         self.title(f"My Account - {attendee.name}")
         self.geometry("800x500")
+        self.parent = parent
         self.attendee = attendee
         self.build()
+        parent.watch(self, self.on_events)
+
+    def on_events(self, events):
+        uid = self.attendee.user_id
+        mine = [e for e in events
+                if isinstance(e, (TicketAdded, TicketChanged)) and e.obj.owner_id == uid
+                or isinstance(e, (ReservationCreated, ReservationCancelled, ReservationPromoted))
+                and e.obj.attendee_id == uid]
+        if any(isinstance(e, TicketAdded) for e in mine):
+            self.tickets.reload()
+        else:
+            self.tickets.patch([e.key for e in mine if isinstance(e, TicketChanged)])
+        if any(isinstance(e, (ReservationCreated, ReservationCancelled)) for e in mine):
+            self.reservations.reload()
+        else:
+            self.reservations.patch([e.key for e in mine if isinstance(e, ReservationPromoted)])
 
     def build(self):
+        storage.storage.refresh()  # show changes made by other kiosk processes
         frame = ttk.Frame(self)
         frame.pack(fill="both", expand=True, padx=8, pady=8)
         ttk.Label(frame, text=f"Hello, {self.attendee.name}", font=("Helvetica", 14)).pack(anchor="w")
         ttk.Label(frame, text="Tickets:", font=("Helvetica", 12, "underline")).pack(anchor="w", pady=(8,0))
-        for tid in self.attendee.tickets:
-            t = storage.storage.tickets.get(tid)
-            ttk.Label(frame, text=f" - {t.ticket_id} | Type: {t.type} | Price: ${t.price:.2f} | Access: {t.access_exhibitions}").pack(anchor="w")
-            ttk.Button(frame, text="Upgrade Ticket", command=lambda tid=tid: self.upgrade_ticket(tid)).pack(anchor="e", pady=2)
+        self.tickets = PagedTable(frame, table_source(storage.storage.tickets, _ticket_row, self.attendee.tickets),
+                                  [("id", "Ticket", 100), ("type", "Type", 120), ("price", "Price", 80),
+                                   ("access", "Access", 250)], height=5)
+        self.tickets.pack(fill="both", expand=True)
+        ttk.Button(frame, text="Upgrade selected ticket", command=lambda: self.with_selected(self.tickets, self.upgrade_ticket)).pack(anchor="e", pady=2)
         ttk.Label(frame, text="Reservations:", font=("Helvetica", 12, "underline")).pack(anchor="w", pady=(8,0))
-        for rid in self.attendee.reservations:
-            r = storage.storage.reservations.get(rid)
-            ws = storage.storage.workshops.get(r.ws_id)
-            ttk.Label(frame, text=f" - {r.res_id} | {ws.title} | Status: {r.status}").pack(anchor="w")
-            ttk.Button(frame, text="Cancel", command=lambda rid=rid: self.do_cancel(rid)).pack(anchor="e", pady=2)
+        self.reservations = PagedTable(frame, table_source(storage.storage.reservations, _reservation_row, self.attendee.reservations),
+                                       [("id", "Reservation", 100), ("workshop", "Workshop", 250),
+                                        ("start", "Starts", 130), ("status", "Status", 100)], height=5)
+        self.reservations.pack(fill="both", expand=True)
+        ttk.Button(frame, text="Cancel selected reservation", command=lambda: self.with_selected(self.reservations, self.do_cancel)).pack(anchor="e", pady=2)
         ttk.Button(frame, text="Purchase Ticket", command=self.do_purchase).pack(pady=8)
 
+    def with_selected(self, table, action):
+        key = table.selected()
+        if key is None:
+            messagebox.showinfo("Select", "Select a row first.")
+            return
+        action(key)
+
     def do_purchase(self):
         choice = simpledialog.askstring("Ticket Purchase", "Ticket type (Exhibition/AllAccess):")
         if not choice:
@@ -163,14 +470,18 @@ class AttendeeWindow(tk.Toplevel):
             if not ex_id or ex_id not in storage.storage.exhibitions:
                 messagebox.showerror("Purchase", "Invalid exhibition id.")
                 return
-            ticket, payment = logic.purchase_ticket(self.attendee.user_id, "Exhibition", selected_ex_ids=[ex_id])
+            args = (self.attendee.user_id, "Exhibition", [ex_id])
         elif choice == "AllAccess":
-            ticket, payment = logic.purchase_ticket(self.attendee.user_id, "AllAccess")
+            args = (self.attendee.user_id, "AllAccess")
         else:
             messagebox.showerror("Purchase", "Unknown ticket type.")
             return
-        messagebox.showinfo("Purchase", f"Ticket {ticket.ticket_id} purchased. Payment {payment.pay_id}. Please refresh account window.")
-        self.destroy()
+
+        def purchased(result):
+            ticket, payment = result
+            messagebox.showinfo("Purchase", f"Ticket {ticket.ticket_id} purchased. Payment {payment.pay_id} "
+                                            f"({payment.status.lower()}).")
+        self.parent.run_request("Purchase", "purchase", args, purchased)
 
     def upgrade_ticket(self, ticket_id):
         ex_id = simpledialog.askstring("Upgrade ticket", f"Enter exhibition id to add: {list(storage.storage.exhibitions.keys())}")
@@ -179,7 +490,6 @@ class AttendeeWindow(tk.Toplevel):
         ok = storage.storage.upgrade_ticket(ticket_id, ex_id, extra_price=40.0)
         if ok:
             messagebox.showinfo("Upgrade", "Ticket upgraded successfully.")
-            self.destroy()
         else:
             messagebox.showerror("Upgrade", "Upgrade failed (maybe already included).")
 
@@ -187,7 +497,6 @@ class AttendeeWindow(tk.Toplevel):
         try:
             logic.cancel_reservation(rid)
             messagebox.showinfo("Cancel", "Reservation cancelled.")
-            self.destroy()
         except Exception as e:
             messagebox.showerror("Cancel", str(e))
 
@@ -197,19 +506,58 @@ class AdminDashboard(tk.Toplevel):
         self.title("Admin Dashboard")
         self.geometry("900x600")
         self.build()
+        parent.watch(self, self.on_events)
+
+    def on_events(self, events):
+        if any(isinstance(e, (PaymentRecorded, PaymentStatusChanged)) for e in events):
+            self.show_totals()
+            self.daily.reload()
+        self.workshops.patch([e.key for e in events if isinstance(e, WorkshopSeatsChanged)])
+
+    def toggle_sale(self):
+        # sale mode queues purchases and reservations (admission.py) while registration opens
+        if admission.sale is None:
+            admission.open_sale()
+        else:
+            admission.close_sale(timeout=5)
+        self.show_sale()
+
+    def show_sale(self):
+        self.sale_button.configure(text="Close flash sale" if admission.sale is not None else "Open flash sale")
+
+    def show_totals(self):
+        ledger = storage.storage.sales
+        by_type = ", ".join(f"{k}: ${v:.2f}" for k, v in ledger.by_type.items())
+        by_method = ", ".join(f"{k}: ${v:.2f}" for k, v in ledger.by_method.items())
+        self.total_label.configure(text=f"Total revenue: ${ledger.total:.2f} from {ledger.count} payments")
+        self.type_label.configure(text=f"By ticket type: {by_type or '-'}")
+        self.method_label.configure(text=f"By payment method: {by_method or '-'}")
 
     def build(self):
+        storage.storage.refresh()  # show changes made by other kiosk processes
         frame = ttk.Frame(self)
         frame.pack(fill="both", expand=True, padx=8, pady=8)
         ttk.Label(frame, text="Admin Dashboard", font=("Helvetica", 16)).pack()
-        sales = storage.storage.daily_sales()
+        self.total_label = ttk.Label(frame)
+        self.total_label.pack(anchor="w", pady=(8,0))
+        self.type_label = ttk.Label(frame)
+        self.type_label.pack(anchor="w")
+        self.method_label = ttk.Label(frame)
+        self.method_label.pack(anchor="w")
+        self.show_totals()
         ttk.Label(frame, text="Daily Sales:").pack(anchor="w", pady=(8,0))
-        for d, amt in sales.items():
-            ttk.Label(frame, text=f" - {d} : ${amt:.2f}").pack(anchor="w")
+        self.daily = PagedTable(frame, dict_source(storage.storage.daily_sales),
+                                [("day", "Day", 120), ("amount", "Revenue ($)", 120)], height=5)
+        self.daily.pack(fill="both", expand=True)
         ttk.Label(frame, text="Workshop capacities:").pack(anchor="w", pady=(8,0))
-        for ws in storage.storage.workshops.values():
-            ttk.Label(frame, text=f"{ws.ws_id} | {ws.title} | {len(ws.attendee_ids)}/{ws.capacity}").pack(anchor="w")
+        self.workshops = PagedTable(frame, table_source(storage.storage.workshops, _workshop_row), WORKSHOP_COLUMNS,
+                                    height=8)
+        self.workshops.pack(fill="both", expand=True)
         ttk.Button(frame, text="Upgrade attendee ticket", command=self.upgrade_attendee_ticket).pack(pady=6)
+        self.sale_button = ttk.Button(frame, command=self.toggle_sale)
+        self.sale_button.pack(pady=6)
+        self.show_sale()
+        ttk.Button(frame, text="Metrics", command=lambda: MetricsWindow(self)).pack(pady=6)
         ttk.Button(frame, text="Close", command=self.destroy).pack(pady=6)
 
     def upgrade_attendee_ticket(self):
@@ -230,3 +578,37 @@ class AdminDashboard(tk.Toplevel):
             messagebox.showinfo("Upgrade", "Ticket upgraded by admin.")
         else:
             messagebox.showerror("Upgrade", "Upgrade failed.")
+
+class MetricsWindow(tk.Toplevel):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Metrics")
+        self.geometry("800x500")
+        buttons = ttk.Frame(self)
+        buttons.pack(side="bottom", fill="x", padx=8, pady=8)
+        ttk.Button(buttons, text="Enable", command=lambda: self.toggle(True)).pack(side="left")
+        ttk.Button(buttons, text="Disable", command=lambda: self.toggle(False)).pack(side="left")
+        ttk.Button(buttons, text="Reset", command=self.reset).pack(side="left")
+        ttk.Button(buttons, text="Refresh", command=self.refresh).pack(side="left")
+        ttk.Button(buttons, text="Save JSON", command=self.save_json).pack(side="left")
+        ttk.Button(buttons, text="Close", command=self.destroy).pack(side="right")
+        self.text = tk.Text(self, font=("Courier", 10), wrap="none")
+        self.text.pack(fill="both", expand=True, padx=8, pady=(8, 0))
+        self.refresh()
+
+    def refresh(self):
+        self.text.delete("1.0", "end")
+        self.text.insert("end", metrics.to_text())
+
+    def toggle(self, on):
+        metrics.enable() if on else metrics.disable()
+        self.refresh()
+
+    def reset(self):
+        metrics.reset()
+        self.refresh()
+
+    def save_json(self):
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".json", filetypes=[("JSON", "*.json")])
+        if path:
+            metrics.dump_json(path)
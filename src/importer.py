@@ -0,0 +1,180 @@
+"""
+importer.py - Streaming import of pre-registered attendees from CSV or JSONL
+Run: python -m src.importer FILE [--format csv|jsonl] [--chunk-size N] [--workers N]
+                                 [--rejects rejected.csv] [--data-dir DIR] [--backend pickle|sqlite]
+
+Rows need `name`, `email` and `password` (CSV header or JSON keys). The file
+is read one row at a time and committed in chunks, so memory use depends on
+the chunk size, not the file size. Emails already registered (or repeated in
+the file) are rejected, never overwritten.
+"""
+
+import argparse
+import csv
+import json
+import re
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from . import storage
+from .models import Attendee, hash_password
+
+CHUNK_SIZE = 1000  # rows per transaction
+EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+def read_rows(path, fmt=None):
+    """Yield (line number, row dict or None, error) for each record in a CSV or JSONL file."""
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row, None
+        elif fmt == "jsonl":
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_no, None, f"invalid JSON: {e}"
+                    continue
+                if isinstance(row, dict):
+                    yield line_no, row, None
+                else:
+                    yield line_no, None, "not a JSON object"
+        else:
+            raise ValueError(f"Unknown import format: {fmt}")
+
+def validate(row):
+    """Return (name, email, password) from a raw row or raise ValueError with the reason."""
+    name = str(row.get("name") or "").strip()
+    email = str(row.get("email") or "").strip()
+    password = str(row.get("password") or "")
+    if not name:
+        raise ValueError("missing name")
+    if not EMAIL.match(email):
+        raise ValueError(f"invalid email {email!r}")
+    if not password:
+        raise ValueError("missing password")
+    return name, email, password
+
+class ImportReport:
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"{self.read} rows read, {self.imported} imported, {self.rejected} rejected "
+                f"in {self.elapsed:.2f}s ({self.rows_per_sec:.0f} rows/s)")
+
+def _new_user_id(store):
+    # short ids collide now and then over 100k rows; never overwrite an account
+    while True:
+        uid = "U"+uuid.uuid4().hex[:8]
+        if uid not in store.attendees:
+            return uid
+
+def import_attendees(path, fmt=None, chunk_size=CHUNK_SIZE, workers=0, on_reject=None, on_progress=None):
+    """Import attendees from `path` into the shared storage; returns an ImportReport.
+
+    `on_reject(line_no, row, reason)` is called for every skipped row and
+    `on_progress(report)` after every committed chunk. With `workers` > 1
+    passwords are hashed in a process pool.
+    """
+    store = storage.storage
+    report = ImportReport()
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+
+    def reject(line_no, row, reason):
+        report.rejected += 1
+        if on_reject is not None:
+            on_reject(line_no, row, reason)
+
+    try:
+        rows = read_rows(path, fmt)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            report.read += len(chunk)
+            valid = []
+            for line_no, row, error in chunk:
+                try:
+                    if error:
+                        raise ValueError(error)
+                    valid.append((line_no, row, validate(row)))
+                except ValueError as e:
+                    reject(line_no, row, str(e))
+            passwords = [fields[2] for _, _, fields in valid]
+            if pool is not None:
+                hashes = list(pool.map(hash_password, passwords, chunksize=max(1, len(passwords) // workers)))
+            else:
+                hashes = [hash_password(pw) for pw in passwords]
+            with store.transaction():
+                # look everything up before adding, while nothing of this chunk is pending
+                seen = set()
+                accepted = []
+                for (line_no, row, (name, email, _)), password_hash in zip(valid, hashes):
+                    folded = email.casefold()
+                    if folded in seen or store.find_attendee_by_email(email) is not None:
+                        reject(line_no, row, f"duplicate email {email!r}")
+                        continue
+                    seen.add(folded)
+                    accepted.append(Attendee.from_hash(_new_user_id(store), name, email, password_hash))
+                for att in accepted:
+                    store.add_attendee(att)
+                report.imported += len(accepted)
+            report.elapsed = time.perf_counter() - report.started
+            if on_progress is not None:
+                on_progress(report)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import pre-registered GreenWave attendees from CSV or JSONL.")
+    parser.add_argument("file")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per commit")
+    parser.add_argument("--workers", type=int, default=0, help="processes for password hashing (0 = inline)")
+    parser.add_argument("--rejects", help="write rejected rows to this CSV file")
+    parser.add_argument("--data-dir", help="data directory (default: data/)")
+    parser.add_argument("--backend", choices=("pickle", "sqlite"), help="default: GREENWAVE_BACKEND")
+    args = parser.parse_args(argv)
+
+    storage.storage = storage.open_storage(args.backend, args.data_dir)
+    rejects_file = open(args.rejects, "w", newline="") if args.rejects else None
+    writer = csv.writer(rejects_file) if rejects_file else None
+    if writer:
+        writer.writerow(["line", "reason", "row"])
+
+    def on_reject(line_no, row, reason):
+        if writer:
+            writer.writerow([line_no, reason, json.dumps(row) if row is not None else ""])
+
+    def on_progress(report):
+        print(f"\r{report}", end="", file=sys.stderr, flush=True)
+
+    try:
+        report = import_attendees(args.file, args.format, args.chunk_size, args.workers, on_reject, on_progress)
+    finally:
+        storage.storage.close()
+        if rejects_file:
+            rejects_file.close()
+    print(file=sys.stderr)
+    print(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+journal.py - Append-only write-ahead journal for GreenWave storage
+"""
+
+import os
+import pickle
+import struct
+import threading
+from .codec import encode, decode
+from .metrics import registry as metrics
+
+# record header: op, collection index, payload length
+HEADER = struct.Struct("<BBI")
+PUT = 1
+DELETE = 2
+COMMIT = 3
+
+# new collections must be appended: records store the index into this tuple
+COLLECTIONS = ("attendees", "workshops", "tickets", "payments", "reservations", "exhibitions")
+
+class Journal:
+    """Log of (op, collection, key, obj) records written in committed batches.
+
+    Each batch is terminated by a COMMIT record, so a torn write at the end of
+    the file (crash mid-append) is ignored on replay. `recover` cuts such a
+    tail off; it must run before anything is appended after it, or replay
+    would read the torn bytes and the new batch as one.
+    """
+
+    def __init__(self, path, fsync=False, read_only=False):
+        self.path = path
+        self.fsync = fsync
+        self.records = 0  # records appended since the last reset
+        self._lock = threading.Lock()
+        # read-only: replayed from `path` but never created, appended to or truncated
+        self._f = None if read_only else open(path, "ab")
+
+    def append(self, records):
+        if self._f is None:
+            raise RuntimeError("Journal is open read-only")
+        buf = bytearray()
+        for op, collection, key, obj in records:
+            row = encode(obj) if obj is not None else None
+            payload = pickle.dumps((key, row), protocol=pickle.HIGHEST_PROTOCOL)
+            buf += HEADER.pack(op, COLLECTIONS.index(collection), len(payload))
+            buf += payload
+        buf += HEADER.pack(COMMIT, 0, 0)
+        with self._lock:
+            self._f.write(buf)
+            self._f.flush()
+            if self.fsync:
+                os.fsync(self._f.fileno())
+            self.records += len(records)
+        if metrics.enabled:
+            metrics.add("storage.journal_bytes", len(buf))
+        return len(buf)
+
+    def _batches(self, start=0, collections=None):
+        # yields (offset just past the COMMIT, records) for each committed batch
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            pending = []
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                op, idx, length = HEADER.unpack(header)
+                if op == COMMIT:
+                    yield f.tell(), pending
+                    pending = []
+                    continue
+                if op not in (PUT, DELETE) or idx >= len(COLLECTIONS):
+                    break  # corrupt tail
+                collection = COLLECTIONS[idx]
+                if collections is not None and collection not in collections:
+                    f.seek(length, os.SEEK_CUR)
+                    continue
+                payload = f.read(length)
+                if len(payload) < length:
+                    break
+                key, row = pickle.loads(payload)
+                pending.append((op, collection, key, decode(row)))
+
+    def replay(self, collections=None):
+        """Yield committed (op, collection, key, obj) records in write order.
+
+        When `collections` is given, payloads of other collections are skipped
+        without being unpickled.
+        """
+        for _, batch in self._batches(collections=collections):
+            yield from batch
+
+    def tail(self, start, collections=None):
+        """Committed records written after byte offset `start`, and the offset they end at."""
+        records, end = [], start
+        for end, batch in self._batches(start, collections):
+            records.extend(batch)
+        return records, end
+
+    def committed_end(self):
+        """Offset just past the last COMMIT record whose batch is complete on disk."""
+        end = 0
+        if not os.path.exists(self.path):
+            return end
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                op, idx, length = HEADER.unpack(header)
+                if op == COMMIT:
+                    end = f.tell()
+                    continue
+                if op not in (PUT, DELETE) or idx >= len(COLLECTIONS) or f.tell() + length > size:
+                    break  # corrupt or torn tail
+                f.seek(length, os.SEEK_CUR)
+        return end
+
+    def recover(self):
+        """Drop a torn or uncommitted batch at the end of the file; returns the bytes dropped."""
+        return self.truncate(self.committed_end())
+
+    def truncate(self, offset):
+        """Cut the file back to `offset` (the end of a committed batch); returns the bytes dropped."""
+        if self._f is None:
+            raise RuntimeError("Journal is open read-only")
+        with self._lock:
+            self._f.flush()
+            dropped = os.fstat(self._f.fileno()).st_size - offset
+            if dropped > 0:
+                self._f.truncate(offset)
+            return max(0, dropped)
+
+    def _committed(self):
+        # collection index of every committed record, read from the headers only
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            pending = []
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                op, idx, length = HEADER.unpack(header)
+                if op == COMMIT:
+                    yield from pending
+                    pending = []
+                else:
+                    pending.append(idx)
+                    f.seek(length, os.SEEK_CUR)
+
+    def count(self):
+        """Number of committed records."""
+        return sum(1 for _ in self._committed())
+
+    def collections(self):
+        """Names of the collections that have committed records in the journal."""
+        return {COLLECTIONS[idx] for idx in set(self._committed()) if idx < len(COLLECTIONS)}
+
+    def size(self):
+        with self._lock:
+            if self._f is None:
+                return os.path.getsize(self.path)
+            return self._f.tell()
+
+    def end(self):
+        """Current file size, including appends made by other processes."""
+        with self._lock:
+            if self._f is None:
+                return os.path.getsize(self.path)
+            return os.fstat(self._f.fileno()).st_size
+
+    def reset(self):
+        if self._f is None:
+            raise RuntimeError("Journal is open read-only")
+        with self._lock:
+            self._f.seek(0)
+            self._f.truncate()
+            self.records = 0
+
+    def close(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
@@ -1,33 +1,48 @@
-
 """
 logic.py - Business logic functions for GreenWave
 """
 import uuid
+from datetime import datetime
 from . import storage
+from . import gateway
 from .models import Attendee, Ticket, ExhibitionPass, AllAccessPass, Reservation, Payment
+from .waitlist import WAITLISTED
 
 def create_account(name, email, password):
-    if storage.storage.find_attendee_by_email(email):
-        raise ValueError("Email already registered.")
     uid = "U"+uuid.uuid4().hex[:8]
     att = Attendee(uid, name, email, password)
-    storage.storage.add_attendee(att)
+    # check and insert together, so another process cannot register the email in between
+    with storage.storage.transaction():
+        if storage.storage.find_attendee_by_email(email):
+            raise ValueError("Email already registered.")
+        storage.storage.add_attendee(att)
     return att
 
-def simulate_payment(ticket, method="Card"):
-    pay_id = "P"+uuid.uuid4().hex[:8]
-    payment = Payment(pay_id, ticket.ticket_id, ticket.price, method)
+def _charge(payment):
+    # with a payment pipeline running the payment is stored PENDING and handed over once committed
+    pipeline = gateway.pipeline
+    if pipeline is not None:
+        payment.status = gateway.PENDING
+        storage.storage.after_commit(lambda: pipeline.submit(payment.pay_id))
     storage.storage.add_payment(payment)
-    owner = storage.storage.attendees.get(ticket.owner_id)
-    if owner:
-        owner.purchase_history.append(payment.pay_id)
-        storage.storage.save_all()
+
+def _covers(tickets):
+    # frozen copy of what was bought; upgrades later change the tickets in place
+    return [(t.type, t.price, list(t.access_exhibitions)) for t in tickets]
+
+def simulate_payment(ticket, method="Card"):
+    with storage.storage.transaction():
+        pay_id = "P"+uuid.uuid4().hex[:8]
+        payment = Payment(pay_id, ticket.ticket_id, ticket.price, method, covers=_covers([ticket]))
+        _charge(payment)
+        owner = storage.storage.attendees.get(ticket.owner_id)
+        if owner:
+            storage.storage.touch("attendees", owner)
+            owner.purchase_history.append(payment.pay_id)
+            storage.storage.update_attendee(owner)
     return payment
 
-def purchase_ticket(attendee_id, ticket_type, selected_ex_ids=None):
-    att = storage.storage.attendees.get(attendee_id)
-    if not att:
-        raise ValueError("Attendee not found.")
+def _new_ticket(attendee_id, ticket_type, selected_ex_ids=None):
     tid = "T"+uuid.uuid4().hex[:8]
     if ticket_type == "Exhibition":
         if not selected_ex_ids:
@@ -39,12 +54,96 @@ def purchase_ticket(attendee_id, ticket_type, selected_ex_ids=None):
         ticket = AllAccessPass(tid, attendee_id, price=150.0)
     else:
         raise ValueError("Unknown ticket type.")
-    storage.storage.add_ticket(ticket)
-    att.tickets.append(ticket.ticket_id)
-    storage.storage.save_all()
-    payment = simulate_payment(ticket, method="Card")
+    return ticket
+
+def purchase_ticket(attendee_id, ticket_type, selected_ex_ids=None):
+    att = storage.storage.attendees.get(attendee_id)
+    if not att:
+        raise ValueError("Attendee not found.")
+    ticket = _new_ticket(attendee_id, ticket_type, selected_ex_ids)
+    # ticket, attendee and payment are written together or not at all
+    with storage.storage.transaction():
+        storage.storage.add_ticket(ticket)
+        storage.storage.touch("attendees", att)
+        att.tickets.append(ticket.ticket_id)
+        storage.storage.update_attendee(att)
+        payment = simulate_payment(ticket, method="Card")
     return ticket, payment
 
+def purchase_tickets_bulk(orders, group_payment=False, method="Card"):
+    """Buy tickets for a delegation in one commit.
+
+    `orders` is a list of (attendee_id, ticket_type[, selected_ex_ids]). Every
+    order is validated before anything is written; with `group_payment` one
+    Payment covers all tickets, otherwise each ticket gets its own.
+    Returns (tickets, payments).
+    """
+    orders = [tuple(order) + (None,) * (3 - len(order)) for order in orders]
+    attendees = {}
+    tickets = []
+    for attendee_id, ticket_type, selected_ex_ids in orders:
+        att = attendees.get(attendee_id) or storage.storage.attendees.get(attendee_id)
+        if not att:
+            raise ValueError(f"Attendee not found: {attendee_id}")
+        attendees[attendee_id] = att
+        tickets.append(_new_ticket(attendee_id, ticket_type, selected_ex_ids))
+    if not tickets:
+        return [], []
+    with storage.storage.transaction():
+        for ticket in tickets:
+            att = attendees[ticket.owner_id]
+            storage.storage.add_ticket(ticket)
+            storage.storage.touch("attendees", att)
+            att.tickets.append(ticket.ticket_id)
+        if group_payment:
+            payment = Payment("P"+uuid.uuid4().hex[:8], tickets[0].ticket_id, sum(t.price for t in tickets),
+                              method, ticket_ids=[t.ticket_id for t in tickets], covers=_covers(tickets))
+            _charge(payment)
+            payments = [payment]
+            for att in attendees.values():
+                att.purchase_history.append(payment.pay_id)
+        else:
+            payments = [simulate_payment(ticket, method=method) for ticket in tickets]
+        for att in attendees.values():
+            storage.storage.update_attendee(att)
+    return tickets, payments
+
+def _require_valid(ticket):
+    # a ticket taken off its owner's account (see void_tickets) cannot book anything
+    owner = storage.storage.attendees.get(ticket.owner_id)
+    if owner is None or ticket.ticket_id not in owner.tickets:
+        raise PermissionError(f"Ticket {ticket.ticket_id} is void: its payment failed.")
+
+def _live_reservations(ticket_ids):
+    return [res for tid in ticket_ids for res in storage.storage.reservations_for_ticket(tid)
+            if res.status in ("CONFIRMED", WAITLISTED)]
+
+def booked_workshops(ticket_ids):
+    """Workshops the tickets hold a seat or waiting place in; lock them before calling void_tickets."""
+    return {res.ws_id for res in _live_reservations(ticket_ids)}
+
+def void_tickets(ticket_ids, held):
+    """Withdraw tickets whose payment failed: take them off their owners' accounts and cancel their bookings.
+
+    Call inside a transaction holding the seat locks of `held` (from
+    booked_workshops). Returns the ids of reservations in other workshops,
+    booked since; cancel those once the transaction has committed.
+    """
+    late = []
+    for tid in ticket_ids:
+        ticket = storage.storage.tickets.get(tid)
+        owner = storage.storage.attendees.get(ticket.owner_id) if ticket else None
+        if owner and tid in owner.tickets:
+            storage.storage.touch("attendees", owner)
+            owner.tickets.remove(tid)
+            storage.storage.update_attendee(owner)
+    for res in _live_reservations(ticket_ids):
+        if res.ws_id in held:
+            cancel_reservation(res.res_id)
+        else:
+            late.append(res.res_id)
+    return late
+
 def reserve_workshop(attendee_id, ticket_id, ws_id):
     att = storage.storage.attendees.get(attendee_id)
     if not att:
@@ -55,31 +154,181 @@ def reserve_workshop(attendee_id, ticket_id, ws_id):
     ws = storage.storage.workshops.get(ws_id)
     if not ws:
         raise ValueError("workshop not found")
-    if ws.available_spots() <= 0:
-        raise OverflowError("No seats available.")
     if "ALL" not in ticket.access_exhibitions and ws.ex_id not in ticket.access_exhibitions:
         raise PermissionError("Ticket does not allow access to this exhibition's workshops.")
     rid = "R"+uuid.uuid4().hex[:8]
     res = Reservation(rid, ticket.ticket_id, ws_id, attendee_id)
-    storage.storage.add_reservation(res)
-    ws.attendee_ids.append(rid)
-    storage.storage.update_workshop(ws)
-    att.reservations.append(rid)
-    storage.storage.save_all()
+    seats = storage.storage.seats
+    # the workshop lock covers the seat check and the commit, so concurrent
+    # requests cannot oversell and a rollback cannot drop another booking
+    with seats.holding(ws_id), storage.storage.transaction():
+        _require_valid(ticket)
+        storage.storage.touch("workshops", ws)
+        seats.claim(ws, rid)
+        storage.storage.add_reservation(res)
+        storage.storage.schedule.book(res, ws)
+        storage.storage.update_workshop(ws)
+        storage.storage.touch("attendees", att)
+        att.reservations.append(rid)
+        storage.storage.update_attendee(att)
     return res
 
+def reserve_workshops_bulk(requests):
+    """Book several (attendee_id, ticket_id, ws_id) seats all-or-nothing in one commit.
+
+    Raises OverflowError naming the first workshop without enough free seats;
+    in that case nothing is reserved.
+    """
+    checked = []
+    for attendee_id, ticket_id, ws_id in requests:
+        att = storage.storage.attendees.get(attendee_id)
+        if not att:
+            raise ValueError(f"attendee not found: {attendee_id}")
+        ticket = storage.storage.tickets.get(ticket_id)
+        if not ticket:
+            raise ValueError(f"ticket not found: {ticket_id}")
+        ws = storage.storage.workshops.get(ws_id)
+        if not ws:
+            raise ValueError(f"workshop not found: {ws_id}")
+        if "ALL" not in ticket.access_exhibitions and ws.ex_id not in ticket.access_exhibitions:
+            raise PermissionError(f"Ticket {ticket_id} does not allow access to workshop {ws_id}.")
+        checked.append((att, ticket, ws))
+    wanted = {}
+    for _, _, ws in checked:
+        wanted[ws.ws_id] = wanted.get(ws.ws_id, 0) + 1
+    seats = storage.storage.seats
+    reservations = []
+    with seats.holding_all(wanted), storage.storage.transaction():
+        for _, ticket, _ in checked:
+            _require_valid(ticket)
+        # check every workshop first so a full one leaves the others untouched
+        for ws_id, count in sorted(wanted.items()):
+            ws = storage.storage.workshops[ws_id]
+            if ws.available_spots() < count:
+                raise OverflowError(f"Not enough seats in {ws_id}: {ws.available_spots()} left, {count} requested.")
+        for att, ticket, ws in checked:
+            res = Reservation("R"+uuid.uuid4().hex[:8], ticket.ticket_id, ws.ws_id, att.user_id)
+            storage.storage.touch("workshops", ws)
+            seats.claim(ws, res.res_id)
+            storage.storage.add_reservation(res)
+            storage.storage.schedule.book(res, ws)
+            storage.storage.touch("attendees", att)
+            att.reservations.append(res.res_id)
+            reservations.append(res)
+        for ws_id in wanted:
+            storage.storage.update_workshop(storage.storage.workshops[ws_id])
+        for att in {id(att): att for att, _, _ in checked}.values():
+            storage.storage.update_attendee(att)
+    return reservations
+
+def join_waitlist(attendee_id, ticket_id, ws_id):
+    """Queue for a full workshop; returns the Reservation with status WAITLISTED.
+
+    AllAccess (priority) tickets go ahead of other tickets, otherwise first
+    come first served. If a seat is free after all, it is booked straight away
+    and the reservation comes back CONFIRMED.
+    """
+    att = storage.storage.attendees.get(attendee_id)
+    if not att:
+        raise ValueError("attendee not found")
+    ticket = storage.storage.tickets.get(ticket_id)
+    if not ticket:
+        raise ValueError("ticket not found")
+    ws = storage.storage.workshops.get(ws_id)
+    if not ws:
+        raise ValueError("workshop not found")
+    if "ALL" not in ticket.access_exhibitions and ws.ex_id not in ticket.access_exhibitions:
+        raise PermissionError("Ticket does not allow access to this exhibition's workshops.")
+    seats = storage.storage.seats
+    with seats.holding(ws_id), storage.storage.transaction():
+        _require_valid(ticket)
+        for other in storage.storage.reservations_for_ticket(ticket_id):
+            if other.ws_id == ws_id and other.status in ("CONFIRMED", WAITLISTED):
+                raise ValueError(f"Ticket already has a {other.status.lower()} place in this workshop.")
+        res = Reservation("R"+uuid.uuid4().hex[:8], ticket.ticket_id, ws_id, attendee_id, status=WAITLISTED,
+                          priority=bool(getattr(ticket, "priority", False)), queued_at=datetime.now())
+        if ws.available_spots() > 0:
+            storage.storage.touch("workshops", ws)
+            seats.claim(ws, res.res_id)
+            res.status = "CONFIRMED"
+            storage.storage.update_workshop(ws)
+        storage.storage.add_reservation(res)
+        storage.storage.schedule.book(res, ws)  # a waiting place keeps its slot free too
+        storage.storage.touch("attendees", att)
+        att.reservations.append(res.res_id)
+        storage.storage.update_attendee(att)
+        if res.status == WAITLISTED:
+            storage.storage.waitlist.add(res)
+    return res
+
+def _promote(ws):
+    # caller holds the workshop lock inside a transaction; fill every free seat from the waitlist
+    promoted = []
+    while ws.available_spots() > 0:
+        res = storage.storage.waitlist.pop(ws.ws_id)
+        if res is None:
+            break
+        storage.storage.touch("reservations", res)
+        storage.storage.seats.claim(ws, res.res_id)
+        res.status = "CONFIRMED"
+        storage.storage.update_reservation(res)
+        promoted.append(res)
+    return promoted
+
 def cancel_reservation(res_id):
+    """Cancel a confirmed or waitlisted reservation; a freed seat goes to the head of the waitlist."""
     res = storage.storage.reservations.get(res_id)
     if not res:
         raise ValueError("reservation not found")
-    ws = storage.storage.workshops.get(res.ws_id)
-    if ws and res_id in ws.attendee_ids:
-        ws.attendee_ids.remove(res_id)
-        storage.storage.update_workshop(ws)
-    att = storage.storage.attendees.get(res.attendee_id)
-    if att and res_id in att.reservations:
-        att.reservations.remove(res_id)
-    res.status = "CANCELLED"
-    storage.storage.reservations[res_id] = res
-    storage.storage.save_all()
+    seats = storage.storage.seats
+    with seats.holding(res.ws_id), storage.storage.transaction():
+        ws = storage.storage.workshops.get(res.ws_id)
+        if ws and res_id in ws.attendee_ids:
+            storage.storage.touch("workshops", ws)
+            seats.release(ws, res_id)
+            _promote(ws)
+            storage.storage.update_workshop(ws)
+        att = storage.storage.attendees.get(res.attendee_id)
+        if att and res_id in att.reservations:
+            storage.storage.touch("attendees", att)
+            att.reservations.remove(res_id)
+            storage.storage.update_attendee(att)
+        storage.storage.touch("reservations", res)
+        res.status = "CANCELLED"
+        storage.storage.update_reservation(res)
+        storage.storage.schedule.release(res)
     return res
+
+def suggest_workshops(attendee_id, ticket_id=None, ex_id=None, limit=10):
+    """Upcoming workshops with free seats that the attendee's tickets cover and that fit their itinerary."""
+    att = storage.storage.attendees.get(attendee_id)
+    if not att:
+        raise ValueError("attendee not found")
+    ticket_ids = [ticket_id] if ticket_id else att.tickets
+    access = set()
+    for tid in ticket_ids:
+        ticket = storage.storage.tickets.get(tid)
+        if ticket:
+            access.update(ticket.access_exhibitions)
+    if ex_id is not None:
+        ex_ids = [ex_id] if "ALL" in access or ex_id in access else []
+    else:
+        ex_ids = [None] if "ALL" in access else sorted(access)
+    # the catalog narrows by exhibition, start time and free seats; ids come back by start time
+    catalog = storage.storage.catalog
+    now = datetime.now()
+    candidates = []
+    for ex in ex_ids:
+        candidates.extend(catalog.match(ex_id=ex, starts_after=now, min_free=1))
+    workshops = storage.storage.workshops
+    if len(ex_ids) > 1:
+        candidates.sort(key=lambda ws_id: workshops[ws_id].start_time)
+    schedule = storage.storage.schedule
+    found = []
+    for ws_id in candidates:
+        if limit is not None and len(found) >= limit:
+            break
+        ws = workshops.get(ws_id)
+        if ws is not None and ws.available_spots() > 0 and schedule.conflict(attendee_id, ws) is None:
+            found.append(ws)
+    return found
@@ -0,0 +1,157 @@
+"""
+metrics.py - Hot-path instrumentation for GreenWave storage and logic
+
+Timing wrappers are only installed while metrics are enabled, so a disabled
+registry adds no per-call work beyond a flag check in the byte counters.
+"""
+
+import functools
+import json
+import math
+import threading
+import time
+
+class Histogram:
+    """Count/sum/min/max plus power-of-two buckets for approximate percentiles."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = {}  # exponent -> observations <= 2**exponent
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        exp = math.ceil(math.log2(value)) if value > 0 else -64
+        self.buckets[exp] = self.buckets.get(exp, 0) + 1
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for exp in sorted(self.buckets):
+            seen += self.buckets[exp]
+            if seen >= rank:
+                return min(2.0 ** exp, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min or 0.0,
+            "max": self.max or 0.0,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+        }
+
+# callables that only build a context manager or record bookkeeping inside a
+# transaction; timing them measures nothing useful
+SKIP = frozenset(("transaction", "savepoint", "touch", "after_commit"))
+
+class Registry:
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}    # name -> int
+        self.histograms = {}  # name -> Histogram (timings in seconds)
+        self._lock = threading.Lock()
+        self._installed = []  # (owner, attribute, original)
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    # instrumentation
+    def _wrap(self, fn, name):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.observe(name, time.perf_counter() - t0)
+        return wrapper
+
+    def instrument(self, owner, attribute, name):
+        original = owner.__dict__[attribute]
+        if isinstance(original, (staticmethod, classmethod, property)):
+            return
+        self._installed.append((owner, attribute, original))
+        setattr(owner, attribute, self._wrap(original, name))
+
+    def enable(self):
+        """Turn metrics on and install timing wrappers on storage and logic entry points."""
+        if self.enabled:
+            return
+        from . import logic, models, storage, sqlite_storage
+        seen = set()
+        for cls in (storage.Storage, sqlite_storage.SqliteStorage):
+            for attribute in dir(cls):
+                if attribute.startswith("_") or attribute in SKIP:
+                    continue
+                # wrap only the implementation the backend resolves to, so an override
+                # calling super() (close, save_all) is not timed twice
+                owner = next(c for c in cls.__mro__ if attribute in c.__dict__)
+                if (owner, attribute) not in seen and callable(owner.__dict__[attribute]):
+                    seen.add((owner, attribute))
+                    self.instrument(owner, attribute, f"storage.{attribute}")
+        for attribute in ("safe_save", "safe_load"):
+            self.instrument(storage, attribute, f"storage.{attribute}")
+        for attribute, value in list(vars(logic).items()):
+            if callable(value) and getattr(value, "__module__", None) == logic.__name__:
+                self.instrument(logic, attribute, f"logic.{attribute}")
+        self.instrument(models.User, "check_password", "models.check_password")
+        self.enabled = True
+
+    def disable(self):
+        """Remove the timing wrappers; collected numbers are kept until reset()."""
+        while self._installed:
+            owner, attribute, original = self._installed.pop()
+            setattr(owner, attribute, original)
+        self.enabled = False
+
+    # export
+    def snapshot(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "counters": dict(self.counters),
+                "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+            }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent, sort_keys=True)
+
+    def dump_json(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_json())
+
+    def to_text(self):
+        snap = self.snapshot()
+        lines = [f"metrics {'enabled' if snap['enabled'] else 'disabled'}"]
+        for name, value in sorted(snap["counters"].items()):
+            lines.append(f"{name:<40} {value:>14}")
+        for name, h in sorted(snap["histograms"].items()):
+            lines.append(f"{name:<40} n={h['count']:<8} mean={h['mean'] * 1000:.3f}ms "
+                         f"p50={h['p50'] * 1000:.3f}ms p99={h['p99'] * 1000:.3f}ms max={h['max'] * 1000:.3f}ms")
+        return "\n".join(lines)
+
+registry = Registry()
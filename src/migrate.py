@@ -0,0 +1,34 @@
+"""
+migrate.py - Import the pickle data files into the SQLite backend
+Run: python -m src.migrate [--data-dir DIR] [--db PATH]
+"""
+
+import argparse
+from .storage import Storage
+from .sqlite_storage import SqliteStorage
+
+def migrate(data_dir=None, db_path=None):
+    """Load data/*.pkl (plus any journal) and write it to an SQLite database.
+
+    The source is opened read-only; a directory without snapshot files raises
+    FileNotFoundError instead of being seeded with demo data.
+    """
+    source = Storage(data_dir, read_only=True)
+    target = SqliteStorage(data_dir, path=db_path, seed=False)
+    try:
+        return target.bulk_load(source), target.path
+    finally:
+        target.close()
+        source.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import GreenWave pickle data into SQLite.")
+    parser.add_argument("--data-dir", help="directory holding the *.pkl files (default: data/)")
+    parser.add_argument("--db", help="SQLite database path (default: <data-dir>/greenwave.db)")
+    args = parser.parse_args(argv)
+    count, path = migrate(args.data_dir, args.db)
+    print(f"Imported {count} records into {path}")
+    print("Start the app with GREENWAVE_BACKEND=sqlite to use it.")
+
+if __name__ == "__main__":
+    main()
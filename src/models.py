@@ -1,22 +1,74 @@
-
 """
 models.py - Domain classes for GreenWave Ticketing System
 """
 
 import hashlib
-from datetime import datetime
+import sys
+from datetime import datetime, timedelta
+
+_FIELDS = {}  # class -> ordered slot names, filled on first use
+
+class Model:
+    """Base for the slotted domain classes.
+
+    Pickle state is a plain {field: value} dict, which is also what the older
+    __dict__-based classes wrote, so existing .pkl files still load. Fields
+    added later list their value for older data in DEFAULTS.
+    """
+    __slots__ = ("__weakref__",)
+    DEFAULTS = {}
+
+    @classmethod
+    def fields(cls):
+        names = _FIELDS.get(cls)
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__):
+                for name in klass.__dict__.get("__slots__", ()):
+                    if name != "__weakref__" and name not in names:
+                        names.append(name)
+            names = _FIELDS[cls] = tuple(names)
+        return names
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.fields() if hasattr(self, name)}
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):  # (dict state, slot state) from default slot pickling
+            merged = dict(state[0] or {})
+            merged.update(state[1] or {})
+            state = merged
+        for name, value in self.DEFAULTS.items():
+            if name not in state:
+                setattr(self, name, value)
+        for name, value in state.items():
+            setattr(self, name, value)
+
+def hash_password(password_plain):
+    return hashlib.sha256(password_plain.encode()).hexdigest()
+
+class User(Model):
+    __slots__ = ("user_id", "name", "email", "password_hash")
 
-class User:
     def __init__(self, user_id, name, email, password_plain):
         self.user_id = user_id
         self.name = name
         self.email = email
-        self.password_hash = hashlib.sha256(password_plain.encode()).hexdigest()
+        self.password_hash = hash_password(password_plain)
+
+    @classmethod
+    def from_hash(cls, user_id, name, email, password_hash):
+        """Build a user whose password was already hashed with hash_password."""
+        user = cls(user_id, name, email, "")
+        user.password_hash = password_hash
+        return user
 
     def check_password(self, pw):
-        return hashlib.sha256(pw.encode()).hexdigest() == self.password_hash
+        return hash_password(pw) == self.password_hash
 
 class Attendee(User):
+    __slots__ = ("tickets", "reservations", "purchase_history")
+
     def __init__(self, user_id, name, email, password_plain):
         super().__init__(user_id, name, email, password_plain)
         self.tickets = []           # list of ticket_ids
@@ -24,49 +76,72 @@ class Attendee(User):
         self.purchase_history = []  # list of payment ids
 
 class Admin(User):
+    __slots__ = ()
+
     def __init__(self, user_id, name, email, password_plain):
         super().__init__(user_id, name, email, password_plain)
 
-class Exhibition:
+class Exhibition(Model):
+    __slots__ = ("ex_id", "title", "workshops")
+
     def __init__(self, ex_id, title):
-        self.ex_id = ex_id
+        self.ex_id = sys.intern(ex_id)
         self.title = title
         self.workshops = []  # workshop ids
 
-class Workshop:
-    def __init__(self, ws_id, title, ex_id, capacity, start_time):
+class Workshop(Model):
+    __slots__ = ("ws_id", "title", "ex_id", "capacity", "start_time", "attendee_ids", "duration")
+    DEFAULTS = {"duration": 60}
+
+    def __init__(self, ws_id, title, ex_id, capacity, start_time, duration=60):
         self.ws_id = ws_id
         self.title = title
-        self.ex_id = ex_id
+        self.ex_id = sys.intern(ex_id)
         self.capacity = capacity
         self.start_time = start_time
-        self.attendee_ids = []  # reservation ids
+        self.attendee_ids = set()  # reservation ids
+        self.duration = duration   # minutes
+
+    def __setstate__(self, state):
+        # older pickles stored attendee_ids as a list
+        state = dict(state)
+        state["attendee_ids"] = set(state.get("attendee_ids", ()))
+        super().__setstate__(state)
 
     def available_spots(self):
         return max(0, self.capacity - len(self.attendee_ids))
 
-class Ticket:
+    def end_time(self):
+        return self.start_time + timedelta(minutes=self.duration)
+
+class Ticket(Model):
+    __slots__ = ("ticket_id", "owner_id", "price", "access_exhibitions", "type")
+
     def __init__(self, ticket_id, owner_id, price, access_exhibitions):
         self.ticket_id = ticket_id
         self.owner_id = owner_id
         self.price = price
-        self.access_exhibitions = list(access_exhibitions)  # list of ex_ids
+        self.access_exhibitions = [sys.intern(ex) for ex in access_exhibitions]  # list of ex_ids
         self.type = "Generic"
 
     def upgrade_add_exhibition(self, ex_id, extra_price):
         if ex_id not in self.access_exhibitions:
-            self.access_exhibitions.append(ex_id)
+            self.access_exhibitions.append(sys.intern(ex_id))
             self.price += extra_price
             return True
         return False
 
 class ExhibitionPass(Ticket):
+    __slots__ = ("selected_ex_id",)
+
     def __init__(self, ticket_id, owner_id, price, selected_ex_id):
         super().__init__(ticket_id, owner_id, price, [selected_ex_id])
         self.type = "ExhibitionPass"
-        self.selected_ex_id = selected_ex_id
+        self.selected_ex_id = sys.intern(selected_ex_id)
 
 class AllAccessPass(Ticket):
+    __slots__ = ("priority", "recordings")
+
     def __init__(self, ticket_id, owner_id, price):
         super().__init__(ticket_id, owner_id, price, [])
         self.access_exhibitions = ["ALL"]
@@ -74,18 +149,33 @@ class AllAccessPass(Ticket):
         self.priority = True
         self.recordings = True
 
-class Reservation:
-    def __init__(self, res_id, ticket_id, ws_id, attendee_id, status="CONFIRMED"):
+class Reservation(Model):
+    __slots__ = ("res_id", "ticket_id", "ws_id", "attendee_id", "status", "priority", "queued_at")
+    DEFAULTS = {"priority": False, "queued_at": None}
+
+    def __init__(self, res_id, ticket_id, ws_id, attendee_id, status="CONFIRMED", priority=False, queued_at=None):
         self.res_id = res_id
         self.ticket_id = ticket_id
         self.ws_id = ws_id
         self.attendee_id = attendee_id
-        self.status = status
+        self.status = status        # CONFIRMED, WAITLISTED or CANCELLED
+        self.priority = priority    # waitlist: served before non-priority entries
+        self.queued_at = queued_at  # waitlist: when the attendee joined it
+
+class Payment(Model):
+    __slots__ = ("pay_id", "ticket_id", "amount", "method", "timestamp", "ex_id", "ticket_ids", "status", "auth_ref",
+                 "covers")
+    DEFAULTS = {"ex_id": None, "ticket_ids": None, "status": "SETTLED", "auth_ref": None, "covers": None}
 
-class Payment:
-    def __init__(self, pay_id, ticket_id, amount, method, timestamp=None):
+    def __init__(self, pay_id, ticket_id, amount, method, timestamp=None, ex_id=None, ticket_ids=None,
+                 status="SETTLED", covers=None):
         self.pay_id = pay_id
         self.ticket_id = ticket_id
         self.amount = amount
         self.method = method
         self.timestamp = timestamp or datetime.now()
+        self.ex_id = ex_id  # exhibition added by an upgrade payment
+        self.ticket_ids = ticket_ids  # every ticket covered by a group payment (ticket_id is the first)
+        self.status = status  # PENDING -> AUTHORIZED -> SETTLED, or FAILED (see gateway.py)
+        self.auth_ref = None  # gateway authorization reference
+        self.covers = covers  # (ticket type, price, ex_ids) of each ticket paid for, as at purchase time
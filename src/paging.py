@@ -0,0 +1,91 @@
+"""
+paging.py - Page-at-a-time row sources for the GUI's table views
+"""
+
+from itertools import islice
+
+def _sort_value(value):
+    # None sorts last; everything else compares within its own column type
+    return (value is None, value if value is not None else 0)
+
+class RowSource:
+    """Rows for one paged table, fetched a page at a time.
+
+    `items()` returns an iterator of (key, obj), `row(obj)` the tuple of column
+    values shown for it and `lookup(key)` the object again. In the default
+    order a page is read straight off the iterator, so opening a view costs
+    one page however many rows exist. Sorting or filtering scans the rows once
+    and keeps only the matching keys in order; rows are still built per page.
+    """
+
+    def __init__(self, items, row, lookup, count=None):
+        self.items = items
+        self.row = row
+        self.lookup = lookup
+        self._count = count    # cheap total for the unfiltered view, e.g. len of the table
+        self.filter_text = ""
+        self.sort_column = None
+        self.reverse = False
+        self._keys = None      # ordered matching keys once sorted or filtered
+
+    def set_filter(self, text):
+        self.filter_text = (text or "").strip().casefold()
+        self._keys = None
+
+    def sort_by(self, column):
+        """Sort on column index `column`; asking for the same column again flips the order."""
+        self.reverse = not self.reverse if column == self.sort_column else False
+        self.sort_column = column
+        self._keys = None
+
+    def invalidate(self):
+        self._keys = None
+
+    def _ordered_keys(self):
+        if self._keys is None:
+            matches = []
+            for key, obj in self.items():
+                values = self.row(obj)
+                if self.filter_text and not any(self.filter_text in str(v).casefold() for v in values if v is not None):
+                    continue
+                matches.append((_sort_value(values[self.sort_column]) if self.sort_column is not None else None, key))
+            if self.sort_column is not None:
+                matches.sort(key=lambda m: m[0], reverse=self.reverse)
+            self._keys = [key for _, key in matches]
+        return self._keys
+
+    def count(self):
+        if not self.filter_text and self.sort_column is None and self._count is not None:
+            return self._count()
+        return len(self._ordered_keys())
+
+    def page(self, number, size):
+        """(key, row) pairs of page `number` (0-based)."""
+        start = number * size
+        if not self.filter_text and self.sort_column is None:
+            return [(key, self.row(obj)) for key, obj in islice(self.items(), start, start + size)]
+        rows = []
+        for key in self._ordered_keys()[start:start + size]:
+            obj = self.lookup(key)
+            if obj is not None:
+                rows.append((key, self.row(obj)))
+        return rows
+
+def table_source(table, row, keys=None):
+    """RowSource over a storage collection, or over just `keys` of it (e.g. one attendee's tickets)."""
+    if keys is None:
+        return RowSource(table.items, row, table.get, count=lambda: len(table))
+    def items():
+        for key in list(keys):
+            obj = table.get(key)
+            if obj is not None:
+                yield key, obj
+    return RowSource(items, row, table.get, count=lambda: len(keys))
+
+def dict_source(mapping_fn):
+    """RowSource showing the {key: value} dict returned by `mapping_fn` (e.g. daily sales) as (key, value) rows."""
+    def lookup(key):
+        value = mapping_fn().get(key)
+        return (key, value) if value is not None else None
+    return RowSource(lambda: ((k, (k, v)) for k, v in mapping_fn().items()), lambda pair: pair, lookup,
+                     count=lambda: len(mapping_fn()))
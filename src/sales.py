@@ -0,0 +1,94 @@
+"""
+sales.py - Incrementally maintained sales rollups for GreenWave
+"""
+
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime
+
+def _day(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+class SalesLedger:
+    """Running revenue totals, updated once per recorded payment.
+
+    Totals are split by day, hour, ticket type, payment method and exhibition,
+    so dashboard queries cost O(number of buckets) instead of O(payments).
+    Ticket purchases are split evenly over the exhibitions the ticket covered
+    when it was bought (`Payment.covers`), so later upgrades do not move them;
+    upgrade payments go to the exhibition they added (`Payment.ex_id`).
+    """
+
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
+        self.by_day = {}         # "YYYY-MM-DD" -> revenue
+        self.by_hour = {}        # "YYYY-MM-DD HH:00" -> revenue
+        self.by_type = {}        # ticket type -> revenue
+        self.by_method = {}      # payment method -> revenue
+        self.by_exhibition = {}  # ex_id ("ALL" for all-access) -> revenue
+        self._days = []          # sorted keys of by_day, for range queries
+        self.counted = set()     # pay_ids currently included
+
+    @staticmethod
+    def _add(bucket, key, amount):
+        bucket[key] = bucket.get(key, 0.0) + amount
+
+    def record(self, payment, ticket=None, sign=1, tickets=None):
+        """Add a payment to every bucket; sign=-1 takes it back out.
+
+        The amount is split over the tickets in `Payment.covers` in proportion
+        to their prices. Payments stored before `covers` existed fall back to
+        the live `ticket` (or a group payment's `tickets`).
+        """
+        amount = sign * payment.amount
+        day = payment.timestamp.date().isoformat()
+        if day not in self.by_day:
+            insort(self._days, day)
+        self._add(self.by_day, day, amount)
+        self._add(self.by_hour, payment.timestamp.strftime("%Y-%m-%d %H:00"), amount)
+        self._add(self.by_method, payment.method, amount)
+        for kind, part, exhibitions in self._parts(payment, amount, ticket, tickets):
+            self._add(self.by_type, kind, part)
+            if payment.ex_id is not None:
+                exhibitions = [payment.ex_id]
+            elif not exhibitions:
+                exhibitions = ["Unknown"]
+            share = part / len(exhibitions)
+            for ex_id in exhibitions:
+                self._add(self.by_exhibition, ex_id, share)
+        self.total += amount
+        self.count += sign
+        if sign > 0:
+            self.counted.add(payment.pay_id)
+        else:
+            self.counted.discard(payment.pay_id)
+
+    @staticmethod
+    def _parts(payment, amount, ticket, tickets):
+        # (ticket type, share of amount, ex_ids) per ticket paid for
+        if payment.covers:
+            covers = payment.covers
+        elif tickets:
+            covers = [(t.type, t.price, t.access_exhibitions) for t in tickets]
+        else:
+            covers = [(ticket.type, 0, ticket.access_exhibitions) if ticket is not None else ("Unknown", 0, ())]
+        priced = sum(price for _, price, _ in covers)
+        return [(kind, amount * price / priced if priced else amount / len(covers), exhibitions)
+                for kind, price, exhibitions in covers]
+
+    def daily(self):
+        return {day: self.by_day[day] for day in self._days}
+
+    def revenue_between(self, start, end):
+        """Revenue for days in [start, end]; dates, datetimes or ISO strings."""
+        lo = bisect_left(self._days, _day(start))
+        hi = bisect_right(self._days, _day(end))
+        return sum(self.by_day[day] for day in self._days[lo:hi])
+
+    def top_days(self, n=5):
+        return heapq.nlargest(n, self.by_day.items(), key=lambda item: item[1])
@@ -0,0 +1,135 @@
+"""
+schedule.py - Per-attendee itineraries for workshop time-conflict checks
+"""
+
+import threading
+from bisect import bisect_left
+
+LIVE = ("CONFIRMED", "WAITLISTED")  # reservations that hold a slot in the attendee's day
+
+def _span(ws):
+    return (ws.start_time, ws.end_time()) if ws.start_time is not None else None
+
+class Schedule:
+    """Sorted (start, end, res_id) intervals of each attendee's live reservations.
+
+    An itinerary is built from the attendee's reservations the first time it
+    is needed. Next to it is kept the running maximum of the end times, so a
+    new interval is checked by a bisect plus a walk left over the intervals
+    that can still reach it. Bookings made through `book` never overlap and
+    the walk then stops after one step; itineraries rebuilt from older data
+    or after a workshop was rescheduled may overlap, and are still checked
+    against every interval.
+
+    `book` and `release` are linear in the itinerary's length: the list
+    insert or delete shifts the later intervals and the running maximum is
+    recomputed from that position. An itinerary only holds one attendee's
+    reservations, so this stays small next to the reservation itself.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._itineraries = {}  # attendee_id -> sorted list of (start, end, res_id)
+        self._reach = {}        # attendee_id -> running max of the itinerary's end times
+        self._times = {}        # ws_id -> (start, end) the itineraries were built with
+        self._lock = threading.RLock()
+
+    def _interval(self, ws):
+        span = _span(ws)
+        if span is not None:
+            self._times[ws.ws_id] = span
+        return span
+
+    def _itinerary(self, attendee_id):
+        items = self._itineraries.get(attendee_id)
+        if items is None:
+            items = []
+            att = self.store.attendees.get(attendee_id)
+            for res_id in (att.reservations if att else ()):
+                res = self.store.reservations.get(res_id)
+                ws = self.store.workshops.get(res.ws_id) if res is not None and res.status in LIVE else None
+                span = self._interval(ws) if ws is not None else None
+                if span is not None:
+                    items.append(span + (res_id,))
+            items.sort()
+            self._itineraries[attendee_id] = items
+            self._reach[attendee_id] = reach = []
+            self._extend_reach(items, reach, 0)
+        return items
+
+    @staticmethod
+    def _extend_reach(items, reach, i):
+        # recompute the running max end from position i on
+        del reach[i:]
+        for item in items[i:]:
+            reach.append(max(reach[-1], item[1]) if reach else item[1])
+
+    def _clash(self, attendee_id, start, end):
+        items = self._itinerary(attendee_id)
+        reach = self._reach[attendee_id]
+        i = bisect_left(items, (end,)) - 1  # last interval starting before `end`
+        while i >= 0 and reach[i] > start:
+            if items[i][1] > start:
+                return items[i]
+            i -= 1
+        return None
+
+    def conflict(self, attendee_id, ws):
+        """Reservation id already booked in `ws`'s time slot, or None."""
+        with self._lock:
+            span = self._interval(ws)
+            if span is None:
+                return None
+            clash = self._clash(attendee_id, *span)
+            return clash[2] if clash else None
+
+    def book(self, res, ws):
+        """Add `res` to its attendee's itinerary, or raise ValueError if the slot is taken."""
+        with self._lock:
+            span = self._interval(ws)
+            if span is None:
+                return
+            clash = self._clash(res.attendee_id, *span)
+            if clash is not None:
+                other = self.store.reservations.get(clash[2])
+                booked = self.store.workshops.get(other.ws_id) if other is not None else None
+                raise ValueError(f"Overlaps with {booked.title if booked else clash[2]} at "
+                                 f"{clash[0]:%Y-%m-%d %H:%M}.")
+            items = self._itineraries[res.attendee_id]
+            item = span + (res.res_id,)
+            i = bisect_left(items, item)
+            items.insert(i, item)
+            self._extend_reach(items, self._reach[res.attendee_id], i)
+
+    def release(self, res):
+        """Take a cancelled reservation out of its attendee's itinerary."""
+        with self._lock:
+            items = self._itineraries.get(res.attendee_id)
+            if items is None:
+                return
+            span = self._times.get(res.ws_id)
+            i = bisect_left(items, span + (res.res_id,)) if span is not None else len(items)
+            if not (i < len(items) and items[i][2] == res.res_id):
+                i = next((i for i, item in enumerate(items) if item[2] == res.res_id), None)
+                if i is None:
+                    return
+            del items[i]
+            self._extend_reach(items, self._reach[res.attendee_id], i)
+
+    def workshop_changed(self, ws):
+        # itineraries hold copies of workshop times; a rescheduled workshop invalidates them
+        with self._lock:
+            known = self._times.get(ws.ws_id)
+            if known is not None and known != _span(ws):
+                self.forget()
+
+    def forget(self, attendee_id=None):
+        """Drop one attendee's itinerary (or all) so it is rebuilt from storage on next use."""
+        with self._lock:
+            if attendee_id is None:
+                self._itineraries.clear()
+                self._reach.clear()
+                self._times.clear()
+            else:
+                self._itineraries.pop(attendee_id, None)
+                self._reach.pop(attendee_id, None)
@@ -0,0 +1,54 @@
+"""
+seats.py - Per-workshop seat allocation for GreenWave
+"""
+
+import threading
+from contextlib import ExitStack, contextmanager
+
+class SeatAllocator:
+    """Atomic check-and-reserve of workshop seats.
+
+    Each workshop gets its own lock, so bookings for different workshops never
+    wait on each other. Seats are held in `Workshop.attendee_ids` (a set of
+    reservation ids), which keeps claim and release O(1).
+    """
+
+    def __init__(self):
+        self._locks = {}  # ws_id -> RLock
+        self._guard = threading.Lock()
+
+    def lock_for(self, ws_id):
+        lock = self._locks.get(ws_id)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.setdefault(ws_id, threading.RLock())
+        return lock
+
+    @contextmanager
+    def holding(self, ws_id):
+        """Hold the workshop lock for a whole check-reserve-persist sequence."""
+        with self.lock_for(ws_id):
+            yield
+
+    @contextmanager
+    def holding_all(self, ws_ids):
+        """Hold several workshop locks, taken in sorted order so batches cannot deadlock."""
+        with ExitStack() as stack:
+            for ws_id in sorted(set(ws_ids)):
+                stack.enter_context(self.lock_for(ws_id))
+            yield
+
+    def claim(self, ws, res_id):
+        with self.lock_for(ws.ws_id):
+            if res_id in ws.attendee_ids:
+                return
+            if ws.available_spots() <= 0:
+                raise OverflowError("No seats available.")
+            ws.attendee_ids.add(res_id)
+
+    def release(self, ws, res_id):
+        with self.lock_for(ws.ws_id):
+            if res_id in ws.attendee_ids:
+                ws.attendee_ids.discard(res_id)
+                return True
+            return False
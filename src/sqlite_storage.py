@@ -0,0 +1,308 @@
+"""
+sqlite_storage.py - SQLite persistence backend for GreenWave
+"""
+
+import os
+import pickle
+import sqlite3
+import urllib.parse
+import weakref
+from collections.abc import MutableMapping
+from .storage import BaseStorage, DATA_DIR, KEYS, ensure_data_dir, _restore
+from .filelock import FileLock
+from .journal import PUT
+from .codec import encode, decode
+from .events import change_event
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendees (
+    user_id TEXT PRIMARY KEY, name TEXT, email TEXT, email_fold TEXT, data BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS attendees_email ON attendees(email_fold);
+CREATE TABLE IF NOT EXISTS exhibitions (
+    ex_id TEXT PRIMARY KEY, title TEXT, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS workshops (
+    ws_id TEXT PRIMARY KEY, title TEXT, ex_id TEXT, capacity INTEGER, start_time TEXT, data BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS workshops_ex ON workshops(ex_id);
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id TEXT PRIMARY KEY, owner_id TEXT, type TEXT, price REAL, data BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS tickets_owner ON tickets(owner_id);
+CREATE TABLE IF NOT EXISTS payments (
+    pay_id TEXT PRIMARY KEY, ticket_id TEXT, amount REAL, method TEXT, timestamp TEXT, data BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS payments_ticket ON payments(ticket_id);
+CREATE INDEX IF NOT EXISTS payments_timestamp ON payments(timestamp);
+CREATE TABLE IF NOT EXISTS reservations (
+    res_id TEXT PRIMARY KEY, ticket_id TEXT, ws_id TEXT, attendee_id TEXT, status TEXT, data BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS reservations_ticket ON reservations(ticket_id);
+CREATE INDEX IF NOT EXISTS reservations_ws ON reservations(ws_id);
+"""
+
+def _fold(value):
+    return value.casefold() if value is not None else None
+
+# collection -> queryable columns stored next to the encoded object
+COLUMNS = {
+    "attendees": (("name", lambda a: a.name), ("email", lambda a: a.email),
+                  ("email_fold", lambda a: _fold(a.email))),
+    "exhibitions": (("title", lambda e: e.title),),
+    "workshops": (("title", lambda w: w.title), ("ex_id", lambda w: w.ex_id),
+                  ("capacity", lambda w: w.capacity), ("start_time", lambda w: w.start_time.isoformat())),
+    "tickets": (("owner_id", lambda t: t.owner_id), ("type", lambda t: t.type), ("price", lambda t: t.price)),
+    "payments": (("ticket_id", lambda p: p.ticket_id), ("amount", lambda p: p.amount),
+                 ("method", lambda p: p.method), ("timestamp", lambda p: p.timestamp.isoformat())),
+    "reservations": (("ticket_id", lambda r: r.ticket_id), ("ws_id", lambda r: r.ws_id),
+                     ("attendee_id", lambda r: r.attendee_id), ("status", lambda r: r.status)),
+}
+
+PAGE_SIZE = 500  # rows fetched per query when iterating a table
+
+_DELETED = object()  # tombstone in SqliteTable._pending
+
+class SqliteTable(MutableMapping):
+    """Dict-like view of one table.
+
+    Loaded objects are kept in a weak identity map, so code holding an object
+    (e.g. the GUI's active user) sees the same instance logic.py mutates.
+    Objects written or deleted inside an open transaction stay in `_pending`
+    (deletes as a tombstone) until the backend commits them.
+    """
+
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.key = KEYS[name]
+        self._cache = weakref.WeakValueDictionary()
+        self._pending = {}  # key -> object (or _DELETED) not yet committed
+
+    def _query(self, sql, params=()):
+        with self.db._lock:
+            return self.db.conn.execute(sql, params).fetchall()
+
+    def _object(self, key, data):
+        obj = self._pending.get(key)
+        if obj is None:
+            obj = self._cache.get(key)
+        if obj is None:
+            obj = decode(pickle.loads(data))
+            self._cache[key] = obj
+        return obj
+
+    def __getitem__(self, key):
+        obj = self._pending.get(key)
+        if obj is _DELETED:
+            raise KeyError(key)
+        if obj is None:
+            obj = self._cache.get(key)
+        if obj is not None:
+            return obj
+        rows = self._query(f"SELECT data FROM {self.name} WHERE {self.key} = ?", (key,))
+        if not rows:
+            raise KeyError(key)
+        return self._object(key, rows[0][0])
+
+    def __setitem__(self, key, obj):
+        self._pending[key] = obj
+        self._cache[key] = obj
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        # the row goes in the flush that commits the delete, or stays if it is rolled back
+        self._pending[key] = _DELETED
+        self._cache.pop(key, None)
+
+    def __contains__(self, key):
+        if key in self._pending:
+            return self._pending[key] is not _DELETED
+        if key in self._cache:
+            return True
+        return bool(self._query(f"SELECT 1 FROM {self.name} WHERE {self.key} = ?", (key,)))
+
+    def _stored(self, key):
+        return bool(self._query(f"SELECT 1 FROM {self.name} WHERE {self.key} = ?", (key,)))
+
+    def __len__(self):
+        count = self._query(f"SELECT COUNT(*) FROM {self.name}")[0][0]
+        for key, obj in list(self._pending.items()):
+            if obj is _DELETED:
+                count -= self._stored(key)
+            elif not self._stored(key):
+                count += 1
+        return count
+
+    def items(self):
+        # keyset paging keeps memory bounded and no cursor open between pages
+        last, seen = 0, set()
+        while True:
+            rows = self._query(
+                f"SELECT rowid, {self.key}, data FROM {self.name} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last, PAGE_SIZE))
+            if not rows:
+                break
+            for rowid, key, data in rows:
+                if key in self._pending:
+                    seen.add(key)
+                    if self._pending.get(key) is _DELETED:
+                        continue
+                yield key, self._object(key, data)
+            last = rows[-1][0]
+        for key, obj in list(self._pending.items()):
+            if key not in seen and obj is not _DELETED:
+                yield key, obj
+
+    def __iter__(self):
+        for key, _ in self.items():
+            yield key
+
+    def values(self):
+        for _, obj in self.items():
+            yield obj
+
+    def keys(self):
+        return iter(self)
+
+    def lookup(self, column, value):
+        """Objects whose indexed `column` equals `value`, committed or pending."""
+        rows = self._query(f"SELECT {self.key} FROM {self.name} WHERE {column} = ? ORDER BY rowid", (value,))
+        found = [self[key] for (key,) in rows if self._pending.get(key) is not _DELETED]
+        getter = dict(COLUMNS[self.name])[column]
+        known = {getattr(obj, self.key) for obj in found}
+        for key, obj in list(self._pending.items()):
+            if key not in known and obj is not _DELETED and getter(obj) == value:
+                found.append(obj)
+        return found
+
+    def settle(self, key):
+        self._pending.pop(key, None)
+
+    def refresh(self):
+        """Re-read every cached object in place from the database; returns the (key, obj) that changed."""
+        changed = []
+        for key, obj in list(self._cache.items()):
+            if key in self._pending:
+                continue
+            rows = self._query(f"SELECT data FROM {self.name} WHERE {self.key} = ?", (key,))
+            if not rows:
+                self._cache.pop(key, None)
+                continue
+            row = pickle.loads(rows[0][0])
+            if row != encode(obj):
+                _restore(obj, decode(row))
+                changed.append((key, obj))
+        return changed
+
+class SqliteStorage(BaseStorage):
+    """SQLite backend: one table per collection, WAL mode, one SQL transaction per flush.
+
+    With `shared=True` mutations run under the same kind of file lock as the
+    pickle backend, so a read-check-write sequence (e.g. claiming a seat)
+    cannot interleave with another process. `PRAGMA data_version` tells us
+    when another connection committed; cached objects are then re-read in
+    place and the sales ledger is rebuilt.
+
+    With `read_only=True` the database must already exist; it is opened in
+    SQLite's read-only mode and nothing is seeded.
+    """
+
+    def __init__(self, data_dir=None, path=None, seed=True, shared=False, read_only=False):
+        super().__init__()
+        self.data_dir = data_dir or DATA_DIR
+        self.path = path or os.path.join(self.data_dir, "greenwave.db")
+        self.read_only = read_only
+        if read_only:
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(f"No GreenWave database at {self.path}")
+            uri = "file:" + urllib.parse.quote(os.path.abspath(self.path)) + "?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+            seed = False
+        else:
+            ensure_data_dir(self.data_dir)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+        for name in KEYS:
+            setattr(self, name, SqliteTable(self, name))
+        self._data_version = None
+        if shared:
+            self.process_lock = FileLock(self.path + ".lock")
+        with self._exclusive():
+            if seed and not len(self.workshops):
+                self._seed_demo_data()
+            if not read_only:
+                self._ensure_exhibitions()
+
+    def _upsert_sql(self, collection):
+        columns = [KEYS[collection]] + [c for c, _ in COLUMNS[collection]] + ["data"]
+        marks = ", ".join("?" * len(columns))
+        return f"INSERT OR REPLACE INTO {collection} ({', '.join(columns)}) VALUES ({marks})"
+
+    def _flush(self, records):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for op, collection, key, obj in records:
+                    if op == PUT:
+                        row = [key] + [get(obj) for _, get in COLUMNS[collection]]
+                        row.append(pickle.dumps(encode(obj), protocol=pickle.HIGHEST_PROTOCOL))
+                        self.conn.execute(self._upsert_sql(collection), row)
+                    else:
+                        self.conn.execute(f"DELETE FROM {collection} WHERE {KEYS[collection]} = ?", (key,))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _sync(self):
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return None
+        self._data_version, first = version, self._data_version is None
+        if first:
+            return None
+        events = []
+        for name in KEYS:
+            for key, obj in getattr(self, name).refresh():
+                events.append(change_event(name, key, obj))
+        self._sales = None
+        # other connections may have queued, promoted or cancelled anyone
+        self.waitlist.forget()
+        self.schedule.forget()
+        self.catalog.forget()
+        return events if self.events.active else None
+
+    def _settle(self, collection, key):
+        getattr(self, collection).settle(key)
+
+    def _rolled_back(self, collection, key):
+        getattr(self, collection).settle(key)
+
+    def bulk_load(self, source):
+        """Copy every collection of another storage backend in one SQL transaction."""
+        records = []
+        for name in KEYS:
+            for key, obj in getattr(source, name).items():
+                records.append((PUT, name, key, obj))
+        with self._lock:
+            self._persist(records)
+        self.flush()
+        return len(records)
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self.conn.close()
+        if self.process_lock is not None:
+            self.process_lock.close()
+
+    def find_attendee_by_email(self, email):
+        found = self.attendees.lookup("email_fold", _fold(email))
+        return found[0] if found else None
+
+    def tickets_for_owner(self, owner_id):
+        return self.tickets.lookup("owner_id", owner_id)
+
+    def reservations_for_ticket(self, ticket_id):
+        return self.reservations.lookup("ticket_id", ticket_id)
+
+    def reservations_for_workshop(self, ws_id):
+        return self.reservations.lookup("ws_id", ws_id)
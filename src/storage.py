@@ -1,29 +1,64 @@
-
 """
 storage.py - Persistence layer using pickle for GreenWave
 """
 
+import atexit
+import copy
 import os
 import pickle
+import threading
 import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from .models import Attendee, Exhibition, Workshop
+from .models import Attendee, Exhibition, Workshop, Payment
+from .journal import Journal, PUT, DELETE
+from .seats import SeatAllocator
+from .waitlist import Waitlist
+from .schedule import Schedule
+from .catalog import Catalog
+from .codec import encode_table, decode_table
+from .writebehind import WriteBehind
+from .sales import SalesLedger
+from .metrics import registry as metrics
+from .filelock import FileLock
+from .events import EventBus, change_event
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+BACKEND = os.environ.get("GREENWAVE_BACKEND", "pickle")  # "pickle" or "sqlite"
+SHARED = os.environ.get("GREENWAVE_SHARED") == "1"  # several processes use one data dir
+DATA_DIR = os.environ.get("GREENWAVE_DATA_DIR") or os.path.join(os.path.dirname(__file__), "..", "data")
 ATTENDEES_FILE = os.path.join(DATA_DIR, "attendees.pkl")
 WORKSHOPS_FILE = os.path.join(DATA_DIR, "workshops.pkl")
 TICKETS_FILE = os.path.join(DATA_DIR, "tickets.pkl")
 PAYMENTS_FILE = os.path.join(DATA_DIR, "payments.pkl")
 RESERVATIONS_FILE = os.path.join(DATA_DIR, "reservations.pkl")
 
-def ensure_data_dir():
-    os.makedirs(DATA_DIR, exist_ok=True)
+# compact the journal into fresh snapshots once it holds this many records
+COMPACT_THRESHOLD = 5000
+COMPACT_INTERVAL = 30.0  # seconds between background compaction checks
+
+# primary key attribute of each persisted collection
+KEYS = {
+    "attendees": "user_id",
+    "workshops": "ws_id",
+    "tickets": "ticket_id",
+    "payments": "pay_id",
+    "reservations": "res_id",
+    "exhibitions": "ex_id",
+}
+
+def ensure_data_dir(data_dir=DATA_DIR):
+    os.makedirs(data_dir, exist_ok=True)
 
 def safe_save(path, obj):
     tmp = path + ".tmp"
     with open(tmp, "wb") as f:
         pickle.dump(obj, f)
+        written = f.tell()
     os.replace(tmp, path)
+    if metrics.enabled:
+        metrics.add("storage.snapshot_bytes", written)
+    return written
 
 def safe_load(path, default):
     if not os.path.exists(path):
@@ -31,83 +66,822 @@ def safe_load(path, default):
     with open(path, "rb") as f:
         return pickle.load(f)
 
-class Storage:
+class _Index:
+    """Secondary index on one attribute of a collection.
+
+    Remembers the value each key was indexed under, so re-adding an object
+    whose attribute changed moves it instead of leaving a stale entry.
+    """
+
+    def __init__(self, attr, unique=False, fold=False):
+        self.attr = attr
+        self.unique = unique
+        self.fold = fold
+        self.entries = {}  # value -> key (unique) or set of keys
+        self.current = {}  # key -> value it is indexed under
+
+    def _value(self, obj):
+        value = getattr(obj, self.attr)
+        return value.casefold() if self.fold and value is not None else value
+
+    def add(self, key, obj):
+        value = self._value(obj)
+        if key in self.current:
+            if self.current[key] == value:
+                return
+            self.discard(key)
+        self.current[key] = value
+        if self.unique:
+            self.entries[value] = key
+        else:
+            self.entries.setdefault(value, set()).add(key)
+
+    def discard(self, key):
+        if key not in self.current:
+            return
+        value = self.current.pop(key)
+        if self.unique:
+            if self.entries.get(value) == key:
+                del self.entries[value]
+        else:
+            keys = self.entries.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.entries[value]
+
+    def lookup(self, value):
+        if self.fold and value is not None:
+            value = value.casefold()
+        if self.unique:
+            return self.entries.get(value)
+        return self.entries.get(value, ())
+
+# collection -> indexes maintained by the CRUD helpers
+INDEXES = {
+    "attendees": (("email", True, True),),
+    "tickets": (("owner_id", False, False),),
+    "reservations": (("ticket_id", False, False), ("ws_id", False, False)),
+}
+
+def save_table(path, table):
+    return safe_save(path, encode_table(table))
+
+def load_table(path, key_attr):
+    # accepts both the compact encoding and the older {key: object} pickles
+    return decode_table(safe_load(path, {}), key_attr)
+
+def _stamp(path):
+    # changes whenever the file is replaced by safe_save
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _restore(obj, image):
+    # put the saved state back into the same instance so outside references stay valid
+    obj.__setstate__(image.__getstate__())
+
+class TransactionConflict(RuntimeError):
+    """Two transactions each waited for an object the other one changed; this one was rolled back."""
+
+_IN_BEFORE = object()  # savepoint image: use (and take back) the transaction's before-image
+
+class _Transaction:
+    def __init__(self):
+        self.before = {}  # (collection, key) -> deep copy of the object, or None if new
+        self.dirty = {}   # (collection, key) -> object to persist at commit
+        self.after = []   # callbacks to run once committed
+        self.savepoints = []  # open savepoints, innermost last: {(collection, key): image} each
+        self.owned = []       # (collection, key) of every object this transaction has claimed
+        self.waiting = None   # (collection, key) it is waiting to claim
+
+    def remember(self, collection, key, obj):
+        first = (collection, key) not in self.before
+        if first:
+            self.before[(collection, key)] = copy.deepcopy(obj) if obj is not None else None
+        for images in self.savepoints:
+            if (collection, key) not in images:
+                # first touched in the savepoint: the transaction's image is the one to go back to;
+                # otherwise an own copy, since a restored image is handed to the live object
+                images[(collection, key)] = _IN_BEFORE if first else copy.deepcopy(obj) if obj is not None else None
+
+class BaseStorage(ABC):
+    """Repository interface shared by the pickle and SQLite backends.
+
+    Collections (`attendees`, `workshops`, `tickets`, `payments`,
+    `reservations`, `exhibitions`) are dict-like and keyed by id. All writes go
+    through the CRUD helpers so backends only have to implement `_flush` and
+    the indexed lookups.
+    """
+
     def __init__(self):
-        ensure_data_dir()
-        self.attendees = safe_load(ATTENDEES_FILE, {})  # user_id -> Attendee
-        self.workshops = safe_load(WORKSHOPS_FILE, {})  # ws_id -> Workshop
-        self.tickets = safe_load(TICKETS_FILE, {})      # ticket_id -> Ticket
-        self.payments = safe_load(PAYMENTS_FILE, {})    # pay_id -> Payment
-        self.reservations = safe_load(RESERVATIONS_FILE, {})  # res_id -> Reservation
-        self.exhibitions = {}  # ex_id -> Exhibition
-        if not self.workshops:
-            self._seed_demo_data()
-            self.save_all()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._open_tx = 0
+        self._owned = {}  # (collection, key) -> _Transaction that changed it and has not finished
+        self._owners = threading.Condition()
+        self.seats = SeatAllocator()
+        self.waitlist = Waitlist(self)
+        self.schedule = Schedule(self)
+        self.catalog = Catalog(self)
+        self.writer = None
+        self._sales = None
+        self.process_lock = None  # FileLock when the data is shared with other processes
+        self.events = EventBus()
 
     def _seed_demo_data(self):
         # create 3 exhibitions, each with 3 workshops
-        for i, ex in enumerate(["ClimateTech", "Policy", "Community"], start=1):
-            ex_id = f"EX{i}"
-            self.exhibitions[ex_id] = Exhibition(ex_id, ex)
-            for j in range(1,4):
-                ws_id = f"WS{ i }{ j }"
-                title = f"{ex} Workshop {j}"
-                start_time = datetime.now() + timedelta(days=j, hours=i)
-                ws = Workshop(ws_id, title, ex_id, capacity=10 + 5*j, start_time=start_time)
-                self.workshops[ws_id] = ws
-                self.exhibitions[ex_id].workshops.append(ws_id)
+        with self.transaction():
+            for i, ex in enumerate(["ClimateTech", "Policy", "Community"], start=1):
+                ex_id = f"EX{i}"
+                exhibition = Exhibition(ex_id, ex)
+                for j in range(1,4):
+                    ws_id = f"WS{ i }{ j }"
+                    title = f"{ex} Workshop {j}"
+                    start_time = datetime.now() + timedelta(days=j, hours=i)
+                    ws = Workshop(ws_id, title, ex_id, capacity=10 + 5*j, start_time=start_time)
+                    self.update_workshop(ws)
+                    exhibition.workshops.append(ws_id)
+                self.add_exhibition(exhibition)
+
+    def _ensure_exhibitions(self):
+        # data written before exhibitions were persisted only has workshops
+        if len(self.exhibitions) or not len(self.workshops):
+            return
+        derived = {}
+        for ws in self.workshops.values():
+            derived.setdefault(ws.ex_id, Exhibition(ws.ex_id, ws.ex_id)).workshops.append(ws.ws_id)
+        with self.transaction():
+            for exhibition in derived.values():
+                self.add_exhibition(exhibition)
+
+    # unit of work
+    @contextmanager
+    def transaction(self):
+        """Group mutations into one durable write.
+
+        Changes made through the CRUD helpers are flushed once when the block
+        exits; if it raises, touched objects are restored in memory and nothing
+        is written. Nested blocks join the outermost transaction.
+
+        Transactions on different threads run side by side, but an object
+        touched by one is claimed until it commits or rolls back: another
+        transaction (or a write outside one) touching it waits, so a rollback
+        never puts back an image over someone else's change. A transaction
+        whose wait would close a cycle raises TransactionConflict instead.
+        Seat locks are taken before the block, never inside it.
+        """
+        if getattr(self._local, "tx", None) is not None:
+            yield self
+            return
+        self._throttle()
+        events = []
+        with self._exclusive():
+            tx = self._local.tx = _Transaction()
+            with self._lock:
+                self._open_tx += 1
+            try:
+                yield self
+                with self._lock:
+                    if tx.dirty:
+                        self._persist([(PUT, c, k, obj) for (c, k), obj in tx.dirty.items()])
+                        if self.events.active:
+                            for (c, k), obj in tx.dirty.items():
+                                image = tx.before.get((c, k))
+                                events.append(change_event(c, k, obj, before=image, new=image is None))
+            except BaseException:
+                self._rollback(tx)
+                raise
+            finally:
+                self._local.tx = None
+                self._release(tx)
+                with self._lock:
+                    self._open_tx -= 1
+        # subscribers hear about a change only once it is committed and the locks are free
+        self._publish(events)
+        for callback in tx.after:
+            callback()
+
+    def after_commit(self, callback):
+        """Call `callback()` once the current transaction has committed (right away outside one).
+
+        Nothing is called if the transaction rolls back.
+        """
+        tx = getattr(self._local, "tx", None)
+        if tx is None:
+            callback()
+        else:
+            tx.after.append(callback)
+
+    @contextmanager
+    def savepoint(self):
+        """Inside a transaction, undo only this block's changes if it raises.
+
+        The exception propagates, but the transaction stays open and commits
+        what was done before and after the block.
+        """
+        tx = getattr(self._local, "tx", None)
+        if tx is None:
+            raise RuntimeError("savepoint() needs an open transaction")
+        callbacks = len(tx.after)
+        images = {}
+        tx.savepoints.append(images)
+        try:
+            yield self
+        except BaseException:
+            tx.savepoints.pop()
+            # objects first touched here leave the transaction; earlier ones stay dirty, as they were
+            restore, earlier = {}, set()
+            for item, image in images.items():
+                if image is _IN_BEFORE:
+                    restore[item] = tx.before.pop(item)
+                    tx.dirty.pop(item, None)
+                else:
+                    restore[item] = image
+                    earlier.add(item)
+            del tx.after[callbacks:]
+            self._undo(restore, keep=earlier)
+            raise
+        tx.savepoints.pop()
+
+    def _rollback(self, tx):
+        self._undo(tx.before)
+
+    def _undo(self, images, keep=()):
+        # put back the before-images; `keep` are still part of the open transaction
+        with self._lock:
+            # newest first, so e.g. a payment is undone while its ticket still exists
+            for (collection, key), image in reversed(images.items()):
+                table = getattr(self, collection)
+                if image is None:
+                    obj = table.pop(key, None)
+                    if collection == "payments" and obj is not None:
+                        self._count_sale(obj, -1)
+                else:
+                    if key in table:
+                        obj = table[key]
+                        _restore(obj, image)
+                    else:
+                        obj = table[key] = image
+                    if collection == "payments":
+                        self._count_sale(obj)
+                if collection == "reservations" and obj is not None:
+                    # the derived queues may hold what was just undone
+                    self.waitlist.forget(obj.ws_id)
+                    self.schedule.forget(obj.attendee_id)
+                elif collection == "workshops":
+                    self.catalog.update(key, obj if image is not None else None)
+                if (collection, key) in keep:
+                    self._reindex(collection, key, table.get(key))
+                else:
+                    self._rolled_back(collection, key)
+
+    def _rolled_back(self, collection, key):
+        self._reindex(collection, key, getattr(self, collection).get(key))
+
+    def touch(self, collection, obj):
+        """Snapshot `obj` before it is mutated in place inside a transaction."""
+        tx = getattr(self._local, "tx", None)
+        if tx is not None:
+            key = getattr(obj, KEYS[collection])
+            self._claim(tx, (collection, key))
+            tx.remember(collection, key, getattr(self, collection).get(key))
+
+    # object claims: lock order is process lock, then claims, then self._lock
+    def _claim(self, tx, item):
+        with self._owners:
+            while True:
+                owner = self._owned.get(item)
+                if owner is None or owner is tx:
+                    break
+                # follow who the owner waits for; reaching ourselves means nobody would ever finish
+                seen, other = set(), owner
+                while other is not None and id(other) not in seen:
+                    if other is tx:
+                        raise TransactionConflict(f"{item[0]} {item[1]} is held by a transaction waiting for this one.")
+                    seen.add(id(other))
+                    other = self._owned.get(other.waiting) if other.waiting is not None else None
+                tx.waiting = item
+                try:
+                    self._owners.wait()
+                finally:
+                    tx.waiting = None
+            if owner is None:
+                self._owned[item] = tx
+                tx.owned.append(item)
+
+    def _release(self, tx):
+        with self._owners:
+            for item in tx.owned:
+                if self._owned.get(item) is tx:
+                    del self._owned[item]
+            tx.owned = []
+            self._owners.notify_all()
+
+    @contextmanager
+    def _claimed(self, tx, item):
+        # inside a transaction: claim the object; outside: wait until no transaction holds it
+        if tx is not None:
+            self._claim(tx, item)
+            yield
+            return
+        with self._owners:
+            self._owners.wait_for(lambda: item not in self._owned)
+            yield
+
+    def _put(self, collection, key, obj):
+        tx = getattr(self._local, "tx", None)
+        if tx is None:
+            self._throttle()
+        with self._exclusive(), self._claimed(tx, (collection, key)), self._lock:
+            table = getattr(self, collection)
+            previous = table.get(key)
+            if tx is not None:
+                tx.remember(collection, key, previous)
+            table[key] = obj
+            self._reindex(collection, key, obj)
+            if collection == "workshops":
+                self.schedule.workshop_changed(obj)
+                self.catalog.update(key, obj)
+            if collection == "payments":
+                self._count_sale(obj)
+            if tx is None:
+                self._persist([(PUT, collection, key, obj)])
+                event = change_event(collection, key, obj, new=previous is None) if self.events.active else None
+            else:
+                tx.dirty[(collection, key)] = obj
+                return
+        self._publish([event])
+
+    def _publish(self, events):
+        events = [e for e in events if e is not None]
+        if events:
+            self.events.publish(events)
+
+    def _reindex(self, collection, key, obj):
+        pass
+
+    # multi-process sharing
+    @contextmanager
+    def _exclusive(self):
+        # the process lock is always taken before self._lock, never while holding it
+        if self.process_lock is None:
+            yield
+            return
+        synced = None
+        try:
+            with self.process_lock as outermost:
+                if outermost:
+                    with self._lock:
+                        synced = self._sync()
+                yield
+        finally:
+            if synced:
+                self._publish(synced)
+
+    def _sync(self):
+        """Apply changes other processes committed since we last held the process lock.
+
+        Returns events for the changed objects when anyone is subscribed.
+        """
+
+    def refresh(self):
+        """Pick up other processes' changes now (no-op unless the data dir is shared)."""
+        with self._exclusive():
+            pass
+
+    @abstractmethod
+    def _flush(self, records):
+        """Durably write a committed batch of (op, collection, key, obj) records."""
+
+    def _settle(self, collection, key):
+        """Called once every queued write of `key` has been flushed."""
+
+    def _persist(self, records):
+        # caller holds self._lock, so records reach the writer in commit order
+        if self.writer is not None:
+            self.writer.submit(records)
+            return
+        self._flush(records)
+        for _, collection, key, _ in records:
+            self._settle(collection, key)
+
+    # write-behind
+    def start_write_behind(self, max_pending=1000, batch_size=256):
+        """Flush commits on a background thread instead of the calling one.
+
+        Not used for shared data: another process may only see a commit once
+        it is on disk, before the process lock is released.
+        """
+        if self.writer is None and self.process_lock is None:
+            self.writer = WriteBehind(self, max_pending=max_pending, batch_size=batch_size)
+            atexit.register(self.flush)
+
+    def _throttle(self):
+        if self.writer is not None:
+            self.writer.throttle()
+
+    def flush(self):
+        """Wait until every committed change is on disk (no-op without write-behind)."""
+        if self.writer is not None:
+            self.writer.flush()
 
     def save_all(self):
-        safe_save(ATTENDEES_FILE, self.attendees)
-        safe_save(WORKSHOPS_FILE, self.workshops)
-        safe_save(TICKETS_FILE, self.tickets)
-        safe_save(PAYMENTS_FILE, self.payments)
-        safe_save(RESERVATIONS_FILE, self.reservations)
+        pass
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
 
     # helper CRUD
     def add_attendee(self, attendee):
-        self.attendees[attendee.user_id] = attendee
-        self.save_all()
+        self._put("attendees", attendee.user_id, attendee)
+
+    def update_attendee(self, attendee):
+        self.add_attendee(attendee)
 
+    @abstractmethod
     def find_attendee_by_email(self, email):
-        for a in self.attendees.values():
-            if a.email.lower() == email.lower():
-                return a
-        return None
+        pass
+
+    @abstractmethod
+    def tickets_for_owner(self, owner_id):
+        pass
+
+    @abstractmethod
+    def reservations_for_ticket(self, ticket_id):
+        pass
+
+    @abstractmethod
+    def reservations_for_workshop(self, ws_id):
+        pass
 
     def add_ticket(self, ticket):
-        self.tickets[ticket.ticket_id] = ticket
-        self.save_all()
+        self._put("tickets", ticket.ticket_id, ticket)
+
+    def update_payment(self, payment):
+        self._put("payments", payment.pay_id, payment)
 
     def add_payment(self, payment):
-        self.payments[payment.pay_id] = payment
-        self.save_all()
+        self._put("payments", payment.pay_id, payment)
 
     def add_reservation(self, reservation):
-        self.reservations[reservation.res_id] = reservation
-        self.save_all()
+        self._put("reservations", reservation.res_id, reservation)
+
+    def update_reservation(self, reservation):
+        self.add_reservation(reservation)
 
     def update_workshop(self, ws):
-        self.workshops[ws.ws_id] = ws
-        self.save_all()
-
-    def upgrade_ticket(self, ticket_id, ex_id, extra_price=20.0):
-        if ticket_id in self.tickets:
-            t = self.tickets[ticket_id]
-            success = t.upgrade_add_exhibition(ex_id, extra_price)
-            if success:
-                self.tickets[ticket_id] = t
-                self.save_all()
-            return success
-        return False
+        self._put("workshops", ws.ws_id, ws)
+
+    def add_exhibition(self, exhibition):
+        self._put("exhibitions", exhibition.ex_id, exhibition)
+
+    def upgrade_ticket(self, ticket_id, ex_id, extra_price=20.0, method="Card"):
+        with self.transaction():
+            if ticket_id in self.tickets:
+                t = self.tickets[ticket_id]
+                self.touch("tickets", t)
+                success = t.upgrade_add_exhibition(ex_id, extra_price)
+                if success:
+                    self._put("tickets", ticket_id, t)
+                    # the extra charge is revenue too
+                    payment = Payment("P"+uuid.uuid4().hex[:8], ticket_id, extra_price, method, ex_id=ex_id)
+                    self.add_payment(payment)
+                    owner = self.attendees.get(t.owner_id)
+                    if owner:
+                        self.touch("attendees", owner)
+                        owner.purchase_history.append(payment.pay_id)
+                        self.update_attendee(owner)
+                return success
+            return False
+
+    # sales rollups
+    @property
+    def sales(self):
+        """SalesLedger over all payments that have not failed, built on first use and kept current by writes."""
+        with self._lock:
+            if self._sales is None:
+                ledger = SalesLedger()
+                for p in self.payments.values():
+                    if p.status != "FAILED":
+                        ledger.record(p, self.tickets.get(p.ticket_id), tickets=self._group_tickets(p))
+                self._sales = ledger
+            return self._sales
+
+    def _group_tickets(self, payment):
+        if not payment.ticket_ids:
+            return None
+        return [t for t in map(self.tickets.get, payment.ticket_ids) if t is not None]
+
+    def _count_sale(self, payment, sign=1):
+        # idempotent: afterwards the payment is in the ledger iff it exists (sign=1) and has not failed
+        if self._sales is None:
+            return
+        wanted = sign > 0 and payment.status != "FAILED"
+        if wanted != (payment.pay_id in self._sales.counted):
+            self._sales.record(payment, self.tickets.get(payment.ticket_id), 1 if wanted else -1,
+                               self._group_tickets(payment))
 
     def daily_sales(self):
-        by_date = {}
-        for p in self.payments.values():
-            date_key = p.timestamp.date().isoformat()
-            by_date.setdefault(date_key, 0.0)
-            by_date[date_key] += p.amount
-        return by_date
-
-# Create a singleton storage instance
-storage = Storage()
+        return self.sales.daily()
+
+class _LazyCollection:
+    """Collection attribute loaded from its snapshot (plus journal) on first access."""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, storage, owner=None):
+        if storage is None:
+            return self
+        return storage._load_collection(self.name)
+
+class Storage(BaseStorage):
+    """Pickle backend: everything in memory, snapshots plus an optional journal.
+
+    Each collection is unpickled the first time it is used, so e.g. payments
+    are not read until something needs them.
+
+    With `shared=True` several processes can use one data directory: every
+    mutation runs under an advisory file lock, and on taking it a process
+    replays the journal records others appended since its last look. When
+    another process compacted (the generation in the lock file changed), only
+    the collections whose snapshot file was rewritten are reloaded. Objects
+    are updated in place, so a workshop read before the lock was taken has
+    the current seats by the time `SeatAllocator.claim` checks them: a
+    booking is merged onto the latest seat set or rejected if it is full.
+
+    With `read_only=True` (exports, migration sources) the data directory is
+    only read: it must already hold data, nothing is seeded, compacted or
+    truncated, and writes raise RuntimeError.
+    """
+
+    attendees = _LazyCollection()     # user_id -> Attendee
+    workshops = _LazyCollection()     # ws_id -> Workshop
+    tickets = _LazyCollection()       # ticket_id -> Ticket
+    payments = _LazyCollection()      # pay_id -> Payment
+    reservations = _LazyCollection()  # res_id -> Reservation
+    exhibitions = _LazyCollection()   # ex_id -> Exhibition
+
+    def __init__(self, data_dir=None, journaled=True, compact_interval=COMPACT_INTERVAL, shared=False,
+                 read_only=False):
+        super().__init__()
+        if shared and not journaled:
+            raise ValueError("Shared storage needs the journal")
+        self.data_dir = data_dir or DATA_DIR
+        self.read_only = read_only
+        self.files = {name: os.path.join(self.data_dir, name + ".pkl") for name in KEYS}
+        journal_path = os.path.join(self.data_dir, "journal.log")
+        if read_only:
+            if shared:
+                raise ValueError("Read-only storage cannot join a shared data directory")
+            if not any(os.path.exists(path) for path in self.files.values()):
+                raise FileNotFoundError(f"No GreenWave snapshot files in {self.data_dir}")
+            journaled = journaled and os.path.exists(journal_path)
+        else:
+            ensure_data_dir(self.data_dir)
+        self._indexes = {}
+        self._stamps = {}         # collection -> snapshot file stamp when loaded or saved
+        self._generation = None   # compaction generation our journal offset belongs to
+        self._applied = None      # events for records applied by _sync, when anyone listens
+        self._offset = 0          # journal bytes already applied to loaded collections
+        self.journal = None
+        if journaled:
+            self.journal = Journal(journal_path, read_only=read_only)
+        if shared:
+            self.process_lock = FileLock(os.path.join(self.data_dir, "storage.lock"))
+        with self._exclusive():
+            if self.journal is not None and not read_only:
+                # a crash mid-append leaves a torn batch; cut it off before appending after it
+                self.journal.recover()
+            if self.journal is not None:
+                self.journal.records = self.journal.count()
+            if shared:
+                # load everything up front, while no other process can write
+                for name in KEYS:
+                    getattr(self, name)
+            if not read_only:
+                if not self.workshops:
+                    self._seed_demo_data()
+                    self.save_all()
+                self._ensure_exhibitions()
+        self._stop = threading.Event()
+        self._compactor = None
+        if self.journal is not None and compact_interval and not read_only:
+            self._compactor = threading.Thread(target=self._compact_loop, args=(compact_interval,), daemon=True)
+            self._compactor.start()
+
+    def _load_collection(self, name):
+        with self._lock:
+            table = self.__dict__.get(name)
+            if table is not None:
+                return table
+            self._stamps[name] = _stamp(self.files[name])
+            table = load_table(self.files[name], KEYS[name])
+            if self.journal is not None:
+                for op, _, key, obj in self.journal.replay(collections=(name,)):
+                    if op == PUT:
+                        table[key] = obj
+                    elif op == DELETE:
+                        table.pop(key, None)
+            # later reads hit the instance attribute and skip the descriptor
+            self.__dict__[name] = table
+            self._build_indexes(name)
+            return table
+
+    def is_loaded(self, name):
+        return name in self.__dict__
+
+    # indexes
+    def _build_indexes(self, collection):
+        specs = INDEXES.get(collection, ())
+        self._indexes[collection] = {attr: _Index(attr, unique, fold) for attr, unique, fold in specs}
+        for key, obj in getattr(self, collection).items():
+            self._reindex(collection, key, obj)
+
+    def _reindex(self, collection, key, obj):
+        for index in self._indexes.get(collection, {}).values():
+            if obj is None:
+                index.discard(key)
+            else:
+                index.add(key, obj)
+
+    def _flush(self, records):
+        # constant-cost append in journaled mode, rewrite of touched collections otherwise
+        if self.read_only:
+            raise RuntimeError(f"Storage in {self.data_dir} is open read-only")
+        if self.journal is not None:
+            self.journal.append(records)
+            if self.process_lock is not None:
+                self._offset = self.journal.end()  # our own records are already applied
+            return
+        for collection in {rec[1] for rec in records}:
+            save_table(self.files[collection], getattr(self, collection))
+
+    def _compact_loop(self, interval):
+        while not self._stop.wait(interval):
+            # never snapshot uncommitted state of an open transaction
+            with self._exclusive(), self._lock:
+                if self.journal.records >= COMPACT_THRESHOLD and not self._open_tx:
+                    self.compact()
+
+    def compact(self):
+        """Fold the journal into fresh snapshot files and truncate it."""
+        if self.read_only:
+            raise RuntimeError(f"Storage in {self.data_dir} is open read-only")
+        with self._exclusive(), self._lock:
+            # only collections with journal records changed; loading them replays those records
+            names = self.journal.collections() if self.journal is not None else self.files
+            written = 0
+            for name in names:
+                written += save_table(self.files[name], getattr(self, name))
+                self._stamps[name] = _stamp(self.files[name])
+            if self.journal is not None:
+                self.journal.reset()
+            if self.process_lock is not None:
+                self._generation += 1
+                self.process_lock.write_counter(self._generation)
+                self._offset = 0
+            if metrics.enabled:
+                metrics.add("storage.save_all.bytes", written)
+
+    # multi-process sharing
+    def _sync(self):
+        self._applied = [] if self.events.active else None
+        try:
+            self._catch_up()
+        finally:
+            applied, self._applied = self._applied, None
+        return applied
+
+    def _catch_up(self):
+        generation = self.process_lock.read_counter()
+        loaded = [name for name in KEYS if self.is_loaded(name)]
+        if generation != self._generation:
+            # someone compacted: the journal restarted and some snapshots were rewritten
+            if self._generation is not None:
+                for name in loaded:
+                    if _stamp(self.files[name]) != self._stamps.get(name):
+                        self._reload(name)
+                self.journal.records = 0
+            self._generation = generation
+            self._offset = 0
+        if self.journal.end() <= self._offset:
+            return
+        records, self._offset = self.journal.tail(self._offset, collections=loaded)
+        if self.journal.end() > self._offset:
+            # another process died mid-append; our next append must not follow its torn batch
+            self.journal.truncate(self._offset)
+        for op, collection, key, obj in records:
+            self._apply(op, collection, key, obj)
+        self.journal.records += len(records)
+
+    def _reload(self, name):
+        self._stamps[name] = _stamp(self.files[name])
+        fresh = load_table(self.files[name], KEYS[name])
+        for key in [k for k in getattr(self, name) if k not in fresh]:
+            self._apply(DELETE, name, key, None)
+        for key, obj in fresh.items():
+            self._apply(PUT, name, key, obj)
+
+    def _apply(self, op, collection, key, obj):
+        # bring one loaded record in line with another process's write
+        table = getattr(self, collection)
+        current = table.get(key)
+        if op == DELETE:
+            if current is not None:
+                del table[key]
+                self._reindex(collection, key, None)
+                if collection == "workshops":
+                    self.catalog.update(key, None)
+                if collection == "payments":
+                    self._count_sale(current, -1)
+            return
+        if current is not None:
+            _restore(current, obj)  # keep the instance callers already hold
+            obj = current
+        else:
+            table[key] = obj
+        if collection == "payments":
+            self._count_sale(obj)
+        self._reindex(collection, key, obj)
+        if collection == "reservations":
+            self.waitlist.forget(obj.ws_id)
+            self.schedule.forget(obj.attendee_id)
+        elif collection == "workshops":
+            self.schedule.workshop_changed(obj)
+            self.catalog.update(key, obj)
+        if self._applied is not None:
+            self._applied.append(change_event(collection, key, obj, new=current is None))
+
+    def start_write_behind(self, max_pending=1000, batch_size=256):
+        # without the journal a flush pickles the live collections, which only
+        # the committing thread may do while it holds self._lock
+        if self.journal is not None:
+            super().start_write_behind(max_pending=max_pending, batch_size=batch_size)
+
+    def save_all(self):
+        self.compact()
+
+    def close(self):
+        super().close()
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        if self.journal is not None:
+            if not self.read_only:
+                self.compact()
+            self.journal.close()
+        if self.process_lock is not None:
+            self.process_lock.close()
+
+    def _index(self, collection, attr):
+        getattr(self, collection)  # make sure the collection (and its indexes) is loaded
+        return self._indexes[collection][attr]
+
+    def find_attendee_by_email(self, email):
+        uid = self._index("attendees", "email").lookup(email)
+        return self.attendees.get(uid) if uid is not None else None
+
+    def tickets_for_owner(self, owner_id):
+        return [self.tickets[t] for t in self._index("tickets", "owner_id").lookup(owner_id)]
+
+    def reservations_for_ticket(self, ticket_id):
+        return [self.reservations[r] for r in self._index("reservations", "ticket_id").lookup(ticket_id)]
+
+    def reservations_for_workshop(self, ws_id):
+        return [self.reservations[r] for r in self._index("reservations", "ws_id").lookup(ws_id)]
+
+def open_storage(backend=None, data_dir=None, shared=None, read_only=False):
+    """Create the storage backend named by `backend` (defaults to GREENWAVE_BACKEND).
+
+    `read_only` opens existing data for reporting: nothing is seeded or
+    compacted, and a missing data set raises FileNotFoundError.
+    """
+    backend = backend or BACKEND
+    shared = (SHARED and not read_only) if shared is None else shared
+    if backend == "sqlite":
+        from .sqlite_storage import SqliteStorage
+        return SqliteStorage(data_dir, shared=shared, read_only=read_only)
+    if backend != "pickle":
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return Storage(data_dir, shared=shared, read_only=read_only)
+
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Return the shared storage instance, opening it on first use."""
+    with _storage_lock:
+        if "storage" not in globals():
+            globals()["storage"] = open_storage()
+        return globals()["storage"]
+
+def __getattr__(name):
+    # the `storage` singleton is created lazily so importing src.logic stays cheap
+    if name == "storage":
+        return get_storage()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
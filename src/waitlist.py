@@ -0,0 +1,78 @@
+"""
+waitlist.py - Per-workshop waitlists for full GreenWave workshops
+"""
+
+import heapq
+import threading
+
+WAITLISTED = "WAITLISTED"
+
+def _entry(res):
+    # priority holders first, then first come first served
+    return (0 if res.priority else 1, res.queued_at, res.res_id)
+
+class Waitlist:
+    """Priority queues of WAITLISTED reservations, one heap per workshop.
+
+    The reservations themselves are the persistent state; a heap is built
+    from a workshop's reservations the first time it is needed and kept up to
+    date by `add`. Entries whose reservation is no longer waiting (cancelled,
+    promoted, rolled back) are dropped when they reach the top, so `pop` is
+    O(log n) amortised and never rescans the list.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._heaps = {}  # ws_id -> heap of (rank, queued_at, res_id)
+        self._lock = threading.Lock()
+
+    def _heap(self, ws_id):
+        heap = self._heaps.get(ws_id)
+        if heap is None:
+            heap = [_entry(r) for r in self.store.reservations_for_workshop(ws_id) if r.status == WAITLISTED]
+            heapq.heapify(heap)
+            self._heaps[ws_id] = heap
+        return heap
+
+    def _waiting(self, res_id):
+        res = self.store.reservations.get(res_id)
+        return res if res is not None and res.status == WAITLISTED else None
+
+    def add(self, res):
+        """Queue a reservation that was just stored with status WAITLISTED."""
+        with self._lock:
+            if res.ws_id in self._heaps:
+                heapq.heappush(self._heaps[res.ws_id], _entry(res))
+            else:
+                self._heap(res.ws_id)  # built from storage, which already holds res
+
+    def pop(self, ws_id):
+        """Remove and return the next waiting reservation for `ws_id`, or None."""
+        with self._lock:
+            heap = self._heap(ws_id)
+            while heap:
+                res = self._waiting(heapq.heappop(heap)[2])
+                if res is not None:
+                    return res
+            return None
+
+    def waiting(self, ws_id):
+        """Waiting reservations for `ws_id` in promotion order."""
+        with self._lock:
+            entries = sorted(self._heap(ws_id))
+        return [res for res in (self._waiting(e[2]) for e in entries) if res is not None]
+
+    def position(self, res):
+        """1-based place of a waiting reservation in its workshop's queue, or None."""
+        for i, waiting in enumerate(self.waiting(res.ws_id), start=1):
+            if waiting.res_id == res.res_id:
+                return i
+        return None
+
+    def forget(self, ws_id=None):
+        """Drop the heap for `ws_id` (or all heaps) so it is rebuilt from storage on next use."""
+        with self._lock:
+            if ws_id is None:
+                self._heaps.clear()
+            else:
+                self._heaps.pop(ws_id, None)
@@ -0,0 +1,111 @@
+"""
+writebehind.py - Background persistence worker for GreenWave storage
+"""
+
+import threading
+from collections import Counter, deque
+from .codec import encode, decode
+
+class WriteBehind:
+    """Flushes committed records on a background thread.
+
+    Storage applies mutations in memory and hands the records to `submit`,
+    which only queues a snapshot of each object, so callers (e.g. the Tk event
+    thread) never wait on disk. The worker merges queued batches, keeps the
+    last write per key and calls the backend's `_flush` once per batch.
+
+    The queue is bounded: `throttle` blocks new writers while `max_pending`
+    batches are waiting. A failed flush is retried; `flush()` re-raises it.
+    """
+
+    def __init__(self, storage, max_pending=1000, batch_size=256, retry_delay=0.5):
+        self.storage = storage
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.error = None
+        self._queue = deque()       # batches of (op, collection, key, copy, live object)
+        self._inflight = Counter()  # (collection, key) -> queued writes not yet flushed
+        self._busy = False
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="greenwave-write-behind", daemon=True)
+        self._thread.start()
+
+    def throttle(self):
+        with self._cond:
+            while len(self._queue) >= self.max_pending and not self._stopping:
+                self._cond.wait()
+
+    def submit(self, records):
+        # copy now so the flushed state is the committed one, even if the live object
+        # changes later; the live object is kept too so caches cannot drop it before the flush
+        batch = [(op, c, k, decode(encode(obj)) if obj is not None else None, obj)
+                 for op, c, k, obj in records]
+        with self._cond:
+            self._queue.append(batch)
+            for _, c, k, _, _ in batch:
+                self._inflight[(c, k)] += 1
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue)
+
+    def _take(self):
+        with self._cond:
+            while not self._queue and not self._stopping:
+                self._cond.wait()
+            batches = []
+            while self._queue and len(batches) < self.batch_size:
+                batches.append(self._queue.popleft())
+            self._busy = bool(batches)
+            return batches
+
+    def _run(self):
+        while True:
+            batches = self._take()
+            if not batches:
+                return  # stopping and drained
+            merged = {}
+            for batch in batches:
+                for op, c, k, obj, _ in batch:
+                    merged.pop((c, k), None)  # re-insert so the last write keeps commit order
+                    merged[(c, k)] = (op, c, k, obj)
+            try:
+                self.storage._flush(list(merged.values()))
+            except Exception as e:
+                with self._cond:
+                    self.error = e
+                    self._queue.extendleft(reversed(batches))
+                    self._busy = False
+                    self._cond.notify_all()
+                    self._cond.wait(self.retry_delay)
+                continue
+            # same lock order as submit (storage, then queue) so no write slips in between
+            with self.storage._lock, self._cond:
+                self.error = None
+                for batch in batches:
+                    for _, c, k, _, _ in batch:
+                        self._inflight[(c, k)] -= 1
+                        if not self._inflight[(c, k)]:
+                            del self._inflight[(c, k)]
+                            self.storage._settle(c, k)
+                self._busy = False
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is on disk."""
+        with self._cond:
+            done = self._cond.wait_for(lambda: (not self._queue and not self._busy) or self.error, timeout)
+            if self.error is not None:
+                raise self.error
+            if not done:
+                raise TimeoutError("write-behind flush timed out")
+
+    def stop(self):
+        self.flush()
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
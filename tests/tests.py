@@ -1,17 +1,49 @@
 
+import asyncio
 import unittest
 import shutil
 import os
-from src.storage import storage
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import mock
+
+# keep the test run away from the real ../data directory
+TEST_DATA_DIR = None
+if "GREENWAVE_DATA_DIR" not in os.environ:
+    TEST_DATA_DIR = os.environ["GREENWAVE_DATA_DIR"] = tempfile.mkdtemp(prefix="greenwave-test-")
+
+import src.storage
+from src.storage import storage, Storage, TransactionConflict
+from src.sqlite_storage import SqliteStorage
+from src.migrate import migrate
+from src.models import Attendee, Workshop, Payment
+from src.codec import encode, decode
+from src.journal import Journal, HEADER, PUT, DELETE
+from datetime import datetime, timedelta
+from src import logic
+from src.metrics import registry as metrics
+from src.importer import import_attendees
+from src import export
+from src import gateway
+from src.admission import SaleQueue, QueueFull
+from src.paging import table_source, dict_source
+from src.events import (Event, TicketAdded, TicketChanged, ReservationCreated, ReservationCancelled,
+                        WorkshopSeatsChanged, PaymentRecorded, PaymentStatusChanged)
 from src.logic import create_account, purchase_ticket, reserve_workshop, cancel_reservation
 
+def tearDownModule():
+    # close the storage singleton before removing the directory it lives in
+    opened = src.storage.__dict__.get("storage")
+    if opened is not None:
+        opened.close()
+    if TEST_DATA_DIR is not None:
+        shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
+
 class TestGreenWave(unittest.TestCase):
-    @classmethod
-    def setUpClass(cls):
-        # make a clean data dir for testing
-        data_dir = os.path.join(os.path.dirname(__file__), "..", "data")
-        # Use actual storage.data dir (../data). We won't delete in this environment.
-        pass
+    # runs against the storage singleton, opened in GREENWAVE_DATA_DIR (a temporary directory, see above)
 
     def test_account_and_purchase_and_reservation(self):
         # create an account
@@ -31,5 +63,1162 @@ class TestGreenWave(unittest.TestCase):
         cancel_reservation(res.res_id)
         self.assertEqual(storage.reservations[res.res_id].status, "CANCELLED")
 
+class StorageTestCase(unittest.TestCase):
+    """Gives each test a fresh Storage in its own data directory, installed as the storage singleton."""
+    prefix = "greenwave-test-"
+
+    def open_storage(self):
+        return Storage(self.data_dir, compact_interval=None)
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix=self.prefix)
+        self.storage = self.open_storage()
+        patcher = mock.patch.object(src.storage, "storage", self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.storage.close()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="greenwave-journal-")
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_mutations_replay_after_restart(self):
+        s = Storage(self.data_dir, compact_interval=None)
+        att = Attendee("U1", "Journal Tester", "journal@example.com", "pw")
+        s.add_attendee(att)
+        att.tickets.append("T1")
+        s.update_attendee(att)
+        self.assertEqual(s.journal.records, 2)
+        s.journal.close()
+        s2 = Storage(self.data_dir, compact_interval=None)
+        self.assertEqual(s2.attendees["U1"].tickets, ["T1"])
+        s2.close()
+
+    def test_compact_folds_journal_into_snapshot(self):
+        s = Storage(self.data_dir, compact_interval=None)
+        s.add_attendee(Attendee("U2", "Compact Tester", "compact@example.com", "pw"))
+        s.compact()
+        self.assertEqual(s.journal.size(), 0)
+        s.close()
+        s2 = Storage(self.data_dir, compact_interval=None)
+        self.assertIn("U2", s2.attendees)
+        s2.close()
+
+    def test_torn_tail_is_ignored(self):
+        s = Storage(self.data_dir, compact_interval=None)
+        s.add_attendee(Attendee("U3", "Torn Tester", "torn@example.com", "pw"))
+        s.journal.close()
+        with open(os.path.join(self.data_dir, "journal.log"), "ab") as f:
+            f.write(b"\x01\x00\xff\xff")
+        s2 = Storage(self.data_dir, compact_interval=None)
+        self.assertIn("U3", s2.attendees)
+        s2.close()
+
+    def test_appends_after_torn_tail_survive_restart(self):
+        path = os.path.join(self.data_dir, "journal.log")
+        s = Storage(self.data_dir, compact_interval=None)
+        s.add_attendee(Attendee("U1", "Before Crash", "before@example.com", "pw"))
+        s.journal.close()
+        # a complete record whose COMMIT never made it, then half of the next header
+        with open(path, "ab") as f:
+            ghost = Journal(os.path.join(self.data_dir, "ghost.log"))
+            ghost.append([(PUT, "attendees", "UGHOST", Attendee("UGHOST", "Ghost", "ghost@example.com", "pw"))])
+            ghost.close()
+            with open(ghost.path, "rb") as g:
+                f.write(g.read()[:-HEADER.size])
+            f.write(b"\x01\x00\xff")
+        s2 = Storage(self.data_dir, compact_interval=None)
+        s2.add_attendee(Attendee("U2", "After Crash", "after@example.com", "pw"))
+        s2.journal.close()
+        s3 = Storage(self.data_dir, compact_interval=None)
+        self.assertIn("U2", s3.attendees)
+        self.assertNotIn("UGHOST", s3.attendees)
+        self.assertEqual(s3.journal.count(), 2)
+        s3.close()
+
+class TestTransactions(StorageTestCase):
+    prefix = "greenwave-tx-"
+
+    def test_purchase_is_one_journal_write(self):
+        a = logic.create_account("Tx Tester", "tx@example.com", "pw")
+        with mock.patch.object(self.storage.journal, "append", wraps=self.storage.journal.append) as append:
+            ticket, payment = logic.purchase_ticket(a.user_id, "AllAccess")
+        self.assertEqual(append.call_count, 1)
+        self.assertEqual(self.storage.attendees[a.user_id].purchase_history, [payment.pay_id])
+
+    def test_failed_payment_rolls_back(self):
+        a = logic.create_account("Rollback Tester", "rollback@example.com", "pw")
+        with mock.patch.object(self.storage, "add_payment", side_effect=RuntimeError("gateway down")):
+            with self.assertRaises(RuntimeError):
+                logic.purchase_ticket(a.user_id, "AllAccess")
+        self.assertEqual(a.tickets, [])
+        self.assertEqual(self.storage.tickets, {})
+        reloaded = Storage(self.data_dir, compact_interval=None)
+        self.assertEqual(reloaded.tickets, {})
+        reloaded.close()
+
+class TestIndexes(StorageTestCase):
+    prefix = "greenwave-idx-"
+
+    def test_email_lookup_is_case_insensitive_and_rebuilt_on_load(self):
+        a = logic.create_account("Index Tester", "Index@Example.com", "pw")
+        self.assertIs(self.storage.find_attendee_by_email("index@example.COM"), a)
+        with self.assertRaises(ValueError):
+            logic.create_account("Dup", "INDEX@example.com", "pw")
+        reloaded = Storage(self.data_dir, compact_interval=None)
+        self.assertEqual(reloaded.find_attendee_by_email("index@example.com").user_id, a.user_id)
+        reloaded.close()
+
+    def test_relationship_indexes(self):
+        a = logic.create_account("Rel Tester", "rel@example.com", "pw")
+        ticket, _ = logic.purchase_ticket(a.user_id, "AllAccess")
+        res = logic.reserve_workshop(a.user_id, ticket.ticket_id, "WS11")
+        self.assertEqual(self.storage.tickets_for_owner(a.user_id), [ticket])
+        self.assertEqual(self.storage.reservations_for_ticket(ticket.ticket_id), [res])
+        self.assertEqual(self.storage.reservations_for_workshop("WS11"), [res])
+
+    def test_rollback_drops_index_entries(self):
+        with self.assertRaises(RuntimeError):
+            with self.storage.transaction():
+                self.storage.add_attendee(Attendee("U9", "Ghost", "ghost@example.com", "pw"))
+                raise RuntimeError("abort")
+        self.assertIsNone(self.storage.find_attendee_by_email("ghost@example.com"))
+
+    def test_savepoint_undoes_only_its_block(self):
+        a = logic.create_account("Savepoint", "savepoint@example.com", "pw")
+        with self.storage.transaction():
+            self.storage.touch("attendees", a)
+            a.tickets.append("T-kept")
+            self.storage.update_attendee(a)
+            with self.assertRaises(OverflowError), self.storage.savepoint():
+                self.storage.touch("attendees", a)
+                a.tickets.append("T-undone")
+                self.storage.add_attendee(Attendee("U-undone", "Undone", "undone@example.com", "pw"))
+                raise OverflowError("full")
+            self.storage.add_attendee(Attendee("U-after", "After", "after@example.com", "pw"))
+        self.assertEqual(a.tickets, ["T-kept"])
+        self.assertNotIn("U-undone", self.storage.attendees)
+        self.assertIsNone(self.storage.find_attendee_by_email("undone@example.com"))
+        reloaded = Storage(self.data_dir, compact_interval=None)
+        self.assertEqual(reloaded.attendees[a.user_id].tickets, ["T-kept"])
+        self.assertIn("U-after", reloaded.attendees)
+        self.assertNotIn("U-undone", reloaded.attendees)
+        reloaded.close()
+
+    def test_rollback_does_not_undo_another_threads_commit(self):
+        a = logic.create_account("Shared", "shared@example.com", "pw")
+        ticket, _ = logic.purchase_ticket(a.user_id, "AllAccess")
+        touched, booked = threading.Event(), threading.Event()
+
+        def failing():
+            with self.assertRaises(RuntimeError), self.storage.transaction():
+                self.storage.touch("attendees", a)
+                touched.set()
+                booked.wait(0.3)  # the booking must not get in while this is open
+                raise RuntimeError("boom")
+        t = threading.Thread(target=failing)
+        t.start()
+        touched.wait()
+        res = logic.reserve_workshop(a.user_id, ticket.ticket_id, "WS11")
+        booked.set()
+        t.join()
+        self.assertIn(res.res_id, self.storage.attendees[a.user_id].reservations)
+
+    def test_transactions_on_different_objects_do_not_wait(self):
+        a = logic.create_account("Slow", "slow@example.com", "pw")
+        b = logic.create_account("Quick", "quick@example.com", "pw")
+        touched, done = threading.Event(), threading.Event()
+
+        def slow():
+            with self.storage.transaction():
+                self.storage.touch("attendees", a)
+                touched.set()
+                done.wait(5)
+        t = threading.Thread(target=slow)
+        t.start()
+        touched.wait()
+        quick = threading.Thread(target=logic.purchase_ticket, args=(b.user_id, "AllAccess"))
+        quick.start()
+        quick.join(2)
+        finished = not quick.is_alive()  # with one global lock it would wait for `slow`
+        done.set()
+        t.join()
+        quick.join()
+        self.assertTrue(finished)
+        self.assertEqual(len(b.tickets), 1)
+
+    def test_crossed_claims_roll_back_one_transaction(self):
+        a = logic.create_account("Left", "left@example.com", "pw")
+        b = logic.create_account("Right", "right@example.com", "pw")
+        barrier = threading.Barrier(2)
+        outcomes = []
+
+        def run(first, second):
+            try:
+                with self.storage.transaction():
+                    self.storage.touch("attendees", first)
+                    first.tickets.append("T-" + first.user_id)
+                    barrier.wait()
+                    self.storage.touch("attendees", second)
+                outcomes.append("committed")
+            except TransactionConflict:
+                outcomes.append("conflict")
+        threads = [threading.Thread(target=run, args=pair) for pair in ((a, b), (b, a))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(sorted(outcomes), ["committed", "conflict"])
+        self.assertEqual(len(a.tickets) + len(b.tickets), 1)
+
+class TestSeatAllocation(StorageTestCase):
+    prefix = "greenwave-seats-"
+
+    def test_concurrent_reservations_never_oversell(self):
+        ws = self.storage.workshops["WS11"]
+        buyers = []
+        for i in range(4 * ws.capacity):
+            a = logic.create_account(f"Buyer {i}", f"buyer{i}@example.com", "pw")
+            ticket, _ = logic.purchase_ticket(a.user_id, "AllAccess")
+            buyers.append((a.user_id, ticket.ticket_id))
+        start = threading.Barrier(len(buyers))
+        confirmed, rejected = [], []
+
+        def book(uid, tid):
+            start.wait()
+            try:
+                confirmed.append(logic.reserve_workshop(uid, tid, ws.ws_id))
+            except OverflowError:
+                rejected.append(uid)
+
+        threads = [threading.Thread(target=book, args=b) for b in buyers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(confirmed), ws.capacity)
+        self.assertEqual(len(ws.attendee_ids), ws.capacity)
+        self.assertEqual(len(rejected), len(buyers) - ws.capacity)
+        reloaded = Storage(self.data_dir, compact_interval=None)
+        self.assertEqual(len(reloaded.workshops[ws.ws_id].attendee_ids), ws.capacity)
+        reloaded.close()
+
+    def test_cancel_frees_seat(self):
+        a = logic.create_account("Cancel Tester", "cancel@example.com", "pw")
+        ticket, _ = logic.purchase_ticket(a.user_id, "AllAccess")
+        ws = self.storage.workshops["WS21"]
+        res = logic.reserve_workshop(a.user_id, ticket.ticket_id, ws.ws_id)
+        self.assertEqual(ws.available_spots(), ws.capacity - 1)
+        logic.cancel_reservation(res.res_id)
+        self.assertEqual(ws.available_spots(), ws.capacity)
+
+class TestSqliteBackend(StorageTestCase):
+    prefix = "greenwave-sqlite-"
+
+    def open_storage(self):
+        return SqliteStorage(self.data_dir)
+
+    def test_logic_runs_unchanged(self):
+        a = logic.create_account("Sql Tester", "Sql@example.com", "pw")
+        ticket, payment = logic.purchase_ticket(a.user_id, "Exhibition", selected_ex_ids=["EX1"])
+        res = logic.reserve_workshop(a.user_id, ticket.ticket_id, "WS11")
+        self.assertIs(self.storage.find_attendee_by_email("sql@EXAMPLE.com"), a)
+        self.assertEqual(a.tickets, [ticket.ticket_id])
+        logic.cancel_reservation(res.res_id)
+        self.assertEqual(sum(self.storage.daily_sales().values()), 50.0)
+        reopened = SqliteStorage(self.data_dir)
+        self.assertEqual(reopened.attendees[a.user_id].purchase_history, [payment.pay_id])
+        self.assertEqual(reopened.reservations[res.res_id].status, "CANCELLED")
+        self.assertEqual(reopened.workshops["WS11"].attendee_ids, set())
+        self.assertEqual([t.ticket_id for t in reopened.tickets_for_owner(a.user_id)], [ticket.ticket_id])
+        self.assertEqual(len(reopened.exhibitions), 3)
+        reopened.close()
+
+    def test_rollback_leaves_database_untouched(self):
+        a = logic.create_account("Sql Rollback", "sqlrb@example.com", "pw")
+        with mock.patch.object(self.storage, "add_payment", side_effect=RuntimeError("gateway down")):
+            with self.assertRaises(RuntimeError):
+                logic.purchase_ticket(a.user_id, "AllAccess")
+        self.assertEqual(a.tickets, [])
+        self.assertEqual(len(self.storage.tickets), 0)
+
+    def test_migrate_imports_pickles(self):
+        source_dir = tempfile.mkdtemp(prefix="greenwave-pkl-")
+        self.addCleanup(shutil.rmtree, source_dir, True)
+        source = Storage(source_dir, compact_interval=None)
+        source.add_attendee(Attendee("U7", "Migrated", "migrated@example.com", "pw"))
+        source.close()
+        count, path = migrate(source_dir)
+        target = SqliteStorage(source_dir, path=path)
+        self.assertEqual(target.find_attendee_by_email("migrated@example.com").user_id, "U7")
+        self.assertEqual(len(target.workshops), 9)
+        self.assertEqual(count, 1 + 9 + 3)
+        target.close()
+
+    def test_migrate_refuses_directory_without_pickles(self):
+        source_dir = tempfile.mkdtemp(prefix="greenwave-pkl-")
+        self.addCleanup(shutil.rmtree, source_dir, True)
+        with self.assertRaises(FileNotFoundError):
+            migrate(source_dir)
+        self.assertEqual(os.listdir(source_dir), [])
+
+    def test_delete_waits_for_flush(self):
+        a = logic.create_account("Sql Delete", "sqldel@example.com", "pw")
+        table = self.storage.attendees
+        del table[a.user_id]
+        self.assertNotIn(a.user_id, table)
+        self.assertNotIn(a.user_id, [key for key, _ in table.items()])
+        self.assertTrue(table._stored(a.user_id))  # nothing is deleted before the flush
+        self.storage._flush([(DELETE, "attendees", a.user_id, None)])
+        self.storage._settle("attendees", a.user_id)
+        self.assertFalse(table._stored(a.user_id))
+        self.assertIsNone(self.storage.find_attendee_by_email("sqldel@example.com"))
+
+class TestLazyLoading(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="greenwave-lazy-")
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_collections_load_on_first_use(self):
+        s = Storage(self.data_dir, compact_interval=None)
+        with mock.patch.object(src.storage, "storage", s):
+            a = logic.create_account("Lazy Tester", "lazy@example.com", "pw")
+            logic.purchase_ticket(a.user_id, "AllAccess")
+        s.close()
+        reopened = Storage(self.data_dir, compact_interval=None)
+        self.assertFalse(reopened.is_loaded("payments"))
+        self.assertFalse(reopened.is_loaded("reservations"))
+        self.assertEqual(sum(reopened.daily_sales().values()), 150.0)
+        self.assertTrue(reopened.is_loaded("payments"))
+        self.assertFalse(reopened.is_loaded("reservations"))
+        reopened.close()
+
+    def test_importing_logic_does_not_open_storage(self):
+        data_dir = os.path.join(self.data_dir, "untouched")
+        env = dict(os.environ, GREENWAVE_DATA_DIR=data_dir)
+        root = os.path.join(os.path.dirname(__file__), "..")
+        subprocess.run([sys.executable, "-c", "import src.logic"], cwd=root, env=env, check=True)
+        self.assertFalse(os.path.exists(data_dir))
+
+class TestCodec(unittest.TestCase):
+    def test_round_trip_is_exact(self):
+        p = Payment("P1", "T1", 50.0, "Card", timestamp=datetime(2025, 11, 27, 13, 44, 21, 36470))
+        row = encode(p)
+        self.assertEqual(row, ("P", "P1", "T1", 50.0, "Card", 1764251061036470, None, None, "SETTLED", None, None))
+        self.assertIsNone(decode(row[:-4]).ex_id)  # rows from schema v1
+        self.assertIsNone(decode(row[:-3]).ticket_ids)  # rows from schema v2
+        self.assertEqual(decode(row[:-2]).status, "SETTLED")  # rows from before schema v6
+        self.assertEqual(decode(row).__getstate__(), p.__getstate__())
+        ws = Workshop("WS1", "Solar", "EX1", 10, datetime(2025, 1, 1, 9, 30))
+        ws.attendee_ids.update({"R2", "R1"})
+        self.assertEqual(decode(encode(ws)).attendee_ids, {"R1", "R2"})
+        self.assertEqual(decode(encode(ws)[:-1]).duration, 60)  # rows from before schema v5
+
+    def test_models_are_slotted(self):
+        a = Attendee("U1", "Slot", "slot@example.com", "pw")
+        self.assertFalse(hasattr(a, "__dict__"))
+
+    def test_legacy_dict_pickles_load(self):
+        # the shipped data/*.pkl files were written by the original __dict__ classes
+        legacy_dir = os.path.join(os.path.dirname(__file__), "..", "data")
+        workshops = src.storage.load_table(os.path.join(legacy_dir, "workshops.pkl"), "ws_id")
+        self.assertIsInstance(workshops["WS11"].attendee_ids, set)
+        attendees = src.storage.load_table(os.path.join(legacy_dir, "attendees.pkl"), "user_id")
+        self.assertTrue(all(isinstance(a, Attendee) for a in attendees.values()))
+
+class TestWriteBehind(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="greenwave-wb-")
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def run_blocked_purchase(self, s):
+        s.start_write_behind()
+        release = threading.Event()
+        real_flush = s._flush
+
+        def slow_flush(records):
+            release.wait(5)
+            real_flush(records)
+
+        with mock.patch.object(src.storage, "storage", s), mock.patch.object(s, "_flush", slow_flush):
+            a = logic.create_account("Behind Tester", "behind@example.com", "pw")
+            ticket, payment = logic.purchase_ticket(a.user_id, "AllAccess")
+            # the purchase returned while the disk write is still blocked
+            self.assertEqual(a.tickets, [ticket.ticket_id])
+            self.assertGreater(s.writer.pending(), 0)
+            release.set()
+            s.flush()
+        self.assertEqual(s.writer.pending(), 0)
+        return a, ticket, payment
+
+    def test_pickle_backend(self):
+        s = Storage(self.data_dir, compact_interval=None)
+        a, ticket, payment = self.run_blocked_purchase(s)
+        reloaded = Storage(self.data_dir, compact_interval=None)
+        self.assertEqual(reloaded.attendees[a.user_id].purchase_history, [payment.pay_id])
+        reloaded.close()
+        s.close()
+
+    def test_unjournaled_storage_flushes_inline(self):
+        s = Storage(self.data_dir, journaled=False, compact_interval=None)
+        s.start_write_behind()  # would pickle live collections off the committing thread
+        self.assertIsNone(s.writer)
+        s.close()
+
+    def test_sqlite_backend(self):
+        s = SqliteStorage(self.data_dir)
+        a, ticket, payment = self.run_blocked_purchase(s)
+        reopened = SqliteStorage(self.data_dir)
+        self.assertIn(ticket.ticket_id, reopened.tickets)
+        self.assertEqual(reopened.attendees[a.user_id].tickets, [ticket.ticket_id])
+        reopened.close()
+        s.close()
+
+class TestSalesLedger(StorageTestCase):
+    prefix = "greenwave-sales-"
+
+    def test_rollups_follow_purchases_and_upgrades(self):
+        a = logic.create_account("Sales Tester", "sales@example.com", "pw")
+        ledger = self.storage.sales
+        ticket, payment = logic.purchase_ticket(a.user_id, "Exhibition", selected_ex_ids=["EX1"])
+        logic.purchase_ticket(a.user_id, "AllAccess")
+        self.assertTrue(self.storage.upgrade_ticket(ticket.ticket_id, "EX3", extra_price=40.0))
+        today = payment.timestamp.date()
+        self.assertEqual(ledger.total, 240.0)
+        self.assertEqual(self.storage.daily_sales(), {today.isoformat(): 240.0})
+        self.assertEqual(ledger.by_type, {"ExhibitionPass": 90.0, "AllAccess": 150.0})
+        self.assertEqual(ledger.by_exhibition, {"EX1": 50.0, "EX3": 40.0, "ALL": 150.0})
+        self.assertEqual(ledger.revenue_between(today, today.isoformat()), 240.0)
+        self.assertEqual(ledger.revenue_between("1999-01-01", "1999-12-31"), 0)
+        self.assertEqual(ledger.top_days(1), [(today.isoformat(), 240.0)])
+        self.assertEqual(len(a.purchase_history), 3)
+
+    def test_purchase_split_survives_upgrade_and_restart(self):
+        a = logic.create_account("Sales Restart", "salesrs@example.com", "pw")
+        ledger = self.storage.sales
+        ticket, payment = logic.purchase_ticket(a.user_id, "Exhibition", selected_ex_ids=["EX1"])
+        self.storage.upgrade_ticket(ticket.ticket_id, "EX3", extra_price=40.0)
+        self.assertEqual(ledger.by_exhibition, {"EX1": 50.0, "EX3": 40.0})
+        self.storage.close()
+        self.storage = reopened = Storage(self.data_dir, compact_interval=None)
+        self.assertEqual(reopened.sales.by_exhibition, {"EX1": 50.0, "EX3": 40.0})
+        with reopened.transaction():
+            paid = reopened.payments[payment.pay_id]
+            reopened.touch("payments", paid)
+            paid.status = "FAILED"
+            reopened.update_payment(paid)
+        self.assertEqual(reopened.sales.by_exhibition, {"EX1": 0.0, "EX3": 40.0})
+        self.assertEqual(reopened.sales.by_type, {"ExhibitionPass": 40.0})
+
+    def test_rolled_back_payment_is_not_counted(self):
+        a = logic.create_account("Sales Rollback", "salesrb@example.com", "pw")
+        ledger = self.storage.sales
+        with mock.patch.object(self.storage, "update_attendee", side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                logic.purchase_ticket(a.user_id, "AllAccess")
+        self.assertEqual(ledger.total, 0)
+        self.assertEqual(ledger.count, 0)
+
+class TestMetrics(StorageTestCase):
+    prefix = "greenwave-metrics-"
+
+    def setUp(self):
+        super().setUp()
+        self.original = logic.purchase_ticket
+        metrics.reset()
+        metrics.enable()
+        self.addCleanup(metrics.disable)
+
+    def test_enabled_registry_times_calls_and_counts_bytes(self):
+        a = logic.create_account("Metrics Tester", "metrics@example.com", "pw")
+        logic.purchase_ticket(a.user_id, "AllAccess")
+        self.storage.save_all()
+        snap = metrics.snapshot()
+        self.assertEqual(snap["histograms"]["logic.purchase_ticket"]["count"], 1)
+        self.assertGreaterEqual(snap["histograms"]["storage.add_payment"]["count"], 1)
+        self.assertGreater(snap["counters"]["storage.journal_bytes"], 0)
+        self.assertGreater(snap["counters"]["storage.save_all.bytes"], 0)
+        self.assertIn("logic.purchase_ticket", metrics.to_text())
+        self.assertNotIn("storage.touch", snap["histograms"])
+
+    def test_overridden_methods_are_timed_once(self):
+        other = tempfile.mkdtemp(prefix=self.prefix)
+        self.addCleanup(shutil.rmtree, other, True)
+        Storage(other, compact_interval=None).close()  # Storage.close calls BaseStorage.close
+        self.assertEqual(metrics.snapshot()["histograms"]["storage.close"]["count"], 1)
+
+    def test_disable_restores_originals(self):
+        self.assertIsNot(logic.purchase_ticket, self.original)
+        metrics.disable()
+        self.assertIs(logic.purchase_ticket, self.original)
+        self.assertFalse(metrics.enabled)
+
+class TestSharedStorage(unittest.TestCase):
+    # two Storage objects on one directory stand in for two kiosk processes
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="greenwave-shared-")
+        self.a = Storage(self.data_dir, compact_interval=None, shared=True)
+        self.b = Storage(self.data_dir, compact_interval=None, shared=True)
+
+    def tearDown(self):
+        self.a.close()
+        self.b.close()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def as_process(self, s):
+        return mock.patch.object(src.storage, "storage", s)
+
+    def test_commits_reach_the_other_process(self):
+        with self.as_process(self.a):
+            att = logic.create_account("Kiosk A", "kiosk@example.com", "pw")
+            logic.purchase_ticket(att.user_id, "AllAccess")
+        self.b.refresh()
+        self.assertEqual(self.b.find_attendee_by_email("KIOSK@example.com").user_id, att.user_id)
+        self.assertEqual(self.b.sales.total, 150.0)
+        with self.as_process(self.b), self.assertRaises(ValueError):
+            logic.create_account("Kiosk B", "kiosk@example.com", "pw")
+
+    def test_seat_updates_merge_or_reject(self):
+        with self.as_process(self.a):
+            self.a.update_workshop(Workshop("WSX", "Tiny", "EX1", capacity=2, start_time=datetime.now()))
+            users = [logic.create_account(f"Seat {i}", f"seat{i}@example.com", "pw") for i in range(3)]
+            tickets = [logic.purchase_ticket(u.user_id, "AllAccess")[0] for u in users]
+        self.b.refresh()
+        stale = self.b.workshops["WSX"]
+        with self.as_process(self.a):
+            first = logic.reserve_workshop(users[0].user_id, tickets[0].ticket_id, "WSX")
+        with self.as_process(self.b):
+            second = logic.reserve_workshop(users[1].user_id, tickets[1].ticket_id, "WSX")
+            with self.assertRaises(OverflowError):
+                logic.reserve_workshop(users[2].user_id, tickets[2].ticket_id, "WSX")
+        self.assertEqual(stale.attendee_ids, {first.res_id, second.res_id})
+        self.a.refresh()
+        self.assertEqual(self.a.workshops["WSX"].attendee_ids, {first.res_id, second.res_id})
+
+    def test_compaction_by_another_process(self):
+        with self.as_process(self.a):
+            att = logic.create_account("Compact", "compact@example.com", "pw")
+        self.b.refresh()
+        held = self.b.attendees[att.user_id]
+        self.a.compact()
+        with self.as_process(self.a):
+            logic.purchase_ticket(att.user_id, "AllAccess")
+        self.b.refresh()
+        self.assertIs(self.b.attendees[att.user_id], held)
+        self.assertEqual(len(held.tickets), 1)
+        self.assertEqual(self.b.sales.total, 150.0)
+
+    def test_concurrent_processes_lose_no_writes(self):
+        script = ("import sys\n"
+                  "from src import logic, storage\n"
+                  "for i in range(20):\n"
+                  "    logic.create_account('P', f'p{sys.argv[1]}-{i}@example.com', 'pw')\n"
+                  "storage.storage.close()\n")
+        env = dict(os.environ, GREENWAVE_DATA_DIR=self.data_dir, GREENWAVE_SHARED="1", GREENWAVE_BACKEND="pickle")
+        root = os.path.join(os.path.dirname(__file__), "..")
+        procs = [subprocess.Popen([sys.executable, "-c", script, str(n)], cwd=root, env=env) for n in range(2)]
+        self.assertEqual([p.wait() for p in procs], [0, 0])
+        self.a.refresh()
+        self.assertEqual(sum(1 for a in self.a.attendees.values() if a.email.startswith("p")), 40)
+        self.assertEqual(len(self.a.workshops), 9)
+
+    def test_sqlite_refreshes_cached_objects(self):
+        path = os.path.join(self.data_dir, "shared.db")
+        a = SqliteStorage(path=path, shared=True)
+        b = SqliteStorage(path=path, shared=True)
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+        held = b.workshops["WS11"]
+        with self.as_process(a):
+            u = logic.create_account("Sqlite Kiosk", "sqlkiosk@example.com", "pw")
+            t, _ = logic.purchase_ticket(u.user_id, "AllAccess")
+            res = logic.reserve_workshop(u.user_id, t.ticket_id, "WS11")
+        b.refresh()
+        self.assertIn(res.res_id, held.attendee_ids)
+        self.assertEqual(b.sales.total, 150.0)
+
+class TestBulkOperations(StorageTestCase):
+    prefix = "greenwave-bulk-"
+
+    def setUp(self):
+        super().setUp()
+        self.users = [logic.create_account(f"Delegate {i}", f"delegate{i}@example.com", "pw") for i in range(4)]
+
+    def test_group_purchase_writes_one_payment(self):
+        orders = [(u.user_id, "AllAccess") for u in self.users[:3]] + [(self.users[3].user_id, "Exhibition", ["EX2"])]
+        with mock.patch.object(self.storage, "_persist", wraps=self.storage._persist) as persist:
+            tickets, payments = logic.purchase_tickets_bulk(orders, group_payment=True)
+        self.assertEqual(persist.call_count, 1)
+        self.assertEqual(len(tickets), 4)
+        self.assertEqual(len(payments), 1)
+        self.assertEqual(payments[0].amount, 500.0)
+        self.assertEqual(payments[0].ticket_ids, [t.ticket_id for t in tickets])
+        self.assertEqual(self.storage.sales.by_type, {"AllAccess": 450.0, "ExhibitionPass": 50.0})
+        self.assertEqual(self.users[3].purchase_history, [payments[0].pay_id])
+
+    def test_invalid_order_writes_nothing(self):
+        with self.assertRaises(ValueError):
+            logic.purchase_tickets_bulk([(self.users[0].user_id, "AllAccess"), ("nobody", "AllAccess")])
+        self.assertEqual(self.users[0].tickets, [])
+        self.assertEqual(len(self.storage.payments), 0)
+
+    def test_reservations_are_all_or_nothing(self):
+        tickets, _ = logic.purchase_tickets_bulk([(u.user_id, "AllAccess") for u in self.users])
+        self.storage.update_workshop(Workshop("WSB", "Small", "EX1", capacity=3, start_time=datetime.now()))
+        big = [(u.user_id, t.ticket_id, ws) for u, t in zip(self.users, tickets) for ws in ("WS11", "WSB")]
+        with self.assertRaises(OverflowError):
+            logic.reserve_workshops_bulk(big)
+        self.assertEqual(self.storage.workshops["WS11"].attendee_ids, set())
+        self.assertEqual(len(self.storage.reservations), 0)
+        reservations = logic.reserve_workshops_bulk(big[:6])
+        self.assertEqual(len(self.storage.workshops["WSB"].attendee_ids), 3)
+        self.assertEqual(len(self.users[0].reservations), 2)
+        self.assertEqual({r.res_id for r in reservations}, set(self.storage.reservations))
+
+class TestImporter(StorageTestCase):
+    prefix = "greenwave-import-"
+
+    def setUp(self):
+        super().setUp()
+        logic.create_account("Existing", "existing@example.com", "pw")
+
+    def write(self, name, text):
+        path = os.path.join(self.data_dir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_csv_import_validates_and_deduplicates(self):
+        path = self.write("reg.csv", "name,email,password\n"
+                                     "Ann,ann@example.com,a1\n"
+                                     "Bob,bob@example.com,b1\n"
+                                     "Ann Again,ANN@example.com,a2\n"
+                                     "Old,existing@example.com,x\n"
+                                     "Bad,not-an-email,x\n"
+                                     "Carl,carl@example.com,\n"
+                                     "Dora,dora@example.com,d1\n")
+        rejected, progress = [], []
+        report = import_attendees(path, chunk_size=2, on_reject=lambda *r: rejected.append(r),
+                                  on_progress=lambda r: progress.append(r.read))
+        self.assertEqual((report.read, report.imported, report.rejected), (7, 3, 4))
+        self.assertEqual([r[0] for r in rejected], [4, 5, 6, 7])
+        self.assertEqual(progress, [2, 4, 6, 7])
+        self.assertTrue(self.storage.find_attendee_by_email("dora@example.com").check_password("d1"))
+        self.assertEqual(self.storage.find_attendee_by_email("ann@example.com").name, "Ann")
+
+    def test_jsonl_import_with_worker_pool(self):
+        path = self.write("reg.jsonl", '{"name": "Eve", "email": "eve@example.com", "password": "e1"}\n'
+                                       "{broken\n"
+                                       '["not", "an", "object"]\n'
+                                       '{"name": "Finn", "email": "finn@example.com", "password": "f1"}\n')
+        report = import_attendees(path, workers=2)
+        self.assertEqual((report.imported, report.rejected), (2, 2))
+        self.assertTrue(self.storage.find_attendee_by_email("finn@example.com").check_password("f1"))
+
+class TestExport(StorageTestCase):
+    prefix = "greenwave-export-"
+
+    def setUp(self):
+        super().setUp()
+        self.users = [logic.create_account(f"Export {i}", f"export{i}@example.com", "pw") for i in range(5)]
+        self.tickets = [logic.purchase_ticket(u.user_id, "Exhibition", selected_ex_ids=["EX2"])[0] for u in self.users]
+        self.res = [logic.reserve_workshop(u.user_id, t.ticket_id, "WS21") for u, t in zip(self.users, self.tickets)]
+        logic.cancel_reservation(self.res[1].res_id)
+
+    def read_csv(self, path):
+        import csv
+        with open(path, newline="") as f:
+            return list(csv.DictReader(f))
+
+    def test_payments_are_joined_and_filtered(self):
+        path = os.path.join(self.data_dir, "payments.csv")
+        self.assertEqual(export.export("payments", path), 5)
+        rows = self.read_csv(path)
+        self.assertEqual(rows[0]["attendee_name"], "Export 0")
+        self.assertEqual(rows[0]["ticket_type"], "ExhibitionPass")
+        self.assertEqual(export.export("payments", path, ex_id="EX1"), 0)
+        self.assertEqual(export.export("payments", path, since="1999-01-01", until=datetime.now().date()), 5)
+
+    def test_cancelled_reservations_as_jsonl(self):
+        path = os.path.join(self.data_dir, "cancelled.jsonl")
+        self.assertEqual(export.export("reservations", path, status="CANCELLED"), 1)
+        with open(path) as f:
+            row = json.loads(f.read())
+        self.assertEqual(row["res_id"], self.res[1].res_id)
+        self.assertEqual(row["workshop_title"], self.storage.workshops["WS21"].title)
+
+    def test_interrupted_export_resumes_from_cursor(self):
+        path = os.path.join(self.data_dir, "tickets.csv")
+        full = os.path.join(self.data_dir, "full.csv")
+        export.export("tickets", full)
+        original = export.export_rows
+
+        def failing(*args, **kwargs):
+            for n, item in enumerate(original(*args, **kwargs)):
+                if n == 3:
+                    raise KeyboardInterrupt
+                yield item
+
+        with mock.patch.object(export, "export_rows", failing), self.assertRaises(KeyboardInterrupt):
+            export.export("tickets", path, checkpoint_every=2)
+        self.assertTrue(os.path.exists(path + ".cursor"))
+        self.assertEqual(export.export("tickets", path, resume=True, checkpoint_every=2), 3)
+        self.assertFalse(os.path.exists(path + ".cursor"))
+        self.assertEqual(self.read_csv(path), self.read_csv(full))
+
+    def test_cli_reads_without_writing(self):
+        journal = os.path.join(self.data_dir, "journal.log")
+        size = os.path.getsize(journal)
+        self.assertGreater(size, 0)
+        path = os.path.join(self.data_dir, "tickets.csv")
+        with mock.patch("builtins.print"):
+            export.main(["tickets", path, "--data-dir", self.data_dir, "--backend", "pickle"])
+        self.assertEqual(len(self.read_csv(path)), 5)
+        self.assertEqual(os.path.getsize(journal), size)  # not compacted on close
+        empty = tempfile.mkdtemp(prefix=self.prefix)
+        self.addCleanup(shutil.rmtree, empty, True)
+        with self.assertRaises(FileNotFoundError):
+            export.main(["tickets", path, "--data-dir", empty, "--backend", "pickle"])
+        self.assertEqual(os.listdir(empty), [])
+
+class TestPaging(unittest.TestCase):
+    def setUp(self):
+        self.table = {f"K{i:03d}": (f"K{i:03d}", f"name {i % 7}", i % 5) for i in range(120)}
+
+    def test_default_order_reads_only_one_page(self):
+        seen = []
+        def items():
+            for item in self.table.items():
+                seen.append(item[0])
+                yield item
+        source = table_source(self.table, lambda row: row)
+        source.items = items
+        page = source.page(1, 25)
+        self.assertEqual([k for k, _ in page], [f"K{i:03d}" for i in range(25, 50)])
+        self.assertEqual(len(seen), 50)
+        self.assertEqual(source.count(), 120)
+
+    def test_sort_and_filter(self):
+        source = table_source(self.table, lambda row: row)
+        source.sort_by(2)
+        self.assertEqual([row[2] for _, row in source.page(0, 30)], [0] * 24 + [1] * 6)
+        source.sort_by(2)
+        self.assertEqual(source.page(0, 1)[0][1][2], 4)
+        source.set_filter("NAME 3")
+        self.assertEqual(source.count(), 17)
+        self.assertTrue(all(row[1] == "name 3" for _, row in source.page(0, 50)))
+
+    def test_subset_and_dict_sources(self):
+        source = table_source(self.table, lambda row: row, keys=["K005", "gone", "K001"])
+        self.assertEqual([k for k, _ in source.page(0, 10)], ["K005", "K001"])
+        sales = dict_source(lambda: {"2026-01-02": 5.0, "2026-01-01": 7.5})
+        sales.sort_by(0)
+        self.assertEqual([row for _, row in sales.page(0, 10)], [("2026-01-01", 7.5), ("2026-01-02", 5.0)])
+
+class TestWaitlist(StorageTestCase):
+    prefix = "greenwave-waitlist-"
+
+    def setUp(self):
+        super().setUp()
+        self.storage.update_workshop(Workshop("WSX", "Tiny", "EX1", capacity=1, start_time=datetime.now()))
+
+    def attendee(self, i, ticket_type):
+        att = logic.create_account(f"Queue {i}", f"queue{i}@example.com", "pw")
+        ticket, _ = logic.purchase_ticket(att.user_id, ticket_type, selected_ex_ids=["EX1"])
+        return att, ticket
+
+    def test_priority_then_fifo_promotion(self):
+        holder, ticket = self.attendee(0, "AllAccess")
+        first = logic.reserve_workshop(holder.user_id, ticket.ticket_id, "WSX")
+        waiting = []
+        for i, kind in enumerate(["Exhibition", "Exhibition", "AllAccess"], start=1):
+            att, ticket = self.attendee(i, kind)
+            with self.assertRaises(OverflowError):
+                logic.reserve_workshop(att.user_id, ticket.ticket_id, "WSX")
+            waiting.append(logic.join_waitlist(att.user_id, ticket.ticket_id, "WSX"))
+        self.assertEqual([r.status for r in waiting], ["WAITLISTED"] * 3)
+        with self.assertRaises(ValueError):
+            logic.join_waitlist(waiting[0].attendee_id, waiting[0].ticket_id, "WSX")
+        self.assertEqual(self.storage.waitlist.waiting("WSX"), [waiting[2], waiting[0], waiting[1]])
+        logic.cancel_reservation(waiting[0].res_id)  # leaving the queue frees no seat
+        self.assertEqual(self.storage.workshops["WSX"].attendee_ids, {first.res_id})
+        logic.cancel_reservation(first.res_id)
+        self.assertEqual(waiting[2].status, "CONFIRMED")
+        self.assertEqual(self.storage.workshops["WSX"].attendee_ids, {waiting[2].res_id})
+        logic.cancel_reservation(waiting[2].res_id)
+        self.assertEqual(waiting[1].status, "CONFIRMED")
+        self.assertEqual(self.storage.waitlist.waiting("WSX"), [])
+
+    def test_waitlist_survives_restart(self):
+        holder, ticket = self.attendee(0, "Exhibition")
+        seat = logic.reserve_workshop(holder.user_id, ticket.ticket_id, "WSX")
+        queued = [logic.join_waitlist(att.user_id, t.ticket_id, "WSX")
+                  for att, t in (self.attendee(i, "Exhibition") for i in range(1, 4))]
+        self.storage.close()
+        self.storage = Storage(self.data_dir, compact_interval=None)
+        with mock.patch.object(src.storage, "storage", self.storage):
+            self.assertEqual([r.res_id for r in self.storage.waitlist.waiting("WSX")], [r.res_id for r in queued])
+            logic.cancel_reservation(seat.res_id)
+            self.assertEqual(self.storage.reservations[queued[0].res_id].status, "CONFIRMED")
+
+    def test_cancel_storm_pops_without_rescanning(self):
+        ws = self.storage.workshops["WSX"]
+        ws.capacity = 20
+        self.storage.update_workshop(ws)
+        seated = [logic.reserve_workshop(att.user_id, t.ticket_id, "WSX")
+                  for att, t in (self.attendee(i, "Exhibition") for i in range(20))]
+        queued = [logic.join_waitlist(att.user_id, t.ticket_id, "WSX")
+                  for att, t in (self.attendee(i, "Exhibition") for i in range(20, 50))]
+        with mock.patch.object(self.storage, "reservations_for_workshop",
+                               wraps=self.storage.reservations_for_workshop) as scan:
+            for res in seated:
+                logic.cancel_reservation(res.res_id)
+        self.assertEqual(scan.call_count, 0)
+        self.assertEqual([r.status for r in queued], ["CONFIRMED"] * 20 + ["WAITLISTED"] * 10)
+
+class TestSchedule(StorageTestCase):
+    prefix = "greenwave-schedule-"
+
+    def setUp(self):
+        super().setUp()
+        day = datetime.now().replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(days=7)
+        for ws_id, hour, minutes, capacity in (("WSA", 10, 0, 5), ("WSB", 10, 30, 5), ("WSC", 11, 0, 5),
+                                               ("WSD", 12, 0, 1)):
+            self.storage.update_workshop(Workshop(ws_id, ws_id, "EX1", capacity,
+                                                  day.replace(hour=hour, minute=minutes), duration=60))
+        self.att = logic.create_account("Planner", "planner@example.com", "pw")
+        self.ticket, _ = logic.purchase_ticket(self.att.user_id, "AllAccess")
+
+    def reserve(self, ws_id):
+        return logic.reserve_workshop(self.att.user_id, self.ticket.ticket_id, ws_id)
+
+    def test_overlap_is_rejected_and_rolled_back(self):
+        first = self.reserve("WSA")
+        with self.assertRaises(ValueError):
+            self.reserve("WSB")
+        self.assertEqual(self.storage.workshops["WSB"].attendee_ids, set())
+        self.assertEqual(self.att.reservations, [first.res_id])
+        self.reserve("WSC")  # starts when WSA ends
+        logic.cancel_reservation(first.res_id)
+        with self.assertRaises(ValueError):
+            self.reserve("WSB")  # still overlaps WSC
+        self.assertEqual(len(self.att.reservations), 1)
+
+    def test_lengthened_workshop_still_blocks_later_slots(self):
+        day = self.storage.workshops["WSA"].start_time + timedelta(days=1)
+        for ws_id, hour, minutes in (("WSP", 10, 0), ("WSQ", 11, 0), ("WSR", 13, 0), ("WSS", 12, 0)):
+            self.storage.update_workshop(Workshop(ws_id, ws_id, "EX1", 5, day.replace(hour=hour, minute=minutes),
+                                                  duration=30 if ws_id == "WSS" else 60))
+        for ws_id in ("WSP", "WSQ", "WSR"):
+            self.reserve(ws_id)
+        ws = self.storage.workshops["WSP"]
+        ws.duration = 150  # now runs until 12:30, over WSQ and into WSS
+        self.storage.update_workshop(ws)
+        with self.assertRaises(ValueError):
+            self.reserve("WSS")
+        self.assertEqual(self.storage.schedule.conflict(self.att.user_id, self.storage.workshops["WSS"]),
+                         ws.attendee_ids.copy().pop())
+
+    def test_waiting_place_holds_its_slot(self):
+        other = logic.create_account("Early", "early@example.com", "pw")
+        ticket, _ = logic.purchase_ticket(other.user_id, "AllAccess")
+        logic.reserve_workshop(other.user_id, ticket.ticket_id, "WSD")
+        logic.join_waitlist(self.att.user_id, self.ticket.ticket_id, "WSD")
+        self.storage.update_workshop(Workshop("WSE", "WSE", "EX1", 5, self.storage.workshops["WSD"].start_time))
+        with self.assertRaises(ValueError):
+            self.reserve("WSE")
+
+    def test_suggestions_skip_conflicts_and_full_workshops(self):
+        self.reserve("WSA")
+        self.storage.workshops["WSD"].attendee_ids.add("RFULL")
+        suggested = [ws.ws_id for ws in logic.suggest_workshops(self.att.user_id, ex_id="EX1", limit=50)]
+        self.assertIn("WSC", suggested)
+        self.assertNotIn("WSA", suggested)
+        self.assertNotIn("WSB", suggested)
+        self.assertNotIn("WSD", suggested)
+
+    def test_suggestions_follow_the_pass_in_start_order(self):
+        att = logic.create_account("Browser", "browser@example.com", "pw")
+        logic.purchase_ticket(att.user_id, "Exhibition", selected_ex_ids=["EX1", "EX2"])
+        suggested = logic.suggest_workshops(att.user_id, limit=50)
+        self.assertEqual({ws.ex_id for ws in suggested}, {"EX1", "EX2"})
+        starts = [ws.start_time for ws in suggested]
+        self.assertEqual(starts, sorted(starts))
+        self.assertEqual(logic.suggest_workshops(att.user_id, limit=3), suggested[:3])
+        self.assertEqual(logic.suggest_workshops(att.user_id, ex_id="EX3"), [])
+
+    def test_rescheduled_workshop_refreshes_itineraries(self):
+        res = self.reserve("WSA")
+        wsc = self.storage.workshops["WSC"]
+        self.assertIsNone(self.storage.schedule.conflict(self.att.user_id, wsc))
+        moved = self.storage.workshops["WSA"]
+        moved.start_time = wsc.start_time + timedelta(minutes=30)
+        self.storage.update_workshop(moved)
+        self.assertEqual(self.storage.schedule.conflict(self.att.user_id, wsc), res.res_id)
+
+class TestCatalog(StorageTestCase):
+    prefix = "greenwave-catalog-"
+
+    def setUp(self):
+        super().setUp()
+        self.day = datetime(2026, 11, 2, 8, 0)
+        topics = ("Carbon markets", "Solar carbon capture", "Community gardens", "Policy drafting")
+        with self.storage.transaction():
+            for i in range(120):
+                self.storage.update_workshop(Workshop(f"WC{i:03d}", f"{topics[i % 4]} {i}", f"EX{i % 3 + 1}",
+                                                      capacity=i % 9, start_time=self.day + timedelta(hours=i)))
+
+    def brute_force(self, words, ex_id, after, before, min_free):
+        found = [ws for ws in self.storage.workshops.values()
+                 if ws.ex_id == ex_id and after <= ws.start_time < before and ws.available_spots() >= min_free
+                 and all(any(t.startswith(w) for t in ws.title.lower().split()) for w in words)]
+        return [ws.ws_id for ws in sorted(found, key=lambda ws: (ws.start_time, ws.ws_id))]
+
+    def test_matches_a_full_scan(self):
+        query = dict(ex_id="EX2", starts_after=self.day + timedelta(hours=12), starts_before=self.day + timedelta(days=4))
+        for words, min_free in (([], 0), (["carb"], 0), (["carbon"], 5), (["solar", "capture"], 1)):
+            ids = self.storage.catalog.match(text=" ".join(words), min_free=min_free, **query)
+            self.assertEqual(ids, self.brute_force(words, min_free=min_free,
+                                                   after=query["starts_after"], before=query["starts_before"],
+                                                   ex_id="EX2"))
+        total, page = self.storage.catalog.search(page=1, size=5, text="carbon")
+        self.assertEqual(total, 60)
+        self.assertEqual([ws.ws_id for ws in page], self.storage.catalog.match(text="carbon")[5:10])
+
+    def test_free_seats_follow_reservations(self):
+        ws = self.storage.workshops["WC008"]  # capacity 8
+        att = logic.create_account("Seeker", "seeker@example.com", "pw")
+        ticket, _ = logic.purchase_ticket(att.user_id, "AllAccess")
+        self.assertIn("WC008", self.storage.catalog.match(min_free=8))
+        res = logic.reserve_workshop(att.user_id, ticket.ticket_id, ws.ws_id)
+        self.assertNotIn("WC008", self.storage.catalog.match(min_free=8))
+        with self.assertRaises(RuntimeError), self.storage.transaction():
+            logic.cancel_reservation(res.res_id)
+            raise RuntimeError("undo")
+        self.assertNotIn("WC008", self.storage.catalog.match(min_free=8))
+        logic.cancel_reservation(res.res_id)
+        self.assertIn("WC008", self.storage.catalog.match(min_free=8))
+        ws.title = "Renamed session"
+        self.storage.update_workshop(ws)
+        self.assertEqual(self.storage.catalog.match(text="renamed"), ["WC008"])
+
+class TestPaymentPipeline(StorageTestCase):
+    prefix = "greenwave-payments-"
+
+    def setUp(self):
+        super().setUp()
+        self.users = [logic.create_account(f"Payer {i}", f"payer{i}@example.com", "pw") for i in range(40)]
+
+    def tearDown(self):
+        gateway.stop_pipeline(timeout=5)
+        super().tearDown()
+
+    def start(self, concurrency=8, retries=3, backoff=0.05, **fake):
+        fake.setdefault("latency", 0.01)
+        fake.setdefault("seed", 7)
+        return gateway.start_pipeline(gateway.FakeGateway(**fake), concurrency=concurrency, retries=retries,
+                                      backoff=backoff, batch_interval=0.02)
+
+    def test_purchase_returns_pending_then_settles(self):
+        pipeline = self.start()
+        ticket, payment = logic.purchase_ticket(self.users[0].user_id, "AllAccess")
+        self.assertEqual(payment.status, "PENDING")
+        self.assertTrue(pipeline.wait_idle(5))
+        self.assertEqual(payment.status, "SETTLED")
+        self.assertIn(payment.pay_id, pipeline.gateway.settled)
+        self.assertIsNotNone(payment.auth_ref)
+        self.assertEqual(self.storage.sales.total, 150.0)
+        reopened = Storage(self.data_dir, compact_interval=None)
+        self.assertEqual(reopened.payments[payment.pay_id].status, "SETTLED")
+        reopened.close()
+
+    def test_declined_payment_fails_and_leaves_the_ledger(self):
+        pipeline = self.start(decline_rate=1.0)
+        seen = []
+        self.storage.events.subscribe(PaymentStatusChanged, seen.append)
+        ledger = self.storage.sales
+        _, payment = logic.purchase_ticket(self.users[0].user_id, "AllAccess")
+        self.assertEqual(ledger.total, 150.0)
+        self.assertTrue(pipeline.wait_idle(5))
+        self.assertEqual(payment.status, "FAILED")
+        self.assertEqual(ledger.total, 0.0)
+        self.assertEqual(self.storage.sales.count, 0)
+        self.assertEqual([e.obj.status for e in seen], ["FAILED"])
+
+    def test_declined_payment_voids_its_ticket(self):
+        pipeline = self.start(decline_rate=1.0, latency=0.1)
+        att = self.users[0]
+        ticket, payment = logic.purchase_ticket(att.user_id, "AllAccess")
+        res = logic.reserve_workshop(att.user_id, ticket.ticket_id, "WS11")  # booked while still PENDING
+        self.assertTrue(pipeline.wait_idle(5))
+        self.assertEqual(payment.status, "FAILED")
+        self.assertEqual(res.status, "CANCELLED")
+        self.assertNotIn(res.res_id, self.storage.workshops["WS11"].attendee_ids)
+        self.assertEqual(att.tickets, [])
+        with self.assertRaises(PermissionError):
+            logic.reserve_workshop(att.user_id, ticket.ticket_id, "WS12")
+
+    def test_retries_and_slow_gateway_keep_throughput(self):
+        pipeline = self.start(latency=0.2, failure_rate=0.3, concurrency=40, retries=10, backoff=0.01)
+        gate = threading.Event()
+        authorize = pipeline.gateway.authorize
+
+        async def held(payment):
+            while not gate.is_set():
+                await asyncio.sleep(0.005)
+            return await authorize(payment)
+
+        with mock.patch.object(pipeline.gateway, "authorize", held):
+            payments = [logic.purchase_ticket(u.user_id, "AllAccess")[1] for u in self.users]
+            # every purchase returned while the gateway had answered none of them
+            self.assertEqual({p.status for p in payments}, {"PENDING"})
+            gate.set()
+            self.assertTrue(pipeline.wait_idle(10))
+        self.assertEqual({p.status for p in payments}, {"SETTLED"})
+        self.assertGreater(pipeline.stats["retries"], 0)
+        self.assertLess(pipeline.stats["batches"], len(payments) / 4)
+
+    def test_unexpected_authorize_error_is_counted_and_logged(self):
+        pipeline = self.start()
+        with mock.patch.object(pipeline.gateway, "authorize", side_effect=ValueError("bad card data")), \
+                self.assertLogs("src.gateway", "ERROR") as logged:
+            _, payment = logic.purchase_ticket(self.users[0].user_id, "AllAccess")
+            self.assertTrue(pipeline.wait_idle(5))
+        self.assertEqual(payment.status, "PENDING")  # left for the next resume
+        self.assertEqual(pipeline.stats["errors"], 1)
+        self.assertIn(payment.pay_id, logged.output[0])
+
+    def test_rolled_back_purchase_is_not_charged_and_resume_picks_up_pending(self):
+        pipeline = self.start()
+        with self.assertRaises(RuntimeError), self.storage.transaction():
+            logic.purchase_ticket(self.users[0].user_id, "AllAccess")
+            raise RuntimeError("basket abandoned")
+        self.assertTrue(pipeline.wait_idle(5))
+        self.assertEqual(pipeline.gateway.calls, 0)
+        gateway.stop_pipeline(timeout=5)
+        _, inline = logic.purchase_ticket(self.users[1].user_id, "AllAccess")
+        self.assertEqual(inline.status, "SETTLED")  # no pipeline: settled on the spot
+        stuck = Payment("PSTUCK", inline.ticket_id, 10.0, "Card", status="PENDING")
+        self.storage.add_payment(stuck)
+        pipeline = self.start()
+        self.assertTrue(pipeline.wait_idle(5))
+        self.assertEqual(stuck.status, "SETTLED")
+
+class TestSaleQueue(StorageTestCase):
+    prefix = "greenwave-sale-"
+
+    def setUp(self):
+        super().setUp()
+        self.users = [logic.create_account(f"Buyer {i}", f"buyer{i}@example.com", "pw") for i in range(30)]
+
+    def test_fifo_batches(self):
+        sale = SaleQueue(workers=1, batch_size=8)
+        self.addCleanup(sale.close)
+        with sale._cond:  # let the whole burst arrive before the worker looks
+            handles = [sale.purchase(u.user_id, "AllAccess") for u in self.users]
+            self.assertEqual([h.position() for h in handles[:3]], [1, 2, 3])
+        tickets = [h.result(timeout=5)[0] for h in handles]
+        self.assertEqual([t.owner_id for t in tickets], [u.user_id for u in self.users])
+        finished = [h.finished_at for h in handles]
+        self.assertEqual(finished, sorted(finished))
+        self.assertEqual(sale.stats["batches"], 4)
+        self.assertEqual(self.storage.sales.total, 150.0 * len(self.users))
+
+    def test_deduplication_and_load_shedding(self):
+        sale = SaleQueue(capacity=3, workers=0)
+        first = sale.purchase(self.users[0].user_id, "AllAccess")
+        self.assertIs(sale.purchase(self.users[0].user_id, "AllAccess"), first)
+        with self.assertRaises(ValueError):
+            sale.purchase(self.users[0].user_id, "Exhibition", ["EX1"])
+        sale.purchase(self.users[1].user_id, "AllAccess")
+        third = sale.purchase(self.users[2].user_id, "AllAccess")
+        with self.assertRaises(QueueFull):
+            sale.purchase(self.users[3].user_id, "AllAccess")
+        self.assertEqual((third.position(), third.eta()), (3, None))
+        self.assertEqual((sale.stats["admitted"], sale.stats["deduplicated"], sale.stats["shed"]), (3, 1, 1))
+
+    def test_failing_request_does_not_sink_its_batch(self):
+        self.storage.update_workshop(Workshop("WSX", "Hot", "EX1", capacity=1, start_time=datetime.now()))
+        tickets = [logic.purchase_ticket(u.user_id, "AllAccess")[0] for u in self.users[:3]]
+        sale = SaleQueue(workers=1, batch_size=10)
+        self.addCleanup(sale.close)
+        with mock.patch.object(self.storage.journal, "append", wraps=self.storage.journal.append) as append:
+            with sale._cond:
+                handles = [sale.reserve(t.owner_id, t.ticket_id, "WSX") for t in tickets]
+                bogus = sale.purchase("nobody", "AllAccess")
+            self.assertEqual(handles[0].result(timeout=5).ws_id, "WSX")
+        self.assertEqual((append.call_count, sale.stats["batches"]), (1, 1))  # failures did not split the batch
+        for h in handles[1:]:
+            with self.assertRaises(OverflowError):
+                h.result(timeout=5)
+        with self.assertRaises(ValueError):
+            bogus.result(timeout=5)
+        self.assertEqual(len(self.storage.workshops["WSX"].attendee_ids), 1)
+        self.assertEqual((sale.stats["served"], sale.stats["failed"]), (1, 3))
+
+class TestEvents(StorageTestCase):
+    prefix = "greenwave-events-"
+
+    def setUp(self):
+        super().setUp()
+        self.att = logic.create_account("Listener", "listener@example.com", "pw")
+        self.events = []
+        self.addCleanup(self.storage.events.subscribe(Event, self.events.append))
+
+    def kinds(self):
+        return {type(e) for e in self.events}
+
+    def test_purchase_reserve_and_cancel(self):
+        ticket, payment = logic.purchase_ticket(self.att.user_id, "AllAccess")
+        self.assertIn(TicketAdded, self.kinds())
+        self.assertEqual([e.key for e in self.events if isinstance(e, PaymentRecorded)], [payment.pay_id])
+        del self.events[:]
+        res = logic.reserve_workshop(self.att.user_id, ticket.ticket_id, "WS11")
+        self.assertTrue({ReservationCreated, WorkshopSeatsChanged} <= self.kinds())
+        self.assertEqual([e.obj.capacity for e in self.events if isinstance(e, WorkshopSeatsChanged)],
+                         [self.storage.workshops["WS11"].capacity])
+        del self.events[:]
+        logic.cancel_reservation(res.res_id)
+        self.assertIn(ReservationCancelled, self.kinds())
+        self.assertNotIn(ReservationCreated, self.kinds())
+        del self.events[:]
+        self.storage.upgrade_ticket(ticket.ticket_id, "EX9", extra_price=0.0)
+        self.assertIn(TicketChanged, self.kinds())
+
+    def test_rolled_back_transaction_publishes_nothing(self):
+        with self.assertRaises(RuntimeError):
+            with self.storage.transaction():
+                logic.purchase_ticket(self.att.user_id, "AllAccess")
+                raise RuntimeError("payment declined")
+        self.assertEqual(self.events, [])
+
+    def test_changes_from_another_process(self):
+        shared_dir = tempfile.mkdtemp(prefix="greenwave-events-shared-")
+        a = Storage(shared_dir, compact_interval=None, shared=True)
+        b = Storage(shared_dir, compact_interval=None, shared=True)
+        try:
+            seen = []
+            b.events.subscribe(TicketAdded, seen.append)
+            with mock.patch.object(src.storage, "storage", a):
+                att = logic.create_account("Other Kiosk", "other@example.com", "pw")
+                ticket, _ = logic.purchase_ticket(att.user_id, "AllAccess")
+            self.assertEqual(seen, [])
+            b.refresh()
+            self.assertEqual([e.key for e in seen], [ticket.ticket_id])
+        finally:
+            a.close()
+            b.close()
+            shutil.rmtree(shared_dir, ignore_errors=True)
+
 if __name__ == "__main__":
     unittest.main()